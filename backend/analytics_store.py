@@ -0,0 +1,430 @@
+"""
+Columnar copy of the transaction history for ad-hoc analytics.
+
+Transactions are exported to uncompressed Arrow IPC files, one partition per month
+(ANALYTICS_DIR/transactions/month=YYYY-MM/part-0.arrow), and queried with pyarrow's
+vectorized filters and hash aggregation instead of SQL over the row store. The files
+are memory-mapped, so a scan reads columns straight from the page cache without
+decoding, and text columns are dictionary-encoded to keep them small. Month, quarter
+and year buckets are constant within a partition and cost nothing to compute.
+Amount metrics are summed over base_amount, in the base currency, and can be
+reported in another currency at today's rate.
+
+A month is re-exported only when its change counter in transaction_month_versions
+moves, so a sync after an import, a rekey or a recategorized subscription rewrites
+just the months it touched.
+
+pyarrow is optional: without it everything else works and sync()/query() raise
+AnalyticsUnavailable.
+
+Usage:
+    python analytics_store.py sync           # export the months that changed since the last sync
+    python analytics_store.py export         # re-export every month
+    python analytics_store.py bench [rows]   # time typical queries over synthetic data
+"""
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import date
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+ANALYTICS_DIR = os.environ.get("ANALYTICS_DIR", "./analytics")
+
+# Columns that can be grouped and filtered on
+DIMENSIONS = ('merchant', 'merchant_key', 'category_id', 'payment_method_id', 'subscription_id', 'currency', 'is_matched')
+BUCKETS = ('day', 'week', 'month', 'quarter', 'year')
+METRICS = {'total': 'sum', 'count': 'count', 'avg': 'mean', 'min': 'min', 'max': 'max'}
+MAX_ROWS = 10_000
+# Bumped whenever the partition schema changes; a manifest from another version re-exports everything
+STORE_VERSION = 2
+
+# Id dimensions that get a name column in query results: dimension -> (name column, model)
+NAMED_DIMENSIONS = {
+    'category_id': ('category', models.Category),
+    'payment_method_id': ('payment_method', models.PaymentMethod),
+    'subscription_id': ('subscription', models.Subscription),
+}
+
+_sync_lock = threading.Lock()
+
+
+class AnalyticsUnavailable(Exception):
+    """Raised when the columnar store is used without pyarrow installed"""
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def _require():
+    if pa is None:
+        raise AnalyticsUnavailable("Columnar analytics needs pyarrow: pip install -r requirements-analytics.txt")
+
+
+def _schema():
+    text = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.date32()),
+        ('amount', pa.float64()),
+        ('base_amount', pa.float64()),
+        ('currency', text),
+        ('merchant', text),
+        ('merchant_key', text),
+        ('payment_method_id', pa.int64()),
+        ('subscription_id', pa.int64()),
+        ('category_id', pa.int64()),  # Via the matched subscription, as of the export
+        ('is_matched', pa.bool_()),
+    ])
+
+
+def _table_dir(root: str = None) -> str:
+    return os.path.join(root or ANALYTICS_DIR, "transactions")
+
+
+def _partition_path(month: str, root: str = None) -> str:
+    return os.path.join(_table_dir(root), f"month={month}", "part-0.arrow")
+
+
+def _manifest_path(root: str = None) -> str:
+    return os.path.join(root or ANALYTICS_DIR, "manifest.json")
+
+
+def _write_atomic(path: str, write):
+    tmp = os.path.join(os.path.dirname(path), f"_{os.path.basename(path)}.tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def month_signatures(db: Session) -> dict:
+    """
+    'YYYY-MM' -> change counter of every month with transactions. Triggers bump it on
+    any write to one of the month's transactions (imports, rekeys, subscription links,
+    revaluations) and when a subscription they belong to changes category.
+    """
+    rollup = models.MonthlySpendRollup
+    version = models.TransactionMonthVersion
+    months = {f"{year:04d}-{month:02d}" for year, month in db.execute(select(rollup.year, rollup.month).distinct())}
+    versions = dict(db.execute(select(version.month, version.version)).all())
+    return {month: str(versions.get(month, 0)) for month in sorted(months)}
+
+
+def export_month(db: Session, month: str, root: str = None):
+    """Rewrite one month's partition from the transactions table"""
+    start = date(int(month[:4]), int(month[5:7]), 1)
+    trans = models.Transaction
+    sub = models.Subscription
+    rows = db.execute(select(
+        trans.id, trans.date, trans.amount, trans.base_amount, trans.currency, trans.merchant, trans.merchant_key,
+        trans.payment_method_id, trans.subscription_id, sub.category_id, trans.is_matched
+    ).outerjoin(sub, sub.id == trans.subscription_id).where(
+        trans.date >= start, trans.date < start + relativedelta(months=1)
+    )).all()
+
+    schema = _schema()
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    _write_partition(pa.table([_column(values, field.type) for values, field in zip(columns, schema)], schema=schema),
+                     month, root)
+
+
+def _column(values, type_):
+    if pa.types.is_dictionary(type_):
+        return pa.array(values, type=type_.value_type).dictionary_encode().cast(type_)
+    return pa.array(values, type=type_)
+
+
+def _write_partition(table, month: str, root: str = None):
+    path = _partition_path(month, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _write_atomic(path, lambda tmp: feather.write_feather(table, tmp, compression='uncompressed'))
+
+
+def sync(db: Session, full: bool = False, root: str = None) -> list:
+    """Export every month that changed since the last sync (all of them if full). Returns the months written."""
+    _require()
+    with _sync_lock:
+        manifest_path = _manifest_path(root)
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        if manifest.get("version") != STORE_VERSION:
+            full = True
+            shutil.rmtree(_table_dir(root), ignore_errors=True)
+            manifest = {}
+        exported = manifest.get("months", {})
+
+        # Signatures are read before the rows, so a write that lands mid-export shows
+        # up as a changed signature next time rather than being missed
+        current = month_signatures(db)
+        changed = [month for month, signature in sorted(current.items()) if full or exported.get(month) != signature]
+        for month in changed:
+            export_month(db, month, root)
+        for month in set(exported) - set(current):
+            shutil.rmtree(os.path.join(_table_dir(root), f"month={month}"), ignore_errors=True)
+
+        os.makedirs(root or ANALYTICS_DIR, exist_ok=True)
+
+        def write_manifest(path):
+            with open(path, 'w') as f:
+                json.dump({"version": STORE_VERSION, "months": current}, f)
+        _write_atomic(manifest_path, write_manifest)
+        return changed
+
+
+def _filter_values(column: str, values):
+    type_ = _schema().field(column).type
+    if pa.types.is_dictionary(type_):
+        type_ = type_.value_type
+    try:
+        return pa.array(values, type=type_)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+        raise ValueError(f"Invalid values for filter '{column}'")
+
+
+def _is_in(column, value_set):
+    # Dictionary columns are tested once per distinct value, then mapped onto the rows
+    chunks = []
+    for chunk in column.chunks:
+        if pa.types.is_dictionary(chunk.type):
+            chunks.append(pc.take(pc.is_in(chunk.dictionary, value_set=value_set), chunk.indices))
+        else:
+            chunks.append(pc.is_in(chunk, value_set=value_set))
+    return pa.chunked_array(chunks, pa.bool_())
+
+
+def _read_partition(month: str, columns, root: str = None):
+    with pa.memory_map(_partition_path(month, root)) as source:
+        return pa.ipc.open_file(source).read_all().select(columns)
+
+
+def _bucket_column(table, bucket: str, month: str):
+    """The start of each row's day/week/month/quarter/year as a date32 column"""
+    if bucket == 'day':
+        return table['date']
+    if bucket == 'week':
+        # Days since 1970-01-01 (a Thursday) rounded down to the Monday
+        days = pc.cast(table['date'], pa.int32()).to_numpy()
+        return pa.array(days - (days + 3) % 7, pa.int32()).cast(pa.date32())
+
+    start = date(int(month[:4]), int(month[5:7]), 1)
+    if bucket == 'quarter':
+        start = start.replace(month=(start.month - 1) // 3 * 3 + 1)
+    elif bucket == 'year':
+        start = start.replace(month=1)
+    days = (start - date(1970, 1, 1)).days
+    return pa.array(np.full(table.num_rows, days, dtype=np.int32)).cast(pa.date32())
+
+
+def partitions(root: str = None) -> list:
+    """The exported months, oldest first"""
+    if not os.path.isdir(_table_dir(root)):
+        return []
+    return sorted(
+        name[len("month="):] for name in os.listdir(_table_dir(root))
+        if name.startswith("month=") and os.path.exists(os.path.join(_table_dir(root), name, "part-0.arrow"))
+    )
+
+
+def query(
+    group_by=(), bucket: str = None, metrics=('total', 'count'), date_from: date = None, date_to: date = None,
+    filters: dict = None, min_amount: float = None, max_amount: float = None, order_by: str = None,
+    descending: bool = True, limit: int = 1000, root: str = None, names: dict = None, rate: float = 1.0
+) -> dict:
+    """
+    Filter, optionally time-bucket, group and aggregate the exported transactions.
+    Raises ValueError for an invalid request. names maps an id dimension to
+    {id: name} and adds a name column for it to each result row. Amount metrics are
+    in the base currency divided by rate, the base value of the reporting currency.
+    min_amount and max_amount filter on each transaction's own amount.
+    """
+    _require()
+    started = time.perf_counter()
+    group_by = list(group_by)
+    metrics = list(metrics)
+    filters = filters or {}
+
+    unknown = [col for col in group_by + list(filters) if col not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension(s): {', '.join(unknown)}. Use: {', '.join(DIMENSIONS)}")
+    if bucket is not None and bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(BUCKETS)}")
+    if not metrics or any(metric not in METRICS for metric in metrics):
+        raise ValueError(f"metrics must be some of: {', '.join(METRICS)}")
+    keys = (['bucket'] if bucket else []) + group_by
+    if order_by is not None and order_by not in keys + metrics:
+        raise ValueError(f"order_by must be one of: {', '.join(keys + metrics)}")
+    limit = max(1, min(limit, MAX_ROWS))
+    value_sets = {column: _filter_values(column, values) for column, values in filters.items()}
+
+    columns = list(dict.fromkeys(
+        group_by + ['base_amount'] + (['amount'] if min_amount is not None or max_amount is not None else [])
+        + list(filters) + (['date'] if bucket in ('day', 'week') or date_from or date_to else [])
+    ))
+    month_from = f"{date_from:%Y-%m}" if date_from else None
+    month_to = f"{date_to:%Y-%m}" if date_to else None
+
+    tables = []
+    for month in partitions(root):
+        # Months outside the date range are never opened
+        if (month_from and month < month_from) or (month_to and month > month_to):
+            continue
+        table = _read_partition(month, columns, root)
+
+        masks = []
+        if date_from and month == month_from:
+            masks.append(pc.greater_equal(table['date'], pa.scalar(date_from, pa.date32())))
+        if date_to and month == month_to:
+            masks.append(pc.less_equal(table['date'], pa.scalar(date_to, pa.date32())))
+        if min_amount is not None:
+            masks.append(pc.greater_equal(table['amount'], min_amount))
+        if max_amount is not None:
+            masks.append(pc.less_equal(table['amount'], max_amount))
+        for column, value_set in value_sets.items():
+            masks.append(_is_in(table[column], value_set))
+        if masks:
+            mask = masks[0]
+            for other in masks[1:]:
+                mask = pc.and_kleene(mask, other)
+            table = table.filter(mask)
+
+        if bucket:
+            table = table.append_column('bucket', _bucket_column(table, bucket, month))
+        tables.append(table.select(keys + ['base_amount']))
+
+    if tables:
+        table = pa.concat_tables(tables).unify_dictionaries()
+    else:
+        schema = _schema()
+        table = pa.schema(
+            ([pa.field('bucket', pa.date32())] if bucket else []) + [schema.field(col) for col in group_by + ['base_amount']]
+        ).empty_table()
+    matched = table.num_rows
+
+    # Counts include transactions whose currency has no rates yet; amounts can't
+    result = table.group_by(keys).aggregate([
+        ('base_amount', 'count', pc.CountOptions(mode='all')) if metric == 'count' else ('base_amount', METRICS[metric])
+        for metric in metrics
+    ])
+    result = result.rename_columns(
+        [name if name in keys else metrics[[f"base_amount_{METRICS[m]}" for m in metrics].index(name)]
+         for name in result.column_names]
+    )
+    if rate != 1.0:
+        for metric in metrics:
+            if metric != 'count':
+                index = result.column_names.index(metric)
+                result = result.set_column(index, metric, pc.divide(result[metric], rate))
+    order_by = order_by or ('bucket' if bucket else metrics[0])
+    result = result.sort_by([(order_by, 'descending' if descending else 'ascending')]).slice(0, limit)
+
+    rows = result.to_pylist()
+    for column, lookup in (names or {}).items():
+        name_column = NAMED_DIMENSIONS[column][0]
+        for row in rows:
+            row[name_column] = lookup.get(row[column])
+    return {
+        "rows": rows,
+        "row_count": len(rows),
+        "rows_matched": matched,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def dimension_names(db: Session, group_by) -> dict:
+    """{id: name} lookups for every id dimension in group_by, for query(names=...)"""
+    return {
+        column: dict(db.execute(select(model.id, model.name)).all())
+        for column, (_, model) in NAMED_DIMENSIONS.items() if column in group_by
+    }
+
+
+def _bench(row_count: int = 10_000_000):
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    merchants = np.array([f"Merchant {i}" for i in range(2000)], dtype=object)
+    first = date(2016, 1, 1)
+    months = [first + relativedelta(months=i) for i in range(120)]
+    per_month = row_count // len(months)
+
+    with tempfile.TemporaryDirectory() as root:
+        started = time.perf_counter()
+        schema = _schema()
+        for i, month_start in enumerate(months):
+            days = (month_start + relativedelta(months=1) - month_start).days
+            n = per_month
+            subscription = rng.integers(1, 200, n).astype(float)
+            subscription[rng.random(n) < 0.8] = np.nan
+            amount = -np.round(rng.uniform(1, 120, n), 2)
+            table = pa.table({
+                'id': pa.array(np.arange(i * n, (i + 1) * n)),
+                'date': pa.array([month_start + relativedelta(days=int(d)) for d in rng.integers(0, days, 31)],
+                                 pa.date32()).take(pa.array(rng.integers(0, 31, n))),
+                'amount': pa.array(amount),
+                'base_amount': pa.array(amount),
+                'currency': _column(np.full(n, 'GBP', dtype=object), schema.field('currency').type),
+                'merchant': _column(merchants[rng.integers(0, len(merchants), n)], schema.field('merchant').type),
+                'merchant_key': _column(merchants[rng.integers(0, len(merchants), n)], schema.field('merchant_key').type),
+                'payment_method_id': pa.array(rng.integers(1, 6, n)),
+                'subscription_id': pa.array(subscription, pa.int64(), from_pandas=True),
+                'category_id': pa.array(rng.integers(1, 12, n)),
+                'is_matched': pa.array(~np.isnan(subscription)),
+            }, schema=schema)
+            _write_partition(table, f"{month_start:%Y-%m}", root)
+        print(f"wrote {per_month * len(months):,} rows in {len(months)} monthly partitions "
+              f"in {time.perf_counter() - started:.1f} s")
+
+        cases = [
+            ("total by month", dict(bucket='month')),
+            ("top merchants", dict(group_by=['merchant'], limit=20)),
+            ("category by quarter", dict(group_by=['category_id'], bucket='quarter')),
+            ("payment method by week, one year", dict(
+                group_by=['payment_method_id'], bucket='week', date_from=date(2024, 1, 1), date_to=date(2024, 12, 31))),
+            ("one merchant by month", dict(bucket='month', filters={'merchant': ['Merchant 7']},
+                                           metrics=['total', 'count', 'avg'])),
+            ("matched spend by category and year", dict(
+                group_by=['category_id'], bucket='year', filters={'is_matched': [True]})),
+        ]
+        for label, spec in cases:
+            query(root=root, **spec)  # warm the page cache
+            timings = []
+            for _ in range(3):
+                result = query(root=root, **spec)
+                timings.append(result['elapsed_ms'])
+            print(f"{label}: {min(timings):.0f} ms best of 3, {result['rows_matched']:,} rows matched, "
+                  f"{result['row_count']} result rows")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "bench":
+        _require()
+        _bench(*(int(arg) for arg in sys.argv[2:3]))
+    elif command in ("sync", "export"):
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            months = sync(db, full=command == "export")
+            print(f"Exported {len(months)} month(s) to {_table_dir()}")
+        finally:
+            db.close()
+    else:
+        print(__doc__)
+        sys.exit(2)
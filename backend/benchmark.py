@@ -0,0 +1,388 @@
+"""
+Performance benchmarks over synthetic multi-year transaction histories.
+
+generate_transactions() builds a seeded statement: recurring subscriptions with
+configurable billing cycles, day jitter, price rises and cancellations, mixed with
+one-off purchases from a long tail of shops. run() imports it into a throwaway
+database and drives the FastAPI app in-process through a test client, recording
+throughput, p50/p95/p99 latency and peak RSS for each scenario. Results are written
+as JSON; pass baseline= to flag regressions against an earlier run.
+
+Usage:
+    python benchmark.py generate <out.csv> [rows=N years=N subscriptions=N ...]
+    python benchmark.py run [rows=N iterations=N ...] [out=<results.json>] [baseline=<results.json>]
+    python benchmark.py compare <baseline.json> <results.json>
+
+run and compare exit non-zero when a scenario regressed by more than
+BENCH_REGRESSION_PCT percent (default 20).
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+BENCH_RESULTS_DIR = os.environ.get("BENCH_RESULTS_DIR", "./bench-results")
+REGRESSION_PCT = float(os.environ.get("BENCH_REGRESSION_PCT", "20"))
+
+# Differences below these are noise, whatever the percentage
+MIN_LATENCY_DELTA_MS = 1.0
+MIN_RSS_DELTA_MB = 16.0
+
+# Billing cycles a generated subscription can have: name -> (date offset, weight)
+CYCLES = {
+    'weekly': (pd.DateOffset(weeks=1), 0.1),
+    'monthly': (pd.DateOffset(months=1), 0.7),
+    'quarterly': (pd.DateOffset(months=3), 0.1),
+    'yearly': (pd.DateOffset(years=1), 0.1),
+}
+
+# The most recent months are imported one file at a time, like monthly statements
+INCREMENTAL_MONTHS = 3
+
+_SYLLABLES = ['ka', 'lo', 'mi', 'nu', 're', 'sa', 'ti', 'vo', 'ze', 'bra', 'cle', 'dri', 'fli', 'gro', 'pla', 'stu']
+
+
+def _name(index: int) -> str:
+    # Letters only: merchant normalization strips trailing words with digits in them
+    syllables = []
+    while True:
+        index, digit = divmod(index, len(_SYLLABLES))
+        syllables.append(_SYLLABLES[digit])
+        if index == 0:
+            break
+    return ''.join(syllables).capitalize()
+
+
+def generate_transactions(
+    rows: int = 100_000, years: int = 3, subscriptions: int = 150, shops: int = 2000,
+    payment_methods: int = 4, jitter_days: int = 2, cycles=tuple(CYCLES), currencies=('GBP',),
+    end: date = None, seed: int = 0
+) -> pd.DataFrame:
+    """
+    A statement of roughly rows transactions over years of history ending at end
+    (default today), oldest first, in the CSV import format. The same arguments
+    always give the same rows, shifted only by end.
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end or date.today())
+    start = end - pd.DateOffset(years=years)
+    span_days = (end - start).days
+    cards = np.array([f"Card *{1000 + i}" for i in range(payment_methods)], dtype=object)
+    weights = np.array([CYCLES[cycle][1] for cycle in cycles])
+
+    frames = []
+    for i in range(subscriptions):
+        cycle = cycles[rng.choice(len(cycles), p=weights / weights.sum())]
+        first = start + pd.Timedelta(days=int(rng.integers(0, max(1, span_days * 7 // 10))))
+        last = end
+        if rng.random() < 0.2:
+            last = first + pd.Timedelta(days=int(rng.integers(60, span_days + 60)))
+        dates = pd.date_range(first, min(last, end), freq=CYCLES[cycle][0])
+        if len(dates) < 2:
+            continue
+        dates = dates + pd.to_timedelta(rng.integers(-jitter_days, jitter_days + 1, len(dates)), unit='D')
+
+        amount = np.full(len(dates), round(float(rng.uniform(3, 60)), 2))
+        if rng.random() < 0.3:
+            amount[rng.integers(1, len(dates)):] *= 1.1
+        name = f"{_name(i)} {rng.choice(['Plus', 'Online', 'Premium', 'Cloud', 'Media'])}"
+        frames.append(pd.DataFrame({
+            'date': dates,
+            'description': [f"{name.upper()} REF{ref}" for ref in rng.integers(10_000, 99_999, len(dates))],
+            'amount': -np.round(amount, 2),
+            'currency': rng.choice(currencies),
+            'merchant': name,
+            'payment_method': rng.choice(cards),
+        }))
+
+    # One-off purchases: a few shops take most of the spend, as on a real card
+    one_offs = max(0, rows - sum(len(frame) for frame in frames))
+    shop_names = np.array([f"{_name(i + subscriptions)} Store" for i in range(shops)], dtype=object)
+    popularity = 1 / np.arange(1, shops + 1)
+    shop = shop_names[rng.choice(shops, one_offs, p=popularity / popularity.sum())]
+    amount = -np.round(rng.lognormal(2.5, 0.8, one_offs), 2)
+    refunds = rng.random(one_offs) < 0.02
+    amount[refunds] = -amount[refunds]
+    frames.append(pd.DataFrame({
+        'date': start + pd.to_timedelta(rng.integers(0, span_days + 1, one_offs), unit='D'),
+        'description': [f"{name} {ref}" for name, ref in zip(shop, rng.integers(100, 9999, one_offs))],
+        'amount': amount,
+        'currency': rng.choice(currencies, one_offs),
+        'merchant': np.where(rng.random(one_offs) < 0.5, shop, None),
+        'payment_method': rng.choice(cards, one_offs),
+    }))
+
+    frame = pd.concat(frames, ignore_index=True)
+    frame = frame[frame['date'] <= end].sort_values('date', kind='stable', ignore_index=True)
+    frame['date'] = frame['date'].dt.strftime('%Y-%m-%d')
+    return frame
+
+
+def _csv(frame: pd.DataFrame) -> bytes:
+    return frame.to_csv(index=False).encode()
+
+
+def _reset_peak_rss():
+    # Linux can reset the high-water mark; elsewhere peaks accumulate over the run
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(call, iterations: int, units: str = "requests") -> dict:
+    """
+    Run call(i) iterations times. call returns how many units it processed
+    (None counts as one). Returns throughput, latency percentiles and peak RSS.
+    """
+    _reset_peak_rss()
+    timings = []
+    processed = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        mark = time.perf_counter()
+        count = call(i)
+        timings.append((time.perf_counter() - mark) * 1000)
+        processed += 1 if count is None else count
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        "iterations": iterations,
+        "throughput": round(processed / elapsed, 1) if elapsed > 0 else None,
+        "throughput_unit": f"{units}/s",
+        "mean_ms": round(float(np.mean(timings)), 2),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def _check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url}: {response.status_code} {response.text}")
+    return response
+
+
+def run(rows: int = 100_000, iterations: int = 30, seed: int = 0, **generator_options) -> dict:
+    """
+    Import a generated history into a fresh database in a temporary directory and
+    time every scenario. Must run before main is imported anywhere in the process,
+    since the database location is read from DATABASE_URL at import time.
+    """
+    if 'main' in sys.modules:
+        raise RuntimeError("benchmark.run() needs a fresh process: main is already imported")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ["ANALYTICS_DIR"] = os.path.join(workdir, "analytics")
+        os.environ.pop("READ_DATABASE_URL", None)
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+
+        from fastapi.testclient import TestClient
+        import analytics_store
+        import cache
+        import main
+
+        started = time.perf_counter()
+        frame = generate_transactions(rows=rows, seed=seed, **generator_options)
+        months = frame['date'].str[:7]
+        recent = sorted(months.unique())[-INCREMENTAL_MONTHS:]
+        history = _csv(frame[~months.isin(recent)])
+        statements = [frame[months == month] for month in recent]
+        print(f"Generated {len(frame):,} transactions in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+
+        scenarios = {}
+        with TestClient(main.app) as client:
+            def record(name, call, count, units="requests"):
+                scenarios[name] = measure(call, count, units)
+                result = scenarios[name]
+                print(f"{name}: p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+                      f"{result['throughput']} {result['throughput_unit']}", file=sys.stderr)
+                return result
+
+            # Imports: the bulk history, then monthly statements on top of it, where
+            # subscription detection has the whole merchant history to work against
+            stages = {}
+
+            def import_file(name, data):
+                response = _check(client.post(
+                    "/api/transactions/import", params={"stream": "true"},
+                    files={"file": (name, data, "text/csv")}
+                )).json()
+                for stage, seconds in response["timings"].items():
+                    stages[stage] = round(stages.get(stage, 0) + seconds, 3)
+                return response["count"]
+
+            record("import history", lambda i: import_file("history.csv", history), 1, "rows")
+            scenarios["import history"]["stages"] = stages
+            stages = {}
+            record("import monthly statement",
+                   lambda i: import_file(f"statement-{recent[i]}.csv", _csv(statements[i])), len(statements), "rows")
+            scenarios["import monthly statement"]["stages"] = stages
+
+            # Analytics endpoints cache their responses; bump the generation so every
+            # request is computed, plus one scenario for the cached path
+            def get(path, cold=False, **params):
+                def call(i):
+                    if cold:
+                        cache.analytics_cache.bump()
+                    _check(client.get(path, params=params))
+                return call
+
+            record("dashboard", get("/api/analytics/dashboard", cold=True), iterations)
+            record("dashboard (cached)", get("/api/analytics/dashboard"), iterations)
+            record("monthly spend", get("/api/analytics/monthly", cold=True, months=24), iterations)
+            record("yearly spend", get("/api/analytics/yearly", cold=True), iterations)
+            record("spend by payment method", get("/api/analytics/by-payment-method", cold=True), iterations)
+            record("subscriptions", get("/api/subscriptions", limit=100), iterations)
+            record("transactions page", get("/api/transactions", limit=100), iterations)
+            record("transactions filtered", get("/api/transactions", limit=100, is_matched=True, min_amount=-20),
+                   iterations)
+
+            # Each iteration fetches the page after the previous one
+            cursor = {}
+
+            def next_page(i):
+                params = {"limit": 100, **({"cursor": cursor["next"]} if cursor.get("next") else {})}
+                cursor["next"] = _check(client.get("/api/transactions", params=params)).headers.get("x-next-cursor")
+
+            record("transactions cursor walk", next_page, iterations)
+
+            if analytics_store.available():
+                def query(body):
+                    return lambda i: _check(client.post("/api/analytics/query", json=body)) and None
+
+                by_month = {"group_by": ["category_id"], "bucket": "month"}
+                record("analytics store sync", query(by_month), 1)
+                record("analytics query by category and month", query(by_month), iterations)
+                record("analytics query top merchants",
+                       query({"group_by": ["merchant_key"], "order_by": "total", "limit": 20}), iterations)
+
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {"rows": rows, "transactions": len(frame), "iterations": iterations, "seed": seed,
+                   **generator_options},
+        "scenarios": scenarios,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict, current: dict, threshold_pct: float = REGRESSION_PCT) -> list:
+    """
+    Return (scenario, metric, baseline value, current value) for every scenario that
+    got slower at p95, lost throughput or used more memory by more than threshold_pct.
+    """
+    regressions = []
+    limit = 1 + threshold_pct / 100
+    for name, now in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        if now["p95_ms"] > before["p95_ms"] * limit and now["p95_ms"] - before["p95_ms"] > MIN_LATENCY_DELTA_MS:
+            regressions.append((name, "p95_ms", before["p95_ms"], now["p95_ms"]))
+        if before["throughput"] and now["throughput"] and now["throughput"] * limit < before["throughput"]:
+            regressions.append((name, "throughput", before["throughput"], now["throughput"]))
+        if (now["peak_rss_mb"] > before["peak_rss_mb"] * limit
+                and now["peak_rss_mb"] - before["peak_rss_mb"] > MIN_RSS_DELTA_MB):
+            regressions.append((name, "peak_rss_mb", before["peak_rss_mb"], now["peak_rss_mb"]))
+    return regressions
+
+
+def _print_comparison(baseline: dict, current: dict) -> list:
+    for name, now in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            print(f"{name}: new scenario")
+            continue
+        print(f"{name}: p95 {before['p95_ms']} -> {now['p95_ms']} ms, "
+              f"throughput {before['throughput']} -> {now['throughput']} {now['throughput_unit']}, "
+              f"peak RSS {before['peak_rss_mb']} -> {now['peak_rss_mb']} MB")
+    regressions = compare(baseline, current)
+    for name, metric, before, now in regressions:
+        print(f"Regression in {name}: {metric} {before} -> {now}")
+    return regressions
+
+
+def _parse_options(args) -> dict:
+    """key=value command line arguments; numbers become ints or floats, cycles and currencies lists"""
+    options = {}
+    for arg in args:
+        key, _, value = arg.partition("=")
+        if key in ("cycles", "currencies"):
+            options[key] = tuple(value.split(","))
+            continue
+        for convert in (int, float):
+            try:
+                value = convert(value)
+                break
+            except ValueError:
+                pass
+        options[key] = value
+    return options
+
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "generate" and len(sys.argv) > 2:
+        frame = generate_transactions(**_parse_options(sys.argv[3:]))
+        frame.to_csv(sys.argv[2], index=False)
+        print(f"Wrote {len(frame):,} transactions to {sys.argv[2]}")
+    elif command == "run":
+        options = _parse_options(sys.argv[2:])
+        out = options.pop("out", None)
+        baseline = options.pop("baseline", None)
+        results = run(**options)
+        if out is None:
+            os.makedirs(BENCH_RESULTS_DIR, exist_ok=True)
+            out = os.path.join(BENCH_RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+        with open(out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {out}")
+        if baseline:
+            sys.exit(1 if _print_comparison(_load(baseline), results) else 0)
+    elif command == "compare" and len(sys.argv) > 3:
+        sys.exit(1 if _print_comparison(_load(sys.argv[2]), _load(sys.argv[3])) else 0)
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+
+CACHE_TTL = float(os.environ.get("ANALYTICS_CACHE_TTL", "60"))
+CACHE_SIZE = int(os.environ.get("ANALYTICS_CACHE_SIZE", "128"))
+
+
+class ResponseCache:
+    """
+    In-process LRU cache of encoded JSON responses. Entries expire after ttl seconds
+    or as soon as the data generation moves on, whichever comes first.
+    """
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bump(self):
+        """Mark everything cached so far as stale; called whenever data changes"""
+        with self._lock:
+            self.generation += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["generation"] != self.generation or entry["expires"] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, body: bytes, generation: int):
+        entry = {
+            "body": body,
+            "etag": '"' + hashlib.sha1(body).hexdigest() + '"',
+            "generation": generation,
+            "expires": time.monotonic() + self.ttl,
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "generation": self.generation,
+            }
+
+
+analytics_cache = ResponseCache()
+
+
+async def cached_json(request: Request, compute, cache: ResponseCache = analytics_cache):
+    """
+    Serve the result of awaiting compute() through the cache, keyed by path and query
+    string. Answers If-None-Match with a bodyless 304 when the ETag still matches.
+    """
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    entry = cache.get(key)
+    status = "HIT"
+    if entry is None:
+        # Read the generation before computing, so a write that lands mid-compute
+        # leaves this entry already stale rather than serving old data as new
+        generation = cache.generation
+        body = json.dumps(jsonable_encoder(await compute())).encode()
+        entry = cache.set(key, body, generation)
+        status = "MISS"
+
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache", "X-Cache": status}
+    if request.headers.get("if-none-match") == entry["etag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+
+def invalidate_on_commit(session_factory, cache: ResponseCache = analytics_cache):
+    """
+    Bump the cache generation whenever a session from session_factory commits a
+    write, whether through the ORM unit of work or a bulk INSERT/UPDATE/DELETE.
+    """
+
+    @event.listens_for(session_factory, "after_flush")
+    def _flushed(session, flush_context):
+        session.info["data_changed"] = True
+
+    @event.listens_for(session_factory, "do_orm_execute")
+    def _executed(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            orm_execute_state.session.info["data_changed"] = True
+
+    @event.listens_for(session_factory, "after_commit")
+    def _committed(session):
+        if session.info.pop("data_changed", False):
+            cache.bump()
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _rolled_back(session):
+        session.info.pop("data_changed", None)
@@ -1,14 +1,108 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./subscriptions.db"
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./subscriptions.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Optional separate URL for the async read-only sessions. Set DB_READ_POOL=1 to
+# get a read-only pool over the main SQLite file without naming it twice.
+READ_DATABASE_URL = os.environ.get("READ_DATABASE_URL")
+DB_READ_POOL = os.environ.get("DB_READ_POOL", "0") == "1"
+
+# Async driver URL for the read-heavy async handlers; derived from the read URL when unset
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL")
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "cache_size": os.environ.get("SQLITE_CACHE_SIZE", "-65536"),  # Negative means KiB, so 64 MiB
+    "busy_timeout": os.environ.get("SQLITE_BUSY_TIMEOUT", "5000"),  # Milliseconds
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+
+def read_only_url(url: str) -> str:
+    """Turn a sqlite:///path URL into one that opens the same file read-only"""
+    path = url[len("sqlite:///"):]
+    return f"sqlite:///file:{path}?mode=ro&uri=true"
+
+
+def async_url(url: str) -> str:
+    """Swap a sync driver URL for its asyncio equivalent"""
+    for prefix, async_prefix in (("sqlite:", "sqlite+aiosqlite:"), ("postgresql:", "postgresql+asyncpg:")):
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+
+def _engine_kwargs(url: str):
+    pool = dict(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    if not url.startswith("sqlite"):
+        return pool
+
+    kwargs = {"connect_args": {"check_same_thread": False}}
+    # In-memory databases live in a single connection, so they keep SQLAlchemy's default pool
+    if url.split("://", 1)[1] not in ("", "/:memory:"):
+        kwargs.update(pool)
+    return kwargs
+
+
+def _install_sqlite_pragmas(engine, read_only: bool):
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            # journal_mode is a property of the file; a read-only connection can't set it
+            if read_only and name == "journal_mode":
+                continue
+            cursor.execute(f"PRAGMA {name}={value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def create_db_engine(url: str, read_only: bool = False):
+    """Create an engine; SQLite engines get the tuning pragmas on every connection"""
+    engine = create_engine(url, **_engine_kwargs(url))
+    if url.startswith("sqlite"):
+        _install_sqlite_pragmas(engine, read_only)
+    return engine
+
+
+def create_async_db_engine(url: str, read_only: bool = False):
+    """Async counterpart of create_db_engine, for an asyncio driver URL such as sqlite+aiosqlite://"""
+    kwargs = _engine_kwargs(url)
+    if url.startswith("sqlite") and "pool_size" in kwargs:
+        # aiosqlite defaults to NullPool, a fresh connection and thread per checkout
+        kwargs["poolclass"] = AsyncAdaptedQueuePool
+    engine = create_async_engine(url, **kwargs)
+    if url.startswith("sqlite"):
+        # Pool events live on the sync engine the async one wraps
+        _install_sqlite_pragmas(engine.sync_engine, read_only)
+    return engine
+
+
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read-only handlers all run on the async engine, so the read URL only configures it
+if READ_DATABASE_URL or (DB_READ_POOL and SQLALCHEMY_DATABASE_URL.startswith("sqlite:///")):
+    read_url, read_only_pool = READ_DATABASE_URL or read_only_url(SQLALCHEMY_DATABASE_URL), True
+else:
+    read_url, read_only_pool = SQLALCHEMY_DATABASE_URL, False
+
+async_read_engine = create_async_db_engine(ASYNC_DATABASE_URL or async_url(read_url), read_only=read_only_pool)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -18,3 +112,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_read_db():
+    """AsyncSession for read-heavy async handlers; never blocks the event loop on I/O"""
+    async with AsyncReadSessionLocal() as db:
+        yield db
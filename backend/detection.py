@@ -0,0 +1,342 @@
+import json
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, update, delete, func, case, bindparam
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models
+import lookups
+import metrics
+import rollups
+
+# Amounts within this fraction of the merchant's mean count as the same charge
+AMOUNT_TOLERANCE = 0.1
+
+# Charges per merchant whose amounts decide whether it is recurring, so a price
+# change or one odd charge stops counting against it once it is this far back
+RECENT_AMOUNTS = 6
+
+# Max merchants per IN (...) lookup, well under SQLite's bound-parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+
+def classify_billing_cycle(days_diff: pd.Series) -> pd.Series:
+    """Map mean days between charges to a billing cycle name"""
+    return pd.Series(np.select(
+        [
+            days_diff.between(25, 35),
+            days_diff.between(85, 95),
+            days_diff.between(350, 380),
+        ],
+        ["monthly", "quarterly", "yearly"],
+        default="monthly"
+    ), index=days_diff.index)
+
+
+def summarize_batch(transactions: pd.DataFrame) -> pd.DataFrame:
+    """Per-merchant-key count, date range and amount sums for one batch of transactions"""
+    frame = transactions[transactions['merchant_key'].fillna('') != '']
+    if frame.empty:
+        return pd.DataFrame()
+
+    frame = frame.sort_values(['merchant_key', 'date', 'id'])
+    abs_amount = frame['amount'].abs()
+    frame = frame.assign(abs_amount=abs_amount, sq_amount=abs_amount ** 2)
+    summary = frame.groupby('merchant_key', sort=False).agg(
+        merchant=('merchant', 'first'),
+        transaction_count=('id', 'size'),
+        first_date=('date', 'min'),
+        last_date=('date', 'max'),
+        amount_sum=('abs_amount', 'sum'),
+        amount_sq_sum=('sq_amount', 'sum'),
+        currency=('currency', 'first'),
+    )
+
+    recent = frame.groupby('merchant_key', sort=False).tail(RECENT_AMOUNTS)
+    pairs = pd.Series(
+        [[day, float(amount)] for day, amount in
+         zip(pd.to_datetime(recent['date']).dt.strftime('%Y-%m-%d'), recent['abs_amount'])],
+        index=recent.index, dtype=object
+    )
+    summary['recent_amounts'] = pairs.groupby(recent['merchant_key'], sort=False).agg(list)
+    return summary
+
+
+def merge_recent(*windows) -> list:
+    """The RECENT_AMOUNTS latest [date, amount] pairs of several windows, oldest first"""
+    return sorted((list(pair) for window in windows for pair in window), key=lambda pair: pair[0])[-RECENT_AMOUNTS:]
+
+
+def update_merchant_stats(db: Session, transactions: pd.DataFrame) -> list:
+    """
+    Fold a batch of transactions into the running merchant_stats rows; call it in
+    the transaction that inserts them. Counts, sums and dates merge inside the
+    upsert. The window of recent amounts is merged here from the stored one, which
+    is safe because the caller's insert already holds SQLite's write lock, so no
+    other import can change it in between. Returns the merchant keys it touched.
+    """
+    batch = summarize_batch(transactions)
+    if batch.empty:
+        return []
+
+    stats = models.MerchantStats.__table__
+    keys = list(batch.index)
+    stored = {}
+    for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+        stored.update(db.execute(
+            select(stats.c.merchant_key, stats.c.recent_amounts)
+            .where(stats.c.merchant_key.in_(keys[start:start + LOOKUP_BATCH_SIZE]))
+        ).all())
+    windows = {
+        key: merge_recent(json.loads(stored.get(key) or '[]'), window)
+        for key, window in batch['recent_amounts'].items()
+    }
+
+    stmt = insert(stats)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['merchant_key'],
+        set_={
+            'transaction_count': stats.c.transaction_count + stmt.excluded.transaction_count,
+            'amount_sum': stats.c.amount_sum + stmt.excluded.amount_sum,
+            'amount_sq_sum': stats.c.amount_sq_sum + stmt.excluded.amount_sq_sum,
+            'min_amount': stmt.excluded.min_amount,
+            'max_amount': stmt.excluded.max_amount,
+            'recent_amounts': stmt.excluded.recent_amounts,
+            'currency': case(
+                (stmt.excluded.first_date < stats.c.first_date, stmt.excluded.currency),
+                else_=stats.c.currency
+            ),
+            'first_date': func.min(stats.c.first_date, stmt.excluded.first_date),
+            'last_date': func.max(stats.c.last_date, stmt.excluded.last_date),
+            'updated_at': datetime.utcnow(),
+        }
+    )
+    db.execute(stmt, [
+        {
+            'merchant_key': key,
+            'merchant': row.merchant,
+            'transaction_count': int(row.transaction_count),
+            'first_date': row.first_date,
+            'last_date': row.last_date,
+            'amount_sum': float(row.amount_sum),
+            'amount_sq_sum': float(row.amount_sq_sum),
+            'min_amount': min(amount for _, amount in windows[key]),
+            'max_amount': max(amount for _, amount in windows[key]),
+            'recent_amounts': json.dumps(windows[key]),
+            'currency': row.currency,
+            'updated_at': datetime.utcnow(),
+        }
+        for key, row in zip(batch.index, batch.itertuples())
+    ])
+    return keys
+
+
+def merchant_stats(db: Session, keys) -> pd.DataFrame:
+    """
+    The running stats of merchant keys, indexed by key. Each row also carries
+    matched_subscription_id: the subscription that already has the same merchant
+    key, found by an equality join on the unique key index.
+    """
+    stats = models.MerchantStats.__table__
+    keys = list(keys)
+    rows = []
+    for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+        rows.extend(db.execute(
+            select(stats, models.Subscription.id.label('matched_subscription_id')).outerjoin(
+                models.Subscription, models.Subscription.merchant_key == stats.c.merchant_key
+            ).where(stats.c.merchant_key.in_(keys[start:start + LOOKUP_BATCH_SIZE]))
+        ).mappings().all())
+    return pd.DataFrame(rows).set_index('merchant_key') if rows else pd.DataFrame()
+
+
+def classify_merchants(stats: pd.DataFrame) -> pd.DataFrame:
+    """
+    Decide which merchants look recurring from their running stats: 2+ charges,
+    the last RECENT_AMOUNTS amounts all within 10% of their mean. Adds avg_amount
+    (that mean), days_diff and billing_cycle.
+    """
+    recent = stats['recent_amounts'].map(json.loads)
+    stats = stats.assign(avg_amount=recent.map(lambda window: sum(amount for _, amount in window) / len(window)))
+
+    spread = np.maximum(
+        stats['max_amount'] - stats['avg_amount'],
+        stats['avg_amount'] - stats['min_amount']
+    )
+    recurring = (stats['transaction_count'] >= 2) & (spread < AMOUNT_TOLERANCE * stats['avg_amount'])
+    stats = stats[recurring]
+
+    first_date = pd.to_datetime(stats['first_date'])
+    last_date = pd.to_datetime(stats['last_date'])
+    stats = stats.assign(
+        first_date=first_date,
+        last_date=last_date,
+        days_diff=(last_date - first_date).dt.days / (stats['transaction_count'] - 1)
+    )
+    stats['billing_cycle'] = classify_billing_cycle(stats['days_diff'])
+    return stats
+
+
+def rebuild_merchant_stats(db: Session):
+    """Recompute merchant_stats from the full transactions table, for backfill or after a rekey"""
+    trans = models.Transaction
+    stats = models.MerchantStats.__table__
+    abs_amount = func.abs(trans.amount)
+    keyed = (trans.merchant_key.isnot(None), trans.merchant_key != '')
+
+    # Each merchant's latest RECENT_AMOUNTS charges, for the window of recent amounts
+    ranked = select(
+        trans.merchant_key,
+        trans.date,
+        abs_amount.label('amount'),
+        func.row_number().over(
+            partition_by=trans.merchant_key, order_by=(trans.date.desc(), trans.id.desc())
+        ).label('position'),
+    ).where(*keyed).subquery()
+    recent = select(
+        ranked.c.merchant_key,
+        func.json_group_array(func.json_array(ranked.c.date, ranked.c.amount)).label('recent_amounts'),
+        func.min(ranked.c.amount).label('min_amount'),
+        func.max(ranked.c.amount).label('max_amount'),
+    ).where(ranked.c.position <= RECENT_AMOUNTS).group_by(ranked.c.merchant_key).subquery()
+
+    # SQLite fills bare columns from the row that produced min(), so the name and
+    # currency come from the earliest charge
+    source = select(
+        trans.merchant_key,
+        trans.merchant,
+        func.count(trans.id),
+        func.min(trans.date),
+        func.max(trans.date),
+        func.sum(abs_amount),
+        func.sum(abs_amount * abs_amount),
+        recent.c.min_amount,
+        recent.c.max_amount,
+        recent.c.recent_amounts,
+        trans.currency,
+        func.max(trans.subscription_id),
+        func.current_timestamp(),
+    ).join(recent, recent.c.merchant_key == trans.merchant_key).where(*keyed).group_by(
+        trans.merchant_key, recent.c.min_amount, recent.c.max_amount, recent.c.recent_amounts
+    )
+
+    db.execute(delete(stats))
+    db.execute(insert(stats).from_select([
+        'merchant_key', 'merchant', 'transaction_count', 'first_date', 'last_date', 'amount_sum',
+        'amount_sq_sum', 'min_amount', 'max_amount', 'recent_amounts', 'currency', 'subscription_id',
+        'updated_at'
+    ], source))
+    db.commit()
+
+
+def detect_and_create_subscriptions(transactions: pd.DataFrame, db: Session):
+    """
+    Re-classify only the merchants a batch of transactions touched, auto-creating
+    subscriptions for newly recurring ones. The batch must already be folded into
+    merchant stats and rollups, as write_transactions_frame does when it inserts it.
+    transactions needs id, date and merchant_key columns. New subscriptions,
+    transaction links and notifications are written in bulk and committed together.
+    """
+    # Months whose rollup buckets change: those of any transactions that get linked
+    # to a subscription, which moves them to its category
+    touched_months = set()
+
+    with metrics.span("detection.merchant_stats"):
+        keys = transactions['merchant_key'].dropna().unique()
+        touched = merchant_stats(db, [key for key in keys if key])
+    if touched.empty:
+        return []
+
+    # Merchants already known to be subscriptions keep linking their new charges
+    known = touched['subscription_id'].dropna()
+    with metrics.span("detection.classify"):
+        candidates = classify_merchants(touched[touched['subscription_id'].isna()])
+
+    # Newly recurring merchants that already have a subscription with the same key
+    matched_ids = candidates['matched_subscription_id'].astype(object)
+    matched_ids = matched_ids.where(matched_ids.notna(), None)
+    new = candidates[matched_ids.isna()]
+
+    # Resolve categories for every new subscription in one batch; keys have aliases
+    # applied, so rules see "amazon" rather than "AMZN Mktp"
+    with metrics.span("detection.categories"):
+        category_ids = lookups.resolve_categories(db, new.index)
+
+    with metrics.span("detection.create_subscriptions"):
+        new_subscriptions = []
+        if not new.empty:
+            next_billing = new['last_date'] + pd.to_timedelta(new['days_diff'].astype(int), unit='D')
+            # Sorting RETURNING rows by parameter order would make SQLite insert them one
+            # by one, so they are matched back to their merchants by key instead
+            created = db.scalars(
+                insert(models.Subscription).returning(models.Subscription),
+                [
+                    {
+                        'name': row.merchant,
+                        'merchant_key': key,
+                        'amount': float(row.avg_amount),
+                        'currency': row.currency,
+                        'billing_cycle': row.billing_cycle,
+                        'category_id': category_ids[key],
+                        'start_date': row.first_date.date(),
+                        'next_billing_date': next_billing[key].date(),
+                        'is_active': True,
+                    }
+                    for key, row in zip(new.index, new.itertuples())
+                ]
+            ).all()
+            by_key = {subscription.merchant_key: subscription for subscription in created}
+            new_subscriptions = [by_key[key] for key in new.index]
+            matched_ids[new.index] = [subscription.id for subscription in new_subscriptions]
+
+            db.execute(insert(models.Notification), [
+                {
+                    'title': "New Subscription Detected",
+                    'message': f"{subscription.name} - £{subscription.amount:.2f}/{subscription.billing_cycle}",
+                    'type': "success",
+                    'subscription_id': subscription.id,
+                }
+                for subscription in new_subscriptions
+            ])
+
+    matched_ids = matched_ids.dropna()
+    with metrics.span("detection.link_history"):
+        if not matched_ids.empty:
+            db.execute(update(models.MerchantStats), [
+                {'merchant_key': key, 'subscription_id': int(subscription_id)}
+                for key, subscription_id in matched_ids.items()
+            ])
+
+            # Newly recurring merchants also claim their earlier, unmatched history
+            for key in matched_ids.index:
+                touched_months.update(rollups.months_between(
+                    candidates.at[key, 'first_date'].date(), candidates.at[key, 'last_date'].date()
+                ))
+            db.execute(
+                update(models.Transaction.__table__).where(
+                    models.Transaction.merchant_key == bindparam('match_key'),
+                    models.Transaction.subscription_id.is_(None)
+                ).values(subscription_id=bindparam('subscription_key'), is_matched=True),
+                [
+                    {'match_key': key, 'subscription_key': int(subscription_id)}
+                    for key, subscription_id in matched_ids.items()
+                ]
+            )
+
+    # This batch's charges from already-known subscriptions are linked by id
+    with metrics.span("detection.link_batch"):
+        links = transactions[['id', 'merchant_key']].assign(
+            subscription_id=transactions['merchant_key'].map(known)
+        ).dropna(subset=['subscription_id'])
+        if not links.empty:
+            touched_months.update((d.year, d.month) for d in transactions.loc[links.index, 'date'])
+            db.execute(update(models.Transaction), [
+                {'id': int(trans_id), 'subscription_id': int(subscription_id), 'is_matched': True}
+                for trans_id, subscription_id in zip(links['id'], links['subscription_id'])
+            ])
+
+    with metrics.span("detection.rollups"):
+        rollups.refresh_months(db, touched_months)
+        db.commit()
+    return new_subscriptions
@@ -0,0 +1,224 @@
+"""
+In-process publish/subscribe for pushing changes to clients as Server-Sent Events.
+
+watch_commits() publishes a "changed" event, naming the tables written, for every
+commit that wrote rows, and a "notification" event for each new notification, so
+clients refetch only when something changed instead of polling.
+GET /api/events streams them.
+
+Each subscriber has a bounded queue drained on its own event loop, so publishers in
+request threads, import jobs or the scheduler never wait on a client. A queued
+"changed" event absorbs later ones until it is sent, so a burst of commits (say a
+chunked import) costs a client one refetch. A subscriber that falls EVENT_QUEUE_SIZE
+events behind has its queue replaced by a single "resync" event, telling it to
+reload everything, rather than holding memory for a client that isn't reading.
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+
+from sqlalchemy import event, select, func
+
+import models
+import schemas
+import metrics
+
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "100"))
+EVENT_MAX_SUBSCRIBERS = int(os.environ.get("EVENT_MAX_SUBSCRIBERS", "100"))
+# Seconds between keepalive comments on an idle stream, so proxies don't close it
+EVENT_KEEPALIVE = float(os.environ.get("EVENT_KEEPALIVE", "15"))
+# Milliseconds a disconnected EventSource waits before reconnecting
+RETRY_MS = 5000
+
+events_published = metrics.registry.register(metrics.Counter(
+    "events_published", "Events published to stream subscribers", ("event",)
+))
+events_dropped = metrics.registry.register(metrics.Counter(
+    "events_dropped", "Queued events discarded for subscribers that fell behind"
+))
+
+
+class TooManySubscribers(Exception):
+    """Raised when EVENT_MAX_SUBSCRIBERS streams are already open"""
+
+
+class Subscriber:
+    """One client's pending events; offer() and next() both run on its event loop"""
+
+    def __init__(self, loop, max_events: int = EVENT_QUEUE_SIZE):
+        self.loop = loop
+        self.max_events = max_events
+        self._events = deque()
+        self._changed = None  # The queued "changed" event that later ones merge into
+        self._ready = asyncio.Event()
+
+    def offer(self, kind: str, data: dict, event_id: int = None):
+        if kind == "changed" and self._changed is not None:
+            self._changed["data"]["tables"] = sorted(set(self._changed["data"]["tables"]) | set(data["tables"]))
+            return
+        if len(self._events) >= self.max_events:
+            events_dropped.inc(amount=len(self._events))
+            self._events.clear()
+            self._changed = None
+            self._events.append({"event": "resync", "data": {}, "id": None})
+
+        item = {"event": kind, "data": dict(data), "id": event_id}
+        self._events.append(item)
+        if kind == "changed":
+            self._changed = item
+        self._ready.set()
+
+    async def next(self, timeout: float) -> list:
+        """Every pending event, waiting up to timeout seconds for one; [] on timeout"""
+        if not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        pending = list(self._events)
+        self._events.clear()
+        self._changed = None
+        return pending
+
+
+class Broker:
+    def __init__(self, max_subscribers: int = EVENT_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> Subscriber:
+        """Register a subscriber on the running event loop"""
+        subscriber = Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f"At most {self.max_subscribers} event streams can be open")
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, kind: str, data: dict, event_id: int = None):
+        """Queue an event for every subscriber; safe to call from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, kind, data, event_id)
+            except RuntimeError:
+                # Its event loop has closed
+                self.unsubscribe(subscriber)
+        events_published.inc(kind)
+
+
+broker = Broker()
+
+
+def notification_event(notification: models.Notification) -> dict:
+    return {
+        "event": "notification",
+        "data": schemas.Notification.model_validate(notification).model_dump(mode="json"),
+        "id": notification.id,
+    }
+
+
+def format_event(item: dict) -> str:
+    """One event in the text/event-stream format"""
+    lines = [f"id: {item['id']}"] if item["id"] is not None else []
+    lines += [f"event: {item['event']}", f"data: {json.dumps(item['data'])}"]
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream(subscriber: Subscriber, replay=(), last_id: int = 0):
+    """
+    The text/event-stream body for one subscriber: replay first, then live events,
+    with keepalive comments while idle. Unsubscribes when the client goes away.
+    """
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            for item in replay:
+                # A notification can be both replayed and published while the stream starts
+                if item["event"] == "notification":
+                    if item["id"] <= last_id:
+                        continue
+                    last_id = item["id"]
+                yield format_event(item)
+            replay = await subscriber.next(EVENT_KEEPALIVE)
+            if not replay:
+                yield ": keepalive\n\n"
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+_notification_lock = threading.Lock()
+_notification_cursor = 0
+
+
+def _publish_notifications(session_factory):
+    """Publish every notification created since the last ones published"""
+    global _notification_cursor
+    notification = models.Notification
+    with _notification_lock, session_factory() as db:
+        if not broker.subscriber_count():
+            _notification_cursor = db.scalar(select(func.max(notification.id))) or 0
+            return
+        for row in db.scalars(
+            select(notification).where(notification.id > _notification_cursor).order_by(notification.id)
+        ):
+            item = notification_event(row)
+            broker.publish(item["event"], item["data"], item["id"])
+            _notification_cursor = row.id
+
+
+def watch_commits(session_factory):
+    """Publish the tables every commit from session_factory wrote, and the notifications it created"""
+    global _notification_cursor
+    with session_factory() as db:
+        _notification_cursor = db.scalar(select(func.max(models.Notification.id))) or 0
+
+    # Tables are noted per statement at the cursor, where the row count is known, so
+    # the scheduler's INSERT ... SELECT that usually inserts nothing goes unpublished.
+    # Listening there rather than in do_orm_execute leaves that hook to the other listeners.
+    bind = session_factory.kw["bind"]
+
+    @event.listens_for(session_factory, "after_begin")
+    def _began(session, transaction, connection):
+        connection.info["changed_tables"] = session.info.setdefault("changed_tables", set())
+
+    @event.listens_for(bind, "after_cursor_execute")
+    def _cursor_executed(conn, cursor, statement, parameters, context, executemany):
+        tables = conn.info.get("changed_tables")
+        if tables is None or context is None or not (context.isinsert or context.isupdate or context.isdelete):
+            return
+        table = getattr(context.compiled.statement, "table", None) if context.compiled is not None else None
+        # RETURNING statements report -1, so they count as changed
+        if table is not None and cursor.rowcount != 0:
+            tables.add(table.name)
+
+    @event.listens_for(bind, "commit")
+    @event.listens_for(bind, "rollback")
+    def _ended(conn):
+        conn.info.pop("changed_tables", None)
+
+    @event.listens_for(session_factory, "after_commit")
+    def _committed(session):
+        tables = session.info.pop("changed_tables", None)
+        if not tables:
+            return
+        broker.publish("changed", {"tables": sorted(tables)})
+        if models.Notification.__tablename__ in tables:
+            _publish_notifications(session_factory)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _rolled_back(session):
+        session.info.pop("changed_tables", None)
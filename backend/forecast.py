@@ -0,0 +1,261 @@
+"""
+Projected bills from active subscriptions.
+
+Each subscription's billing_cycle is expanded into every charge date over a horizon
+with array arithmetic: weekly cycles step in days, monthly/quarterly/yearly cycles
+step in months and keep their billing day, clamped to short months (a bill on the
+31st falls on the 30th in April and the 31st again in May). Projections are cached
+per subscription generation, which moves on whenever a session commits a change to
+a subscription, so transaction imports don't throw the cache away.
+
+roll_forward() advances next_billing_date past bills that have already happened,
+in one bulk UPDATE; the notification scheduler runs it before each pass.
+
+Usage:
+    python forecast.py roll-forward   # advance overdue next_billing_dates now
+"""
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+import models
+
+BUCKETS = ('day', 'week', 'month')
+CYCLE_DAYS = {'weekly': 7}
+CYCLE_MONTHS = {'monthly': 1, 'quarterly': 3, 'yearly': 12}
+MAX_HORIZON_DAYS = 3660
+PROJECTION_CACHE_SIZE = 32
+
+SUBSCRIPTION_COLUMNS = ['id', 'name', 'amount', 'currency', 'billing_cycle', 'next_billing_date', 'start_date']
+
+_generation = 0
+_projections = OrderedDict()
+_lock = threading.Lock()
+
+
+def _day_array(values) -> np.ndarray:
+    return pd.to_datetime(pd.Series(values)).to_numpy().astype('datetime64[D]')
+
+
+def _month_date(months: np.ndarray, day: np.ndarray) -> np.ndarray:
+    """The date on day of each month (counted from 1970-01), clamped to the month's length"""
+    first = months.astype('datetime64[M]').astype('datetime64[D]')
+    length = ((months + 1).astype('datetime64[M]').astype('datetime64[D]') - first).astype(int)
+    return first + (np.minimum(day, length) - 1)
+
+
+def _repeat(counts: np.ndarray):
+    """(row position, occurrence number) pairs for counts[i] occurrences of each row i"""
+    positions = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return positions, np.arange(len(positions)) - offsets
+
+
+def expand(subscriptions: pd.DataFrame, start: date, end: date):
+    """
+    Every billing date from start to end inclusive for subscriptions with
+    billing_cycle, next_billing_date and start_date columns. The first date is
+    next_billing_date (or start_date when it is unset); none come before it.
+    Returns (row positions, dates) as parallel arrays.
+    """
+    if subscriptions.empty:
+        return np.array([], dtype=int), np.array([], dtype='datetime64[D]')
+
+    anchor = _day_array(subscriptions['next_billing_date'].fillna(subscriptions['start_date']))
+    started = _day_array(subscriptions['start_date'].fillna(subscriptions['next_billing_date']))
+    first_day, last_day = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+
+    cycle = subscriptions['billing_cycle'].fillna('monthly').str.lower()
+    step_days = cycle.map(CYCLE_DAYS).fillna(0).astype(int).to_numpy()
+    # Unknown cycles are treated as monthly, as detection does
+    step_months = cycle.map(CYCLE_MONTHS).fillna(1).astype(int).to_numpy()
+
+    # Billing day of the month; an anchor clamped to a month's end keeps the original day
+    anchor_day = pd.DatetimeIndex(anchor).day.to_numpy()
+    start_day = pd.DatetimeIndex(started).day.to_numpy()
+    month_end = anchor == _month_date(anchor.astype('datetime64[M]').astype(int), np.full(len(anchor), 31))
+    day = np.where(month_end & (start_day > anchor_day), start_day, anchor_day)
+
+    positions, dates = [], []
+    by_days = step_days > 0
+    if by_days.any():
+        rows = np.flatnonzero(by_days)
+        base, step = anchor[rows], step_days[rows]
+        behind = (first_day - base).astype(int)
+        first = base + np.where(behind > 0, -(-behind // step), 0) * step
+        counts = np.maximum(0, (last_day - first).astype(int) // step + 1)
+        pos, k = _repeat(counts)
+        positions.append(rows[pos])
+        dates.append(first[pos] + k * step[pos])
+
+    if (~by_days).any():
+        rows = np.flatnonzero(~by_days)
+        step, billing_day = step_months[rows], day[rows]
+        base = anchor[rows].astype('datetime64[M]').astype(int)
+        start_month = first_day.astype('datetime64[M]').astype(int)
+        end_month = last_day.astype('datetime64[M]').astype(int)
+        k0 = np.maximum(0, -(-(start_month - base) // step))
+        k0 += _month_date(base + k0 * step, billing_day) < first_day
+        first = base + k0 * step
+        counts = np.maximum(0, (end_month - first) // step + 1)
+        pos, k = _repeat(counts)
+        month_dates = _month_date(first[pos] + k * step[pos], billing_day[pos])
+        keep = month_dates <= last_day
+        positions.append(rows[pos][keep])
+        dates.append(month_dates[keep])
+
+    return np.concatenate(positions), np.concatenate(dates)
+
+
+def project(subscriptions: pd.DataFrame, start: date, end: date) -> pd.DataFrame:
+    """One row per projected bill (subscription_id, name, date, amount, currency), by date"""
+    positions, dates = expand(subscriptions, start, end)
+    bills = subscriptions.iloc[positions]
+    return pd.DataFrame({
+        'subscription_id': bills['id'].to_numpy(),
+        'name': bills['name'].to_numpy(),
+        'date': dates,
+        'amount': bills['amount'].abs().to_numpy(),
+        'currency': bills['currency'].fillna('GBP').to_numpy(),
+    }).sort_values(['date', 'subscription_id'], ignore_index=True)
+
+
+def in_currency(bills: pd.DataFrame, fx_rates, currency: str) -> pd.DataFrame:
+    """
+    bills with amounts converted to currency at today's rates, like every other
+    reported total. Bills in a currency without rates are left in their own currency.
+    """
+    days = np.full(len(bills), np.datetime64(date.today(), 'D'))
+    converted = fx_rates.to_base(bills['amount'], bills['currency'], days) / fx_rates.rates_on(currency, days)
+    known = ~np.isnan(converted)
+    return bills.assign(
+        amount=np.where(known, converted.round(2), bills['amount']),
+        currency=np.where(known, currency, bills['currency']),
+    )
+
+
+def bucket_totals(bills: pd.DataFrame, bucket: str) -> pd.DataFrame:
+    """Bill totals and counts per period start and currency; weeks start on Monday"""
+    dates = bills['date'].to_numpy().astype('datetime64[D]')
+    if bucket == 'week':
+        days = dates.astype(int)
+        dates = (days - (days + 3) % 7).astype('datetime64[D]')
+    elif bucket == 'month':
+        dates = dates.astype('datetime64[M]').astype('datetime64[D]')
+    totals = bills.assign(period=dates).groupby(['period', 'currency'], as_index=False).agg(
+        total=('amount', 'sum'), count=('amount', 'size')
+    )
+    return totals.assign(period=totals['period'].dt.date, total=totals['total'].round(2))
+
+
+def load_subscriptions(db: Session) -> pd.DataFrame:
+    sub = models.Subscription
+    rows = db.execute(
+        select(*(getattr(sub, column) for column in SUBSCRIPTION_COLUMNS)).where(sub.is_active == True)
+    ).all()
+    return pd.DataFrame(rows, columns=SUBSCRIPTION_COLUMNS)
+
+
+def generation() -> int:
+    return _generation
+
+
+def bump():
+    """Mark every cached projection as stale"""
+    global _generation
+    with _lock:
+        _generation += 1
+
+
+def projection(db: Session, start: date, end: date) -> pd.DataFrame:
+    """project() over the active subscriptions, cached until a subscription changes"""
+    key = (start, end)
+    # Read the generation first, so a change that lands while projecting leaves this stale
+    current = _generation
+    with _lock:
+        cached = _projections.get(key)
+        if cached is not None and cached[0] == current:
+            _projections.move_to_end(key)
+            return cached[1]
+
+    bills = project(load_subscriptions(db), start, end)
+    with _lock:
+        _projections[key] = (current, bills)
+        _projections.move_to_end(key)
+        while len(_projections) > PROJECTION_CACHE_SIZE:
+            _projections.popitem(last=False)
+    return bills
+
+
+def watch_subscriptions(session_factory):
+    """Bump the generation whenever a session from session_factory commits a subscription change"""
+    table_name = models.Subscription.__tablename__
+
+    @event.listens_for(session_factory, "after_flush")
+    def _flushed(session, flush_context):
+        if any(isinstance(obj, models.Subscription) for obj in (*session.new, *session.dirty, *session.deleted)):
+            session.info["subscriptions_changed"] = True
+
+    @event.listens_for(session_factory, "do_orm_execute")
+    def _executed(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            # ORM statements carry an annotated copy of the Table, so compare names
+            table = getattr(orm_execute_state.statement, "table", None)
+            if table is not None and table.name == table_name:
+                orm_execute_state.session.info["subscriptions_changed"] = True
+
+    @event.listens_for(session_factory, "after_commit")
+    def _committed(session):
+        if session.info.pop("subscriptions_changed", False):
+            bump()
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _rolled_back(session):
+        session.info.pop("subscriptions_changed", None)
+
+
+def roll_forward(db: Session, today: date = None) -> int:
+    """
+    Move every active subscription's past next_billing_date to its first billing
+    date on or after today, in one bulk UPDATE. Returns the number updated.
+    """
+    today = today or date.today()
+    sub = models.Subscription
+    overdue = pd.DataFrame(db.execute(
+        select(*(getattr(sub, column) for column in SUBSCRIPTION_COLUMNS)).where(
+            sub.is_active == True, sub.next_billing_date < today
+        )
+    ).all(), columns=SUBSCRIPTION_COLUMNS)
+    if overdue.empty:
+        return 0
+
+    # The longest cycle is a year, so every subscription bills within 366 days
+    positions, dates = expand(overdue, today, today + timedelta(days=366))
+    next_dates = pd.Series(dates).groupby(positions).min()
+    db.execute(update(sub), [
+        {'id': int(overdue['id'].iat[position]), 'next_billing_date': next_date.date()}
+        for position, next_date in next_dates.items()
+    ])
+    db.commit()
+    return len(next_dates)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "roll-forward":
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            print(f"Advanced {roll_forward(db)} subscription(s)")
+        finally:
+            db.close()
+    else:
+        print(__doc__)
+        sys.exit(2)
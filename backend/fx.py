@@ -0,0 +1,242 @@
+"""
+Exchange rates and conversion to the reporting (base) currency.
+
+Rates live in the fx_rates table, loaded from a local CSV with date, currency and
+rate columns, where rate is the value of one unit of the currency in BASE_CURRENCY
+(e.g. 2024-01-02,EUR,0.86 with a GBP base). There is no network lookup. A currency's
+rate on a given day is the latest one on or before it; days before its first rate
+use the first rate.
+
+Transactions get base_amount when they are written, so spend totals are a plain SUM
+of one indexed column. Loading rates revalues the stored transactions in the
+currencies it touched and refreshes the rollup months they fall in. Transactions in
+a currency without rates keep a NULL base_amount and are left out of totals until
+its rates are loaded; `python fx.py missing` lists those currencies.
+
+Usage:
+    python fx.py load <csv>   # upsert rates from a CSV and revalue stored transactions
+    python fx.py missing      # currencies used by transactions that have no rates
+"""
+import os
+import sys
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, update, bindparam, func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models
+import rollups
+
+BASE_CURRENCY = os.environ.get("BASE_CURRENCY", "GBP").upper()
+# Seconds before cached rates are re-read, so rates loaded by another process show up
+FX_CACHE_TTL = float(os.environ.get("FX_CACHE_TTL", "300"))
+
+CSV_COLUMNS = ['date', 'currency', 'rate']
+# Transactions revalued per UPDATE batch in revalue()
+REVALUE_ROWS = 50_000
+
+
+def _days(values) -> np.ndarray:
+    return pd.to_datetime(pd.Series(values)).to_numpy().astype('datetime64[D]')
+
+
+class FxRates:
+    """
+    Date-indexed rates held as one sorted array of days and one of rates per
+    currency; a lookup is a binary search.
+    """
+
+    def __init__(self, rows=()):
+        frame = pd.DataFrame(list(rows), columns=CSV_COLUMNS)
+        self._series = {}
+        for currency, group in frame.groupby('currency'):
+            group = group.assign(date=_days(group['date'].to_numpy())).sort_values('date')
+            self._series[currency] = (group['date'].to_numpy(), group['rate'].to_numpy(dtype=float))
+
+    def currencies(self) -> set:
+        """Every currency that amounts can be converted from and reported in"""
+        return set(self._series) | {BASE_CURRENCY}
+
+    def rates_on(self, currency: str, days) -> np.ndarray:
+        """The rate of currency on each of days; NaN throughout for a currency without rates"""
+        days = np.asarray(days, dtype='datetime64[D]')
+        currency = (currency or BASE_CURRENCY).upper()
+        if currency == BASE_CURRENCY:
+            return np.ones(len(days))
+        if currency not in self._series:
+            return np.full(len(days), np.nan)
+        known_days, rates = self._series[currency]
+        return rates[np.maximum(np.searchsorted(known_days, days, side='right') - 1, 0)]
+
+    def rate(self, currency: str, on: date):
+        """The rate of currency on one day, or None without rates for it"""
+        value = self.rates_on(currency, np.array([on], dtype='datetime64[D]'))[0]
+        return None if np.isnan(value) else float(value)
+
+    def to_base(self, amounts, currencies, dates) -> np.ndarray:
+        """Convert amounts in per-row currencies to the base currency at each row's date"""
+        amounts = np.asarray(amounts, dtype=float)
+        currencies = pd.Series(currencies, dtype=object).fillna(BASE_CURRENCY).str.upper().to_numpy()
+        days = _days(dates)
+        converted = np.full(len(amounts), np.nan)
+        for currency in pd.unique(currencies):
+            rows = currencies == currency
+            converted[rows] = amounts[rows] * self.rates_on(currency, days[rows])
+        return converted
+
+    def from_base(self, amount: float, currency: str, on: date):
+        """A base-currency amount in currency at the rate on a day, or None without rates for it"""
+        rate = self.rate(currency, on)
+        return None if rate is None or amount is None else amount / rate
+
+    def convert(self, amount: float, currency: str, target: str, on: date):
+        """amount in currency expressed in target at the rates on a day, or None if either has no rates"""
+        rate = self.rate(currency, on)
+        return None if rate is None or amount is None else self.from_base(amount * rate, target, on)
+
+
+_lock = threading.Lock()
+_rates = None
+_loaded_at = 0.0
+_generation = 0  # Moves on every invalidate(), so a read that overlaps one isn't cached
+
+
+def invalidate():
+    """Forget cached rates; call after the fx_rates table changes"""
+    global _rates, _generation
+    with _lock:
+        _rates = None
+        _generation += 1
+
+
+def rates(db: Session) -> FxRates:
+    """Every stored rate, cached in-process for FX_CACHE_TTL seconds"""
+    global _rates, _loaded_at
+    with _lock:
+        if _rates is not None and time.monotonic() - _loaded_at <= FX_CACHE_TTL:
+            return _rates
+        generation = _generation
+
+    # Query without holding the lock: async handlers call this through run_sync on
+    # the event loop thread, and one awaiting its query there with the lock held
+    # would leave the next one blocking the loop on it
+    rate = models.FxRate
+    loaded = FxRates(db.execute(select(rate.date, rate.currency, rate.rate)).all())
+    with _lock:
+        if generation == _generation:
+            _rates = loaded
+            _loaded_at = time.monotonic()
+    return loaded
+
+
+def read_csv(source) -> pd.DataFrame:
+    """Parse and validate a rates CSV (a path or file object). Raises ValueError if it is malformed."""
+    frame = pd.read_csv(source, dtype={'currency': str})
+    frame.columns = frame.columns.str.strip().str.lower()
+    missing = [column for column in CSV_COLUMNS if column not in frame.columns]
+    if missing:
+        raise ValueError(f"Rates CSV is missing column(s): {', '.join(missing)}")
+
+    frame = frame[CSV_COLUMNS].assign(
+        date=pd.to_datetime(frame['date'], errors='coerce').dt.date,
+        currency=frame['currency'].str.strip().str.upper(),
+        rate=pd.to_numeric(frame['rate'], errors='coerce'),
+    )
+    invalid = frame['date'].isna() | frame['currency'].isna() | ~(frame['rate'] > 0)
+    if invalid.any():
+        raise ValueError(f"Rates CSV has {int(invalid.sum())} row(s) without a valid date, currency and positive rate")
+    # The base currency is always worth 1; the last row for a day wins
+    return frame[frame['currency'] != BASE_CURRENCY].drop_duplicates(['currency', 'date'], keep='last')
+
+
+def revalue(db: Session, currencies) -> int:
+    """
+    Recompute base_amount for every transaction in currencies at the current rates,
+    then the rollup months they fall in; codes stored in lower case count too.
+    Does not commit. Returns the rows updated.
+    """
+    trans = models.Transaction.__table__
+    fx_rates = rates(db)
+    months = set()
+    updated = 0
+    for currency in sorted(currencies):
+        last_id = 0
+        while True:
+            chunk = db.execute(
+                select(trans.c.id, trans.c.date, trans.c.amount)
+                .where(func.upper(trans.c.currency) == currency, trans.c.id > last_id)
+                .order_by(trans.c.id).limit(REVALUE_ROWS)
+            ).all()
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            ids, dates, amounts = zip(*chunk)
+            values = fx_rates.to_base(amounts, [currency] * len(chunk), dates)
+            db.execute(
+                update(trans).where(trans.c.id == bindparam('trans_id')).values(base_amount=bindparam('value')),
+                [{'trans_id': trans_id, 'value': None if np.isnan(value) else float(value)}
+                 for trans_id, value in zip(ids, values)]
+            )
+            months.update((d.year, d.month) for d in dates)
+            updated += len(chunk)
+
+    rollups.refresh_months(db, months)
+    return updated
+
+
+def load_rates(db: Session, frame: pd.DataFrame) -> int:
+    """Upsert rates from read_csv() and revalue the transactions they apply to. Returns the rates stored."""
+    if frame.empty:
+        return 0
+    rate = models.FxRate.__table__
+    stmt = insert(rate)
+    db.execute(
+        stmt.on_conflict_do_update(index_elements=['currency', 'date'], set_={'rate': stmt.excluded.rate}),
+        frame.to_dict('records')
+    )
+    invalidate()
+    revalue(db, set(frame['currency']))
+    db.commit()
+    return len(frame)
+
+
+def missing_currencies(db: Session) -> list:
+    """(currency, transaction count) for transactions that have no base amount, most used first"""
+    trans = models.Transaction
+    counts = db.execute(
+        select(func.upper(trans.currency), func.count(trans.id))
+        .where(trans.base_amount.is_(None)).group_by(func.upper(trans.currency))
+    ).all()
+    return sorted(counts, key=lambda row: -row[1])
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+    import migrations
+
+    migrations.migrate(engine)
+    db = SessionLocal()
+    try:
+        if len(sys.argv) == 3 and sys.argv[1] == "load":
+            try:
+                stored = load_rates(db, read_csv(sys.argv[2]))
+            except ValueError as e:
+                print(e)
+                sys.exit(1)
+            print(f"Loaded {stored} rate(s)")
+        elif len(sys.argv) == 2 and sys.argv[1] == "missing":
+            missing = missing_currencies(db)
+            for currency, count in missing:
+                print(f"{currency}: {count} transaction(s)")
+            print(f"{len(missing)} currency(ies) without rates")
+        else:
+            print(__doc__)
+            sys.exit(2)
+    finally:
+        db.close()
@@ -0,0 +1,303 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from sqlalchemy import insert, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+import merchants
+import rawrows
+
+REQUIRED_COLUMNS = ['date', 'description', 'amount']
+
+# Rows per chunk for streaming imports
+CHUNK_ROWS = 50_000
+
+# Worker processes that parse batch imports; inserts still happen in one writer
+IMPORT_PROCESSES = int(os.environ.get("IMPORT_PROCESSES", str(os.cpu_count() or 1)))
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def iter_csv_chunks(fileobj, chunk_rows: int = CHUNK_ROWS, skip_rows: int = 0):
+    """
+    Yield DataFrames of at most chunk_rows rows read straight from a binary file object.
+    skip_rows data rows (not counting the header) are skipped, for resuming a failed import.
+    """
+    fileobj.seek(0)
+    skiprows = range(1, skip_rows + 1) if skip_rows else None
+    with pd.read_csv(fileobj, chunksize=chunk_rows, encoding='utf-8', skiprows=skiprows) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """Parse a date column in one pass, falling back to per-value inference for odd formats"""
+    parsed = pd.to_datetime(values, errors='coerce')
+
+    # The fast path infers a single format from the first value, so rows written
+    # in a different format come back as NaT. Retry only those.
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        parsed.loc[retry] = pd.to_datetime(values[retry], errors='coerce', format='mixed')
+
+    return parsed.dt.date
+
+
+def build_raw_values(df: pd.DataFrame):
+    """Compress every original CSV row; returns (columns, dictionary, per-row values)"""
+    columns = [str(col) for col in df.columns]
+    dictionary, values = rawrows.encode_rows(df.astype(object).values.tolist())
+    return columns, dictionary, values
+
+
+def fingerprints(dates, amounts, descriptions, payment_methods, accounts, occurrences: dict = None) -> list:
+    """
+    Hash each transaction's (date, amount, normalized description, payment method,
+    account). Identical rows in one statement, like two equal coffees on the same day,
+    are told apart by how many times the same values appeared before them, so a
+    re-import reproduces every fingerprint exactly. Pass the same occurrences dict
+    across the chunks of one file to keep that count running.
+    """
+    def text(values):
+        values = pd.Series(values, dtype=object)
+        return values.where(values.notna(), '').astype(str).str.casefold().str.split().str.join(' ')
+
+    amounts = pd.Series(amounts, dtype=float)
+    keys = (
+        pd.Series(dates, dtype=object).astype(str).reset_index(drop=True) + '\x1f'
+        + amounts.map('{:.2f}'.format).reset_index(drop=True) + '\x1f'
+        + text(descriptions).reset_index(drop=True) + '\x1f'
+        + text(payment_methods).reset_index(drop=True) + '\x1f'
+        + text(accounts).reset_index(drop=True)
+    )
+    seen = keys.groupby(keys, sort=False).cumcount()
+    if occurrences is not None:
+        seen += keys.map(occurrences).fillna(0).astype(int)
+        for key, count in keys.value_counts().items():
+            occurrences[key] = occurrences.get(key, 0) + count
+    return [
+        hashlib.blake2b(f"{key}\x1f{count}".encode(), digest_size=16).hexdigest()
+        for key, count in zip(keys, seen)
+    ]
+
+
+def prepare_transactions(df: pd.DataFrame, occurrences: dict = None) -> pd.DataFrame:
+    """
+    Normalize a raw statement DataFrame column-at-a-time.
+    Returns one row per valid transaction with the columns of models.Transaction
+    plus a payment_method name column. Rows with unparseable dates are dropped.
+    The column names and dictionary that raw_values need are kept in
+    frame.attrs['raw_batch'] for insert_transactions to store once.
+    occurrences is passed on to fingerprints() when a file arrives in chunks.
+    """
+    dates = parse_dates(df['date'])
+    description = df['description'].astype(str)
+
+    # Use the merchant column where present, otherwise the first word of the description
+    merchant = description.str.split().str[0].astype(object)
+    if 'merchant' in df.columns:
+        merchant = merchant.where(df['merchant'].isna(), df['merchant'].astype(str))
+
+    currency = pd.Series('GBP', index=df.index)
+    if 'currency' in df.columns:
+        currency = df['currency'].fillna('GBP').astype(str).str.strip().str.upper()
+
+    payment_method = _payment_methods(df)
+
+    raw_columns, raw_dictionary, raw_values = build_raw_values(df)
+    frame = pd.DataFrame({
+        'date': dates,
+        'description': description,
+        'amount': df['amount'].astype(float),
+        'currency': currency,
+        'merchant': merchant,
+        'merchant_key': merchants.normalizer(merchant),
+        'payment_method': payment_method,
+        'raw_values': raw_values,
+    }, index=df.index)
+    frame.attrs['raw_batch'] = {'columns': json.dumps(raw_columns), 'dictionary': raw_dictionary}
+
+    # Skip invalid dates
+    valid = frame['date'].notna()
+    frame = frame[valid]
+    return frame.assign(fingerprint=fingerprints(
+        frame['date'], frame['amount'], frame['description'], frame['payment_method'],
+        _accounts(df)[valid], occurrences
+    ))
+
+
+def _payment_methods(df: pd.DataFrame) -> pd.Series:
+    if 'payment_method' not in df.columns:
+        return pd.Series(None, index=df.index, dtype=object)
+    return df['payment_method'].astype(str).where(df['payment_method'].notna(), None)
+
+
+def _accounts(df: pd.DataFrame) -> pd.Series:
+    # Optional account column: only used to tell identical charges on different accounts apart
+    if 'account' not in df.columns:
+        return pd.Series(None, index=df.index, dtype=object)
+    return df['account']
+
+
+def count_occurrences(fileobj, rows: int, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """
+    The occurrences dict that fingerprints() holds after the first rows data rows of
+    a binary file object, so an import resumed from there numbers identical rows
+    after them the way the original import would have.
+    """
+    occurrences = {}
+    if not rows:
+        return occurrences
+    fileobj.seek(0)
+    with pd.read_csv(fileobj, chunksize=chunk_rows, nrows=rows, encoding='utf-8') as reader:
+        for df in reader:
+            dates = parse_dates(df['date'])
+            valid = dates.notna()
+            fingerprints(
+                dates[valid], df['amount'].astype(float)[valid], df['description'].astype(str)[valid],
+                _payment_methods(df)[valid], _accounts(df)[valid], occurrences
+            )
+    return occurrences
+
+
+def upsert(db: Session, table):
+    """INSERT for table in the dialect of db's database, which has on_conflict_do_nothing/do_update"""
+    dialect = sqlite if db.get_bind().dialect.name == 'sqlite' else postgresql
+    return dialect.insert(table)
+
+
+def insert_transactions(db: Session, frame: pd.DataFrame, payment_method_ids: dict) -> pd.DataFrame:
+    """
+    Bulk insert prepared transactions with a single executemany
+    INSERT ... ON CONFLICT (fingerprint) DO NOTHING, so rows already in the database
+    are skipped. Returns only the newly inserted rows, with their ids in an id column.
+    """
+    if frame.empty:
+        return frame.assign(id=pd.Series(dtype='int64'), payment_method_id=pd.Series(dtype=object))
+
+    records = frame.drop(columns=['payment_method']).astype(object)
+    records = records.where(records.notna(), None)
+    records['payment_method_id'] = pd.Series(
+        [payment_method_ids.get(name) for name in frame['payment_method']],
+        index=frame.index, dtype=object
+    )
+    records['is_matched'] = False
+
+    # Column names and the compression dictionary are stored once per batch
+    raw_batch_id = None
+    if 'raw_batch' in frame.attrs:
+        raw_batch_id = db.scalar(
+            insert(models.RawBatch).values(**frame.attrs['raw_batch']).returning(models.RawBatch.id)
+        )
+    records['raw_batch_id'] = raw_batch_id
+
+    rows = records.to_dict('records')
+    trans = models.Transaction
+    # Skipped duplicates return no row, so the new ids are matched up by fingerprint
+    # rather than parameter order; sorting would also make SQLite insert row by row.
+    # render_nulls keeps rows with and without a payment method in the same batch;
+    # otherwise every None/non-None switch starts a new INSERT
+    stmt = upsert(db, trans.__table__).on_conflict_do_nothing(index_elements=['fingerprint'])
+    inserted = db.execute(
+        stmt.returning(trans.id, trans.fingerprint), rows, execution_options={"render_nulls": True}
+    ).all()
+
+    ids = {fingerprint: trans_id for trans_id, fingerprint in inserted}
+    if not ids and raw_batch_id is not None:
+        db.execute(delete(models.RawBatch).where(models.RawBatch.id == raw_batch_id))
+    records = records[records['fingerprint'].isin(ids)]
+    return records.assign(id=records['fingerprint'].map(ids).astype('int64'))
+
+
+def file_hash(fileobj) -> str:
+    """SHA-256 of a binary file object, read in blocks; the position is reset afterwards"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(1024 * 1024), b''):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def find_imported_file(db: Session, content_hash: str):
+    """The imported_files row for a byte-identical earlier upload, or None"""
+    return db.get(models.ImportedFile, content_hash)
+
+
+def record_imported_file(db: Session, content_hash: str, filename: str, count: int, duplicates: int):
+    """Remember a fully imported file so the same bytes are turned away next time"""
+    db.execute(upsert(db, models.ImportedFile.__table__).values(
+        content_hash=content_hash, filename=filename, transaction_count=count, duplicate_count=duplicates
+    ).on_conflict_do_nothing(index_elements=['content_hash']))
+    db.commit()
+
+
+def expand_uploads(uploads) -> list:
+    """
+    Flatten (filename, bytes) uploads into one entry per CSV statement, unpacking
+    zip archives. Anything else is passed through for parse_statement to reject.
+    """
+    statements = []
+    for filename, data in uploads:
+        if not filename.lower().endswith('.zip'):
+            statements.append((filename, data))
+            continue
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for member in archive.infolist():
+                name = member.filename
+                if member.is_dir() or name.startswith('__MACOSX/') or not name.lower().endswith('.csv'):
+                    continue
+                statements.append((f"{filename}/{name}", archive.read(member)))
+    return statements
+
+
+def parse_statement(filename: str, data: bytes) -> dict:
+    """
+    Read and normalize one CSV statement. Runs in a worker process, so it returns
+    plain data and reports problems in an error field instead of raising.
+    """
+    result = {"filename": filename, "frame": None, "rows_read": 0, "error": None}
+    if not filename.lower().endswith('.csv'):
+        result["error"] = "File must be a CSV"
+        return result
+
+    try:
+        df = pd.read_csv(io.BytesIO(data), encoding='utf-8')
+        if not all(col in df.columns for col in REQUIRED_COLUMNS):
+            result["error"] = f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}"
+            return result
+        result["rows_read"] = len(df)
+        result["frame"] = prepare_transactions(df)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """The shared process pool for parse_statement, started on first use"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # Forking a process that holds database connections and threads isn't safe
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=IMPORT_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_pool
+
+
+def shutdown_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False, cancel_futures=True)
+            _parse_pool = None
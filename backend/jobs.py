@@ -0,0 +1,78 @@
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import UploadFile
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+import models
+
+# Uploads are copied here until their job completes, so interrupted jobs can resume
+IMPORT_DIR = os.environ.get("IMPORT_DIR", "./imports")
+IMPORT_WORKERS = int(os.environ.get("IMPORT_WORKERS", "1"))
+
+
+def create_job(db: Session, file: UploadFile, chunk_rows: int, content_hash: str = None):
+    """Persist an uploaded CSV to disk and record a queued import job for it"""
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    file_path = os.path.join(IMPORT_DIR, f"{job_id}.csv")
+
+    # Copy in blocks rather than reading the whole upload into memory
+    file.file.seek(0)
+    with open(file_path, 'wb') as out:
+        shutil.copyfileobj(file.file, out)
+
+    job = models.ImportJob(
+        id=job_id,
+        filename=file.filename,
+        file_path=file_path,
+        state="queued",
+        chunk_rows=chunk_rows,
+        content_hash=content_hash
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def remove_upload(file_path: str):
+    """Delete a job's stored upload once it is no longer needed"""
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+
+class ImportJobQueue:
+    """
+    Local worker pool for import jobs. Job state lives in SQLite, so the pool only
+    needs job ids; anything still queued or running after a restart is resubmitted
+    by recover().
+    """
+
+    def __init__(self, run, max_workers: int = IMPORT_WORKERS):
+        self._run = run
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="import-job")
+
+    def submit(self, job_id: str):
+        return self._executor.submit(self._run, job_id)
+
+    def recover(self):
+        """Resubmit jobs that never finished, oldest first"""
+        db = SessionLocal()
+        try:
+            pending = db.query(models.ImportJob.id).filter(
+                models.ImportJob.state.in_(("queued", "running"))
+            ).order_by(models.ImportJob.created_at).all()
+        finally:
+            db.close()
+
+        for (job_id,) in pending:
+            self.submit(job_id)
+        return len(pending)
+
+    def shutdown(self):
+        # Queued jobs stay queued in the database and are picked up by recover()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,91 @@
+import threading
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models
+import categorizer
+
+# Category for merchants that no rule matches: (name, pie chart color)
+DEFAULT_CATEGORY = ('Other', '#64748b')
+
+# Process-level name -> id caches of committed rows, loaded on first use and dropped by invalidate()
+_lock = threading.Lock()
+_payment_method_ids = None
+_category_ids = None
+
+
+def invalidate():
+    """Forget cached ids; call after categories or payment methods are created or deleted"""
+    global _payment_method_ids, _category_ids
+    with _lock:
+        _payment_method_ids = None
+        _category_ids = None
+
+
+def _load(db: Session, model):
+    return dict(db.execute(select(model.name, model.id)).all())
+
+
+def _resolve(db: Session, model, cache: dict, rows: list):
+    """
+    Make sure every row (dicts with at least a name) exists, inserting the missing
+    ones in a single statement. Returns the name -> id mapping for this session;
+    the inserts are left for the caller to commit, so cache itself is not changed.
+    """
+    missing = [row for row in rows if row['name'] not in cache]
+    if not missing:
+        return cache
+
+    # Another writer may have created some of them since the cache was loaded
+    db.execute(insert(model).on_conflict_do_nothing(index_elements=['name']), missing)
+    db.info["lookups_inserted"] = True
+
+    names = [row['name'] for row in missing]
+    ids = dict(cache)
+    ids.update(db.execute(select(model.name, model.id).where(model.name.in_(names))).all())
+    return ids
+
+
+def invalidate_on_commit(session_factory):
+    """Reload the caches after a session from session_factory commits rows that _resolve() inserted"""
+
+    @event.listens_for(session_factory, "after_commit")
+    def _committed(session):
+        if session.info.pop("lookups_inserted", False):
+            invalidate()
+
+    @event.listens_for(session_factory, "after_transaction_end")
+    def _ended(session, transaction):
+        # Rolled back, or closed without committing
+        if transaction.parent is None:
+            session.info.pop("lookups_inserted", None)
+
+
+def resolve_payment_methods(db: Session, names) -> dict:
+    """Map every payment method name to its id, creating the unknown ones in one batch"""
+    global _payment_method_ids
+    with _lock:
+        if _payment_method_ids is None:
+            _payment_method_ids = _load(db, models.PaymentMethod)
+        rows = [{'name': name} for name in set(names)]
+        ids = _resolve(db, models.PaymentMethod, _payment_method_ids, rows)
+        return {name: ids[name] for name in set(names)}
+
+
+def resolve_categories(db: Session, merchants) -> dict:
+    """Map every merchant name to its category id, falling back to DEFAULT_CATEGORY when no rule matches"""
+    global _category_ids
+    categories = categorizer.classify(db, merchants)
+    if all(category_id is not None for category_id in categories.values()):
+        return categories
+
+    name, color = DEFAULT_CATEGORY
+    with _lock:
+        if _category_ids is None:
+            _category_ids = _load(db, models.Category)
+        default_id = _resolve(db, models.Category, _category_ids, [{'name': name, 'color': color}])[name]
+    return {
+        merchant: default_id if category_id is None else category_id
+        for merchant, category_id in categories.items()
+    }
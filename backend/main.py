@@ -1,23 +1,85 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from typing import List
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, joinedload, undefer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, or_, case
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
 from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
 import pandas as pd
+import base64
+import hashlib
 import io
 import json
+import time
 from collections import Counter
+from concurrent.futures import as_completed
+from contextlib import asynccontextmanager, closing
 
-from database import engine, get_db, Base
+from database import engine, async_read_engine, get_db, get_async_read_db, SessionLocal
 import models
 import schemas
+import importer
+import jobs
+import lookups
+import categorizer
+import merchants
+import detection
+import rollups
+import cache
+import notifications
+import migrations
+import analytics_store
+import forecast
+import fx
+import metrics
+import events
+
+# Create or upgrade database tables and indexes
+migrations.migrate(engine)
+
+# Any committed write makes cached analytics responses stale
+cache.invalidate_on_commit(SessionLocal)
+
+# Payment methods and categories created by an import are cached once it commits
+lookups.invalidate_on_commit(SessionLocal)
+
+# Cached bill projections only go stale when a subscription changes
+forecast.watch_subscriptions(SessionLocal)
+
+# Push committed changes and new notifications to GET /api/events subscribers
+events.watch_commits(SessionLocal)
+
+# Count and time SQL on both engines
+for instrumented in (engine, async_read_engine.sync_engine):
+    metrics.instrument_engine(instrumented)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Backfill running merchant stats and the spend rollup for databases created before they existed
+    db = SessionLocal()
+    try:
+        if not db.query(models.MerchantStats).first() and db.query(models.Transaction).first():
+            detection.rebuild_merchant_stats(db)
+        if not db.query(models.MonthlySpendRollup).first() and db.query(models.Transaction).first():
+            rollups.rebuild(db)
+    finally:
+        db.close()
+
+    # Pick up imports that were queued or running when the server last stopped
+    import_jobs.recover()
+    notification_scheduler.start()
+    yield
+    notification_scheduler.stop()
+    import_jobs.shutdown()
+    importer.shutdown_parse_pool()
+    await async_read_engine.dispose()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Subscription Tracker API")
+app = FastAPI(title="Subscription Tracker API", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -26,198 +88,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
-
-# Helper function to detect category from merchant name
-def get_or_create_category(merchant: str, db: Session):
-    """Auto-categorize based on merchant name"""
-    category_map = {
-        'netflix': ('Streaming', '#ec4899'),
-        'spotify': ('Streaming', '#ec4899'),
-        'disney': ('Streaming', '#ec4899'),
-        'youtube': ('Streaming', '#ec4899'),
-        'amazon': ('Shopping', '#f59e0b'),
-        'adobe': ('Software', '#6366f1'),
-        'microsoft': ('Software', '#6366f1'),
-        'github': ('Software', '#6366f1'),
-        'dropbox': ('Cloud Storage', '#8b5cf6'),
-        'chatgpt': ('AI Tools', '#10b981'),
-        'openai': ('AI Tools', '#10b981'),
-    }
-
-    merchant_lower = merchant.lower()
-    for key, (cat_name, color) in category_map.items():
-        if key in merchant_lower:
-            # Check if category exists
-            category = db.query(models.Category).filter(
-                models.Category.name == cat_name
-            ).first()
-
-            if not category:
-                category = models.Category(name=cat_name, color=color)
-                db.add(category)
-                db.commit()
-                db.refresh(category)
-
-            return category
-
-    # Default category
-    default_cat = db.query(models.Category).filter(
-        models.Category.name == "Other"
-    ).first()
-
-    if not default_cat:
-        default_cat = models.Category(name="Other", color="#64748b")
-        db.add(default_cat)
-        db.commit()
-        db.refresh(default_cat)
-
-    return default_cat
-
-
-# Helper function to get or create payment method
-def get_or_create_payment_method(payment_method_name: str, db: Session):
-    """Get existing payment method or create new one"""
-    payment_method = db.query(models.PaymentMethod).filter(
-        models.PaymentMethod.name == payment_method_name
-    ).first()
-
-    if not payment_method:
-        payment_method = models.PaymentMethod(name=payment_method_name)
-        db.add(payment_method)
-        db.commit()
-        db.refresh(payment_method)
-
-    return payment_method
-
-
-# Helper function to detect recurring subscriptions
-def detect_and_create_subscriptions(transactions: List[models.Transaction], db: Session):
-    """Detect recurring patterns and auto-create subscriptions"""
-    # Group by merchant
-    merchant_groups = {}
-    for trans in transactions:
-        if trans.merchant:
-            if trans.merchant not in merchant_groups:
-                merchant_groups[trans.merchant] = []
-            merchant_groups[trans.merchant].append(trans)
-
-    new_subscriptions = []
-
-    for merchant, trans_list in merchant_groups.items():
-        # Need at least 2 transactions to detect pattern
-        if len(trans_list) < 2:
-            continue
-
-        # Sort by date
-        trans_list.sort(key=lambda x: x.date)
-
-        # Check if amounts are similar (within 10%)
-        amounts = [abs(t.amount) for t in trans_list]
-        avg_amount = sum(amounts) / len(amounts)
-        similar_amounts = all(abs(amt - avg_amount) / avg_amount < 0.1 for amt in amounts)
-
-        if not similar_amounts:
-            continue
-
-        # Check if subscription already exists
-        existing_sub = db.query(models.Subscription).filter(
-            models.Subscription.name.ilike(f"%{merchant}%")
-        ).first()
-
-        if existing_sub:
-            # Match transactions to existing subscription
-            for trans in trans_list:
-                trans.subscription_id = existing_sub.id
-                trans.is_matched = True
-            continue
-
-        # Calculate billing cycle based on date differences
-        dates = [t.date for t in trans_list]
-        if len(dates) >= 2:
-            days_diff = (dates[-1] - dates[0]).days / (len(dates) - 1)
-
-            if 25 <= days_diff <= 35:
-                billing_cycle = "monthly"
-            elif 85 <= days_diff <= 95:
-                billing_cycle = "quarterly"
-            elif 350 <= days_diff <= 380:
-                billing_cycle = "yearly"
-            else:
-                billing_cycle = "monthly"  # Default
-
-            # Get category
-            category = get_or_create_category(merchant, db)
-
-            # Create subscription
-            subscription = models.Subscription(
-                name=merchant,
-                amount=avg_amount,
-                currency=trans_list[0].currency,
-                billing_cycle=billing_cycle,
-                category_id=category.id,
-                start_date=trans_list[0].date,
-                next_billing_date=trans_list[-1].date + timedelta(days=int(days_diff)),
-                is_active=True
-            )
-            db.add(subscription)
-            db.commit()
-            db.refresh(subscription)
-
-            # Match all transactions to this subscription
-            for trans in trans_list:
-                trans.subscription_id = subscription.id
-                trans.is_matched = True
-
-            new_subscriptions.append(subscription)
-
-            # Create notification
-            notification = models.Notification(
-                title="New Subscription Detected",
-                message=f"{merchant} - £{avg_amount:.2f}/{billing_cycle}",
-                type="success",
-                subscription_id=subscription.id
-            )
-            db.add(notification)
-
-    db.commit()
-    return new_subscriptions
-
-
-# Helper function to generate notifications
-def generate_notifications(db: Session):
-    """Generate notifications for upcoming bills and alerts"""
-    today = date.today()
-    week_from_now = today + timedelta(days=7)
-
-    # Check for upcoming bills
-    upcoming_subs = db.query(models.Subscription).filter(
-        models.Subscription.is_active == True,
-        models.Subscription.next_billing_date != None,
-        models.Subscription.next_billing_date >= today,
-        models.Subscription.next_billing_date <= week_from_now
-    ).all()
-
-    for sub in upcoming_subs:
-        # Check if notification already exists
-        existing = db.query(models.Notification).filter(
-            models.Notification.subscription_id == sub.id,
-            models.Notification.title == "Upcoming Payment",
-            models.Notification.is_read == False
-        ).first()
-
-        if not existing:
-            days_until = (sub.next_billing_date - today).days
-            notification = models.Notification(
-                title="Upcoming Payment",
-                message=f"{sub.name} - £{sub.amount:.2f} due in {days_until} day{'s' if days_until != 1 else ''}",
-                type="warning",
-                subscription_id=sub.id
-            )
-            db.add(notification)
-
-    db.commit()
+# Request latency and query counts per route, served on GET /metrics
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 # Category endpoints
@@ -237,6 +112,7 @@ def create_category(category: schemas.CategoryCreate, db: Session = Depends(get_
     db.add(db_category)
     db.commit()
     db.refresh(db_category)
+    lookups.invalidate()
     return db_category
 
 
@@ -257,11 +133,93 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
             detail=f"Cannot delete category. It is used by {subscription_count} subscription(s)"
         )
 
+    # Its keyword rules go with it
     db.delete(category)
     db.commit()
+    lookups.invalidate()
+    categorizer.invalidate()
     return {"message": "Category deleted successfully"}
 
 
+# Category rule endpoints
+@app.get("/api/category-rules", response_model=List[schemas.CategoryRule])
+def get_category_rules(db: Session = Depends(get_db)):
+    return db.query(models.CategoryRule).options(
+        joinedload(models.CategoryRule.category)
+    ).order_by(models.CategoryRule.priority.desc(), models.CategoryRule.keyword).all()
+
+
+# Helper function to validate a rule's keyword and category before saving it
+def check_category_rule(db: Session, keyword: str, category_id: int, rule_id: int = None):
+    keyword = keyword.strip().lower()
+    if not keyword:
+        raise HTTPException(status_code=400, detail="Keyword must not be empty")
+
+    existing = db.query(models.CategoryRule).filter(models.CategoryRule.keyword == keyword).first()
+    if existing and existing.id != rule_id:
+        raise HTTPException(status_code=400, detail=f"A rule for '{keyword}' already exists")
+
+    if not db.query(models.Category).filter(models.Category.id == category_id).first():
+        raise HTTPException(status_code=400, detail=f"Category {category_id} does not exist")
+    return keyword
+
+
+@app.post("/api/category-rules", response_model=schemas.CategoryRule)
+def create_category_rule(rule: schemas.CategoryRuleCreate, db: Session = Depends(get_db)):
+    keyword = check_category_rule(db, rule.keyword, rule.category_id)
+    db_rule = models.CategoryRule(keyword=keyword, category_id=rule.category_id, priority=rule.priority)
+    db.add(db_rule)
+    db.commit()
+    db.refresh(db_rule)
+    categorizer.invalidate()
+    return db_rule
+
+
+@app.put("/api/category-rules/{rule_id}", response_model=schemas.CategoryRule)
+def update_category_rule(rule_id: int, rule: schemas.CategoryRuleUpdate, db: Session = Depends(get_db)):
+    db_rule = db.query(models.CategoryRule).filter(models.CategoryRule.id == rule_id).first()
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Category rule not found")
+
+    update_data = rule.model_dump(exclude_unset=True)
+    update_data["keyword"] = check_category_rule(
+        db,
+        update_data.get("keyword") or db_rule.keyword,
+        update_data.get("category_id") or db_rule.category_id,
+        rule_id
+    )
+    for key, value in update_data.items():
+        if value is not None:
+            setattr(db_rule, key, value)
+
+    db.commit()
+    db.refresh(db_rule)
+    categorizer.invalidate()
+    return db_rule
+
+
+@app.delete("/api/category-rules/{rule_id}")
+def delete_category_rule(rule_id: int, db: Session = Depends(get_db)):
+    db_rule = db.query(models.CategoryRule).filter(models.CategoryRule.id == rule_id).first()
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Category rule not found")
+
+    db.delete(db_rule)
+    db.commit()
+    categorizer.invalidate()
+    return {"message": "Category rule deleted successfully"}
+
+
+@app.post("/api/category-rules/classify", response_model=List[schemas.CategoryMatch])
+def classify_merchants(request: schemas.CategoryClassifyRequest, db: Session = Depends(get_db)):
+    """Preview which category the current rules give each merchant name"""
+    matches = categorizer.classify(db, request.merchants)
+    return [
+        schemas.CategoryMatch(merchant=merchant, category_id=matches[merchant])
+        for merchant in request.merchants
+    ]
+
+
 # Payment Method endpoints
 @app.get("/api/payment-methods", response_model=List[schemas.PaymentMethod])
 def get_payment_methods(db: Session = Depends(get_db)):
@@ -279,6 +237,7 @@ def create_payment_method(payment_method: schemas.PaymentMethodCreate, db: Sessi
     db.add(db_payment_method)
     db.commit()
     db.refresh(db_payment_method)
+    lookups.invalidate()
     return db_payment_method
 
 
@@ -307,6 +266,7 @@ def delete_payment_method(payment_method_id: int, db: Session = Depends(get_db))
 
     db.delete(payment_method)
     db.commit()
+    lookups.invalidate()
     return {"message": "Payment method deleted successfully"}
 
 
@@ -318,7 +278,11 @@ def get_subscriptions(
     limit: int = 100,
     db: Session = Depends(get_db)
 ):
-    query = db.query(models.Subscription)
+    # Nested category/payment_method are loaded in the same query, not one SELECT per row
+    query = db.query(models.Subscription).options(
+        joinedload(models.Subscription.category),
+        joinedload(models.Subscription.payment_method)
+    )
     if is_active is not None:
         query = query.filter(models.Subscription.is_active == is_active)
     return query.offset(skip).limit(limit).all()
@@ -326,7 +290,10 @@ def get_subscriptions(
 
 @app.get("/api/subscriptions/{subscription_id}", response_model=schemas.Subscription)
 def get_subscription(subscription_id: int, db: Session = Depends(get_db)):
-    subscription = db.query(models.Subscription).filter(
+    subscription = db.query(models.Subscription).options(
+        joinedload(models.Subscription.category),
+        joinedload(models.Subscription.payment_method)
+    ).filter(
         models.Subscription.id == subscription_id
     ).first()
     if not subscription:
@@ -334,9 +301,22 @@ def get_subscription(subscription_id: int, db: Session = Depends(get_db)):
     return subscription
 
 
+# Helper function to key a subscription name, rejecting a merchant that already has one
+def check_merchant_key(db: Session, name: str, subscription_id: int = None):
+    key = merchants.merchant_key(db, name)
+    existing = db.query(models.Subscription).filter(models.Subscription.merchant_key == key).first()
+    if existing and existing.id != subscription_id:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Subscription '{existing.name}' already exists for this merchant"
+        )
+    return key
+
+
 @app.post("/api/subscriptions", response_model=schemas.Subscription)
 def create_subscription(subscription: schemas.SubscriptionCreate, db: Session = Depends(get_db)):
-    db_subscription = models.Subscription(**subscription.model_dump())
+    key = check_merchant_key(db, subscription.name)
+    db_subscription = models.Subscription(**subscription.model_dump(), merchant_key=key)
     db.add(db_subscription)
     db.commit()
     db.refresh(db_subscription)
@@ -348,11 +328,26 @@ def create_subscription(subscription: schemas.SubscriptionCreate, db: Session =
         description=f"{db_subscription.name} - {db_subscription.billing_cycle} subscription",
         amount=-abs(db_subscription.amount),  # Negative for expense
         currency=db_subscription.currency,
+        base_amount=fx.rates(db).convert(
+            -abs(db_subscription.amount), db_subscription.currency, fx.BASE_CURRENCY, db_subscription.start_date
+        ),
         merchant=db_subscription.name,
+        merchant_key=key,
         payment_method_id=db_subscription.payment_method_id,
         is_matched=True
     )
     db.add(transaction)
+    db.flush()
+    rollups.refresh_dates(db, [transaction.date])
+
+    # The charge counts towards its merchant's stats like an imported one
+    detection.update_merchant_stats(db, pd.DataFrame([{
+        'id': transaction.id, 'date': transaction.date, 'amount': transaction.amount,
+        'currency': transaction.currency, 'merchant': transaction.merchant, 'merchant_key': key,
+    }]))
+    db.query(models.MerchantStats).filter(
+        models.MerchantStats.merchant_key == key
+    ).update({"subscription_id": db_subscription.id})
     db.commit()
 
     return db_subscription
@@ -371,9 +366,24 @@ def update_subscription(
         raise HTTPException(status_code=404, detail="Subscription not found")
 
     update_data = subscription.model_dump(exclude_unset=True)
+    if update_data.get("name"):
+        update_data["merchant_key"] = check_merchant_key(db, update_data["name"], subscription_id)
+        # Detection tracks the subscription by its merchant's stats row, so move the link to the new key
+        if update_data["merchant_key"] != db_subscription.merchant_key:
+            db.query(models.MerchantStats).filter(
+                models.MerchantStats.subscription_id == subscription_id
+            ).update({"subscription_id": None})
+            db.query(models.MerchantStats).filter(
+                models.MerchantStats.merchant_key == update_data["merchant_key"]
+            ).update({"subscription_id": subscription_id})
     for key, value in update_data.items():
         setattr(db_subscription, key, value)
 
+    # Its transactions move to the new category in the rollup
+    if "category_id" in update_data:
+        db.flush()
+        rollups.refresh_months(db, rollups.subscription_months(db, subscription_id))
+
     db.commit()
     db.refresh(db_subscription)
     return db_subscription
@@ -387,117 +397,569 @@ def delete_subscription(subscription_id: int, db: Session = Depends(get_db)):
     if not db_subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
 
+    # Let detection pick the merchant up again
+    db.query(models.MerchantStats).filter(
+        models.MerchantStats.subscription_id == subscription_id
+    ).update({"subscription_id": None})
+
+    # Deleting unlinks its transactions, so find their months first
+    months = rollups.subscription_months(db, subscription_id)
     db.delete(db_subscription)
+    db.flush()
+    rollups.refresh_months(db, months)
     db.commit()
     return {"message": "Subscription deleted successfully"}
 
 
+# Helper functions for opaque (date, id) pagination cursors
+def _encode_cursor(payload: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, parse):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return parse(json.loads(base64.urlsafe_b64decode(padded.encode())))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_cursor(transaction: models.Transaction) -> str:
+    return _encode_cursor({"d": transaction.date.isoformat(), "i": transaction.id})
+
+
+def decode_cursor(cursor: str):
+    return _decode_cursor(cursor, lambda payload: (date.fromisoformat(payload["d"]), int(payload["i"])))
+
+
+def encode_notification_cursor(notification: models.Notification) -> str:
+    return _encode_cursor({"t": notification.created_at.isoformat(), "i": notification.id})
+
+
+def decode_notification_cursor(cursor: str):
+    return _decode_cursor(cursor, lambda payload: (datetime.fromisoformat(payload["t"]), int(payload["i"])))
+
+
 # Transaction endpoints
 @app.get("/api/transactions", response_model=List[schemas.Transaction])
 def get_transactions(
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    merchant: Optional[str] = None,
+    payment_method_id: Optional[int] = None,
+    subscription_id: Optional[int] = None,
+    is_matched: Optional[bool] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
     db: Session = Depends(get_db)
 ):
-    return db.query(models.Transaction).order_by(
-        models.Transaction.date.desc()
-    ).offset(skip).limit(limit).all()
+    """
+    List transactions newest first. Pass the X-Next-Cursor header of one page as
+    cursor to fetch the next; cursor pages cost the same at any depth, unlike skip.
+    """
+    query = db.query(models.Transaction).options(
+        joinedload(models.Transaction.payment_method)
+    )
+
+    if date_from is not None:
+        query = query.filter(models.Transaction.date >= date_from)
+    if date_to is not None:
+        query = query.filter(models.Transaction.date <= date_to)
+    if merchant is not None:
+        query = query.filter(models.Transaction.merchant == merchant)
+    if payment_method_id is not None:
+        query = query.filter(models.Transaction.payment_method_id == payment_method_id)
+    if subscription_id is not None:
+        query = query.filter(models.Transaction.subscription_id == subscription_id)
+    if is_matched is not None:
+        query = query.filter(models.Transaction.is_matched == is_matched)
+    if min_amount is not None:
+        query = query.filter(models.Transaction.amount >= min_amount)
+    if max_amount is not None:
+        query = query.filter(models.Transaction.amount <= max_amount)
+
+    if cursor:
+        # Seek past the last row of the previous page instead of counting off skip rows
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.filter(
+            models.Transaction.date <= cursor_date,
+            or_(models.Transaction.date < cursor_date, models.Transaction.id < cursor_id)
+        )
+    elif skip:
+        query = query.offset(skip)
+
+    transactions = query.order_by(
+        models.Transaction.date.desc(), models.Transaction.id.desc()
+    ).limit(limit).all()
+
+    if len(transactions) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(transactions[-1])
+    return transactions
+
+
+@app.get("/api/transactions/{transaction_id}", response_model=schemas.TransactionDetail)
+def get_transaction(transaction_id: int, db: Session = Depends(get_db)):
+    """One transaction with its original CSV row, which the list endpoint leaves out"""
+    transaction = db.query(models.Transaction).options(
+        joinedload(models.Transaction.payment_method),
+        joinedload(models.Transaction.raw_batch),
+        undefer(models.Transaction.raw_data),
+        undefer(models.Transaction.raw_values)
+    ).filter(models.Transaction.id == transaction_id).first()
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    return transaction
+
+
+# Helper function to insert one DataFrame of statement rows
+def import_transactions_frame(df: pd.DataFrame, db: Session, occurrences: dict = None, before_commit=None):
+    """
+    Normalize and bulk insert a DataFrame of CSV rows. Returns the new transactions
+    as a DataFrame and the number of rows skipped as already imported.
+    """
+    # Normalize the whole frame at once (dates, merchants, currencies, raw_data, fingerprints)
+    with metrics.span("import.prepare"):
+        frame = importer.prepare_transactions(df, occurrences)
+    with metrics.span("import.write"):
+        return write_transactions_frame(frame, db, before_commit)
+
+
+# Helper function to insert transactions already normalized by importer.prepare_transactions;
+# before_commit(inserted, duplicates) can add its own writes to the same transaction
+def write_transactions_frame(frame: pd.DataFrame, db: Session, before_commit=None):
+    # Workers only normalize merchant names; aliases and exchange rates live in the database
+    frame = frame.assign(
+        merchant_key=merchants.apply_aliases(db, frame['merchant_key']),
+        base_amount=fx.rates(db).to_base(frame['amount'], frame['currency'], frame['date']),
+    )
+
+    # Resolve all distinct payment methods in one batch
+    payment_method_ids = lookups.resolve_payment_methods(db, frame['payment_method'].dropna().unique())
+
+    # Bulk insert; rows whose fingerprint is already stored are skipped
+    imported_transactions = importer.insert_transactions(db, frame, payment_method_ids)
+    # Merchant stats and rollups commit with the rows they count, so a failure in
+    # detection afterwards can't leave them behind
+    detection.update_merchant_stats(db, imported_transactions)
+    rollups.refresh_dates(db, imported_transactions['date'])
+    duplicates = len(frame) - len(imported_transactions)
+    if before_commit:
+        before_commit(imported_transactions, duplicates)
+    db.commit()
+    return imported_transactions, duplicates
+
+
+# Helper function to describe an earlier import of the same bytes, if there was one
+def previous_import(db: Session, content_hash: str):
+    previous = importer.find_imported_file(db, content_hash)
+    if previous is None:
+        return None
+    return f"This file was already imported as '{previous.filename}' on {previous.imported_at:%Y-%m-%d %H:%M}"
+
+
+# Helper function to turn away a byte-identical re-upload before it is parsed
+def check_new_file(db: Session, content_hash: str):
+    error = previous_import(db, content_hash)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+
+
+# Helper function to import a CSV chunk by chunk
+def import_csv_stream(
+    fileobj, db: Session, chunk_rows: int, resume_from: int = 0, on_progress=None,
+    filename: str = None, content_hash: str = None
+):
+    """
+    Import a CSV in fixed-size chunks, committing each one before reading the next.
+    Only one chunk is held in memory at a time. If a chunk fails, everything before
+    it stays committed and the error says which row to pass as resume_from.
+    on_progress(rows_read, rows_committed, subscriptions_detected, timings) is called
+    inside each chunk's transaction, so it may write to db without committing.
+    A content_hash is recorded once the whole file has been imported.
+    """
+    started = time.perf_counter()
+    timings = {"read": 0.0, "insert": 0.0, "detection": 0.0, "notifications": 0.0}
+    rows_read = resume_from
+    imported_count = 0
+    duplicate_count = 0
+    subscriptions_detected = 0
+    chunks = 0
+
+    try:
+        # Identical rows are numbered across the whole file, so count the skipped ones first
+        with metrics.span("import.read", timings):
+            occurrences = importer.count_occurrences(fileobj, resume_from, chunk_rows)
+        # Closed on the way out, so pandas' reader is done with fileobj before the caller closes it
+        with closing(importer.iter_csv_chunks(fileobj, chunk_rows, skip_rows=resume_from)) as chunk_iter:
+            while True:
+                with metrics.span("import.read", timings):
+                    df = next(chunk_iter, None)
+                if df is None:
+                    break
+
+                if chunks == 0 and not all(col in df.columns for col in importer.REQUIRED_COLUMNS):
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"CSV must contain columns: {', '.join(importer.REQUIRED_COLUMNS)}"
+                    )
+
+                # Progress is recorded in the chunk's own transaction, so a failure in
+                # detection or a crash never makes a resume insert its rows a second time
+                def record_chunk(inserted, duplicates):
+                    if on_progress:
+                        on_progress(
+                            rows_read=rows_read + len(df),
+                            rows_committed=imported_count + len(inserted),
+                            subscriptions_detected=subscriptions_detected,
+                            timings=timings
+                        )
+
+                with metrics.span("import.insert", timings):
+                    imported_transactions, duplicates = import_transactions_frame(df, db, occurrences, record_chunk)
+                rows_read += len(df)
+                imported_count += len(imported_transactions)
+                duplicate_count += duplicates
+                chunks += 1
+
+                with metrics.span("import.detection", timings):
+                    new_subs = detection.detect_and_create_subscriptions(imported_transactions, db)
+                subscriptions_detected += len(new_subs)
+
+                if on_progress and new_subs:
+                    on_progress(
+                        rows_read=rows_read,
+                        rows_committed=imported_count,
+                        subscriptions_detected=subscriptions_detected,
+                        timings=timings
+                    )
+                    db.commit()
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=(
+                f"Error processing CSV after {imported_count} transactions were committed: {str(e)}. "
+                f"Re-upload with resume_from={rows_read} to continue"
+            )
+        )
+
+    with metrics.span("import.notifications", timings):
+        notifications.generate_notifications(db)
+
+    if content_hash:
+        importer.record_imported_file(db, content_hash, filename, imported_count, duplicate_count)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "message": (
+            f"Successfully imported {imported_count} transactions ({duplicate_count} duplicates skipped) "
+            f"and detected {subscriptions_detected} subscriptions"
+        ),
+        "count": imported_count,
+        "duplicates": duplicate_count,
+        "subscriptions_detected": subscriptions_detected,
+        "chunks": chunks,
+        "rows_read": rows_read,
+        "rows_per_second": round(imported_count / elapsed, 1) if elapsed > 0 else None,
+        "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    }
+
+
+# Helper function to import many statements at once
+def import_batch(uploads, db: Session):
+    """
+    Parse (filename, bytes) statements in the process pool and insert each one from
+    this thread as soon as it is ready, so SQLite only ever sees a single writer.
+    Statements already imported byte for byte are skipped without being parsed.
+    Subscription detection runs once over everything that was inserted.
+    """
+    started = time.perf_counter()
+    timings = {"parse_wait": 0.0, "insert": 0.0, "detection": 0.0, "notifications": 0.0}
+    files = []
+    inserted = []
+
+    try:
+        pool = importer.get_parse_pool()
+        futures = {}
+        queued = set()
+        for name, data in importer.expand_uploads(uploads):
+            content_hash = hashlib.sha256(data).hexdigest()
+            error = previous_import(db, content_hash)
+            if error is None and content_hash in queued:
+                error = "This file appears more than once in the batch"
+            if error:
+                files.append({"filename": name, "rows_read": 0, "count": 0, "duplicates": 0, "error": error})
+                continue
+            queued.add(content_hash)
+            futures[pool.submit(importer.parse_statement, name, data)] = content_hash
+
+        completed = as_completed(futures)
+        while True:
+            with metrics.span("import.parse_wait", timings):
+                future = next(completed, None)
+            if future is None:
+                break
+            result = future.result()
+
+            count = duplicates = 0
+            if result["error"] is None:
+                with metrics.span("import.insert", timings):
+                    imported_transactions, duplicates = write_transactions_frame(result["frame"], db)
+                    inserted.append(imported_transactions)
+                    count = len(imported_transactions)
+                    importer.record_imported_file(db, futures[future], result["filename"], count, duplicates)
+
+            files.append({
+                "filename": result["filename"],
+                "rows_read": result["rows_read"],
+                "count": count,
+                "duplicates": duplicates,
+                "error": result["error"]
+            })
+
+        with metrics.span("import.detection", timings):
+            new_subs = detection.detect_and_create_subscriptions(pd.concat(inserted), db) if inserted else []
+
+    except Exception as e:
+        db.rollback()
+        committed = sum(len(frame) for frame in inserted)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing batch after {committed} transactions were committed: {str(e)}"
+        )
+
+    with metrics.span("import.notifications", timings):
+        notifications.generate_notifications(db)
+
+    imported_count = sum(item["count"] for item in files)
+    duplicate_count = sum(item["duplicates"] for item in files)
+    elapsed = time.perf_counter() - started
+    return {
+        "message": (
+            f"Successfully imported {imported_count} transactions ({duplicate_count} duplicates skipped) "
+            f"from {len(inserted)} files and detected {len(new_subs)} subscriptions"
+        ),
+        "count": imported_count,
+        "duplicates": duplicate_count,
+        "subscriptions_detected": len(new_subs),
+        "files": sorted(files, key=lambda item: item["filename"]),
+        "rows_per_second": round(imported_count / elapsed, 1) if elapsed > 0 else None,
+        "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    }
+
+
+# Background worker body for queued imports
+def run_import_job(job_id: str):
+    """Run a queued import job to completion, recording progress on the job row"""
+    db = SessionLocal()
+    try:
+        job = db.query(models.ImportJob).filter(models.ImportJob.id == job_id).first()
+        if not job or job.state not in ("queued", "running"):
+            return
+
+        # A job found in the running state was interrupted by a restart; its
+        # committed chunks are kept and it picks up from the next row
+        base_committed = job.rows_committed or 0
+        base_detected = job.subscriptions_detected or 0
+        job.state = "running"
+        job.started_at = job.started_at or datetime.utcnow()
+        db.commit()
+
+        # Called inside the import's transactions; the import commits it
+        def on_progress(rows_read, rows_committed, subscriptions_detected, timings):
+            job.rows_read = rows_read
+            job.rows_committed = base_committed + rows_committed
+            job.subscriptions_detected = base_detected + subscriptions_detected
+            job.timings = json.dumps(timings)
+
+        with open(job.file_path, 'rb') as f:
+            result = import_csv_stream(
+                f, db, job.chunk_rows, job.rows_read or 0, on_progress,
+                filename=job.filename, content_hash=job.content_hash
+            )
+
+        job.rows_read = result["rows_read"]
+        job.timings = json.dumps(result["timings"])
+        job.state = "completed"
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        jobs.remove_upload(job.file_path)
+
+    except Exception as e:
+        db.rollback()
+        job = db.query(models.ImportJob).filter(models.ImportJob.id == job_id).first()
+        if job:
+            job.state = "failed"
+            job.error = e.detail if isinstance(e, HTTPException) else str(e)
+            job.finished_at = datetime.utcnow()
+            db.commit()
+    finally:
+        db.close()
+
+
+import_jobs = jobs.ImportJobQueue(run_import_job)
+notification_scheduler = notifications.NotificationScheduler()
 
 
 @app.post("/api/transactions/import")
-async def import_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def import_csv(
+    response: Response,
+    file: UploadFile = File(...),
+    stream: bool = False,
+    background: bool = False,
+    chunk_rows: int = importer.CHUNK_ROWS,
+    resume_from: int = 0,
+    db: Session = Depends(get_db)
+):
     """
     Import transactions from CSV file and auto-detect subscriptions.
     Expected CSV columns: date, description, amount
     Optional columns: merchant, currency
+    Pass stream=true to import very large files in chunks of chunk_rows rows, or
+    background=true to queue the import and poll GET /api/imports/{job_id}.
+    Rows already in the database are skipped and counted as duplicates; a file
+    that was already imported byte for byte is rejected before it is parsed.
     """
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
 
+    # Hashing, parsing, inserting and detection are blocking; run them in the threadpool
+    # so the event loop keeps serving other requests during a large import
+    content_hash = await run_in_threadpool(importer.file_hash, file.file)
+    if resume_from == 0:
+        await run_in_threadpool(check_new_file, db, content_hash)
+
+    if background:
+        job = await run_in_threadpool(jobs.create_job, db, file, chunk_rows, content_hash)
+        import_jobs.submit(job.id)
+        response.status_code = 202
+        return {
+            "message": "Import queued",
+            "job_id": job.id,
+            "state": job.state
+        }
+
+    if stream:
+        return await run_in_threadpool(
+            import_csv_stream, file.file, db, chunk_rows, resume_from,
+            filename=file.filename, content_hash=content_hash
+        )
+
+    contents = await file.read()
+    return await run_in_threadpool(import_csv_contents, contents, db, file.filename, content_hash)
+
+
+def import_csv_contents(contents: bytes, db: Session, filename: str = None, content_hash: str = None):
+    """Import a whole CSV file held in memory; the non-streaming path of import_csv"""
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
+        with metrics.span("import.read"):
+            df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
 
         # Validate required columns
-        required_cols = ['date', 'description', 'amount']
+        required_cols = importer.REQUIRED_COLUMNS
         if not all(col in df.columns for col in required_cols):
             raise HTTPException(
                 status_code=400,
                 detail=f"CSV must contain columns: {', '.join(required_cols)}"
             )
 
-        imported_transactions = []
-        imported_count = 0
-
-        for _, row in df.iterrows():
-            # Parse date
-            try:
-                transaction_date = pd.to_datetime(row['date']).date()
-            except:
-                continue  # Skip invalid dates
-
-            # Extract merchant from description or use merchant column
-            merchant = None
-            if 'merchant' in row and pd.notna(row['merchant']):
-                merchant = str(row['merchant'])
-            else:
-                # Try to extract merchant from description
-                merchant = str(row['description']).split()[0]  # First word as merchant
-
-            # Extract payment method if provided
-            payment_method_id = None
-            if 'payment_method' in row and pd.notna(row['payment_method']):
-                payment_method_name = str(row['payment_method'])
-                payment_method = get_or_create_payment_method(payment_method_name, db)
-                payment_method_id = payment_method.id
-
-            # Create transaction
-            transaction = models.Transaction(
-                date=transaction_date,
-                description=str(row['description']),
-                amount=float(row['amount']),
-                currency=str(row.get('currency', 'GBP')),
-                merchant=merchant,
-                payment_method_id=payment_method_id,
-                raw_data=json.dumps(row.to_dict()),
-                is_matched=False
-            )
-            db.add(transaction)
-            imported_transactions.append(transaction)
-            imported_count += 1
-
-        db.commit()
-
-        # Refresh all transactions to get IDs
-        for trans in imported_transactions:
-            db.refresh(trans)
+        started = time.perf_counter()
+        with metrics.span("import.insert"):
+            imported_transactions, duplicate_count = import_transactions_frame(df, db)
+        imported_count = len(imported_transactions)
+        elapsed = time.perf_counter() - started
 
         # Detect and create subscriptions
-        new_subs = detect_and_create_subscriptions(imported_transactions, db)
+        with metrics.span("import.detection"):
+            new_subs = detection.detect_and_create_subscriptions(imported_transactions, db)
 
         # Generate notifications
-        generate_notifications(db)
+        with metrics.span("import.notifications"):
+            notifications.generate_notifications(db)
+
+        if content_hash:
+            importer.record_imported_file(db, content_hash, filename, imported_count, duplicate_count)
 
         return {
-            "message": f"Successfully imported {imported_count} transactions and detected {len(new_subs)} subscriptions",
+            "message": (
+                f"Successfully imported {imported_count} transactions ({duplicate_count} duplicates skipped) "
+                f"and detected {len(new_subs)} subscriptions"
+            ),
             "count": imported_count,
-            "subscriptions_detected": len(new_subs)
+            "duplicates": duplicate_count,
+            "subscriptions_detected": len(new_subs),
+            "rows_per_second": round(imported_count / elapsed, 1) if elapsed > 0 else None
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
 
 
+@app.post("/api/transactions/import/batch")
+async def import_csv_batch(
+    files: List[UploadFile] = File(...),
+    db: Session = Depends(get_db)
+):
+    """
+    Import many CSV statements at once, e.g. one per card, uploaded as separate
+    files and/or zip archives of CSVs. Files are parsed in parallel worker processes;
+    a file that fails to parse is reported in the response without stopping the rest.
+    """
+    uploads = [(file.filename, await file.read()) for file in files]
+    return await run_in_threadpool(import_batch, uploads, db)
+
+
+# Import job endpoints
+@app.get("/api/imports/{job_id}", response_model=schemas.ImportJob)
+def get_import_job(job_id: str, db: Session = Depends(get_db)):
+    job = db.query(models.ImportJob).filter(models.ImportJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
 # Notification endpoints
 @app.get("/api/notifications", response_model=List[schemas.Notification])
-def get_notifications(
+async def get_notifications(
+    response: Response,
     unread_only: bool = False,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    query = db.query(models.Notification).order_by(models.Notification.created_at.desc())
+    """
+    List notifications newest first. Pass the X-Next-Cursor header of one page as
+    cursor to fetch the next. With since_id, list only notifications created after
+    it, oldest first, so the last id of one delta is the since_id of the next.
+    """
+    notification = models.Notification
+    query = select(notification)
     if unread_only:
-        query = query.filter(models.Notification.is_read == False)
-    return query.all()
+        query = query.where(notification.is_read == False)
+
+    if since_id is not None:
+        query = query.where(notification.id > since_id).order_by(notification.id)
+    else:
+        if cursor:
+            cursor_created_at, cursor_id = decode_notification_cursor(cursor)
+            query = query.where(
+                notification.created_at <= cursor_created_at,
+                or_(notification.created_at < cursor_created_at, notification.id < cursor_id)
+            )
+        query = query.order_by(notification.created_at.desc(), notification.id.desc())
+
+    page = (await db.scalars(query.limit(limit))).all()
+    if since_id is None and len(page) == limit:
+        response.headers["X-Next-Cursor"] = encode_notification_cursor(page[-1])
+    return page
 
 
 @app.put("/api/notifications/{notification_id}/read")
@@ -520,71 +982,147 @@ def mark_all_notifications_read(db: Session = Depends(get_db)):
     return {"message": "All notifications marked as read"}
 
 
-# Analytics endpoints
+# Helper function to check a requested reporting currency against the loaded exchange rates
+def reporting_currency(fx_rates: fx.FxRates, currency: Optional[str]) -> str:
+    currency = (currency or fx.BASE_CURRENCY).strip().upper()
+    if currency not in fx_rates.currencies():
+        raise HTTPException(
+            status_code=400,
+            detail=f"No exchange rates for {currency}; load them with `python fx.py load <csv>`"
+        )
+    return currency
+
+
+# Event stream endpoint
+@app.get("/api/events")
+async def stream_events(request: Request, since_id: Optional[int] = None, db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Server-Sent Events: "notification" for each new notification (with its id as
+    the event id), "changed" with the tables a commit wrote, and "resync" when the
+    client fell behind and should reload everything. A reconnecting EventSource
+    sends Last-Event-ID, and the notifications it missed are replayed first.
+    """
+    if since_id is None and request.headers.get("last-event-id", "").isdigit():
+        since_id = int(request.headers["last-event-id"])
+
+    # Subscribe before reading the backlog, so nothing created in between is missed
+    try:
+        subscriber = events.broker.subscribe()
+    except events.TooManySubscribers as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        replay = []
+        if since_id is not None:
+            missed = (await db.scalars(
+                select(models.Notification).where(models.Notification.id > since_id)
+                .order_by(models.Notification.id).limit(events.EVENT_QUEUE_SIZE + 1)
+            )).all()
+            replay = [events.notification_event(notification) for notification in missed[:events.EVENT_QUEUE_SIZE]]
+            if len(missed) > events.EVENT_QUEUE_SIZE:
+                replay = [{"event": "resync", "data": {}, "id": None}]
+    except Exception:
+        events.broker.unsubscribe(subscriber)
+        raise
+
+    return StreamingResponse(
+        events.stream(subscriber, replay, since_id or 0),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Analytics endpoints; totals are summed in the base currency and reported in
+# currency (default BASE_CURRENCY) at the rate on the last day of each period
 @app.get("/api/analytics/dashboard", response_model=schemas.DashboardStats)
-def get_dashboard_stats(db: Session = Depends(get_db)):
-    # Generate fresh notifications
-    generate_notifications(db)
+async def get_dashboard_stats(
+    request: Request, currency: Optional[str] = None, db: AsyncSession = Depends(get_async_read_db)
+):
+    return await cache.cached_json(request, lambda: dashboard_stats(db, currency))
+
+
+async def dashboard_stats(db: AsyncSession, currency: Optional[str] = None):
+    # Read-only: upcoming-payment notifications come from the scheduler and imports
+    fx_rates = await db.run_sync(fx.rates)
+    currency = reporting_currency(fx_rates, currency)
 
     # Active subscriptions count
-    active_count = db.query(models.Subscription).filter(
-        models.Subscription.is_active == True
-    ).count()
+    active_count = await db.scalar(
+        select(func.count(models.Subscription.id)).where(models.Subscription.is_active == True)
+    )
 
     # Get current month's spend
     today = date.today()
     current_month_start = today.replace(day=1)
-    next_month = current_month_start + relativedelta(months=1)
 
-    monthly_transactions = db.query(func.sum(models.Transaction.amount)).filter(
-        models.Transaction.date >= current_month_start,
-        models.Transaction.date < next_month
-    ).scalar() or 0.0
+    rollup = models.MonthlySpendRollup
+    monthly_transactions, monthly_unconverted = (await db.execute(
+        select(
+            func.sum(rollup.base_total),
+            func.sum(case((rollup.base_total.is_(None), rollup.transaction_count), else_=0))
+        ).where(rollup.year == current_month_start.year, rollup.month == current_month_start.month)
+    )).one()
 
     # Get yearly spend (last 12 months)
     year_ago = today - relativedelta(months=12)
-    yearly_transactions = db.query(func.sum(models.Transaction.amount)).filter(
-        models.Transaction.date >= year_ago
-    ).scalar() or 0.0
-
-    # Category breakdown
-    category_stats = db.query(
-        models.Category.name,
-        models.Category.color,
-        func.sum(models.Subscription.amount).label('total')
-    ).join(
-        models.Subscription, models.Subscription.category_id == models.Category.id
-    ).filter(
-        models.Subscription.is_active == True
-    ).group_by(models.Category.id).all()
-
-    total_category_spend = sum(stat.total for stat in category_stats) if category_stats else 1
+    yearly = await db.run_sync(rollups.spend_since, year_ago)
+    yearly_transactions = sum(total for total, _, _ in yearly)
+    yearly_unconverted = sum(unconverted for _, _, unconverted in yearly)
+
+    # Category breakdown; subscription amounts are converted at today's rates, and
+    # those in a currency without rates are left out
+    category_rows = (await db.execute(
+        select(
+            models.Category.id,
+            models.Category.name,
+            models.Category.color,
+            models.Subscription.currency,
+            func.sum(models.Subscription.amount).label('total')
+        ).join(
+            models.Subscription, models.Subscription.category_id == models.Category.id
+        ).where(
+            models.Subscription.is_active == True
+        ).group_by(models.Category.id, models.Subscription.currency)
+    )).all()
+
+    category_totals = {}
+    for row in category_rows:
+        converted = fx_rates.convert(row.total, row.currency, currency, today)
+        name, color, total = category_totals.get(row.id, (row.name, row.color, 0.0))
+        category_totals[row.id] = (name, color, total + (converted or 0.0))
+
+    total_category_spend = sum(total for _, _, total in category_totals.values()) if category_totals else 1
 
     category_breakdown = [
         schemas.CategorySpend(
-            category_name=stat.name,
-            total=stat.total,
-            percentage=(stat.total / total_category_spend * 100) if total_category_spend > 0 else 0,
-            color=stat.color
+            category_name=name,
+            total=total,
+            percentage=(total / total_category_spend * 100) if total_category_spend > 0 else 0,
+            color=color
         )
-        for stat in category_stats
+        for name, color, total in category_totals.values()
     ]
 
     # Recent transactions
-    recent = db.query(models.Transaction).order_by(
-        models.Transaction.date.desc()
-    ).limit(10).all()
+    recent = (await db.scalars(
+        select(models.Transaction).options(
+            joinedload(models.Transaction.payment_method)
+        ).order_by(
+            models.Transaction.date.desc()
+        ).limit(10)
+    )).all()
 
     # Unread notifications count
-    notifications_count = db.query(models.Notification).filter(
-        models.Notification.is_read == False
-    ).count()
+    notifications_count = await db.scalar(
+        select(func.count(models.Notification.id)).where(models.Notification.is_read == False)
+    )
 
     return schemas.DashboardStats(
         active_subscriptions=active_count,
-        monthly_spend=abs(monthly_transactions),
-        yearly_spend=abs(yearly_transactions),
-        currency="GBP",
+        monthly_spend=abs(fx_rates.from_base(monthly_transactions or 0.0, currency, today)),
+        yearly_spend=abs(fx_rates.from_base(yearly_transactions, currency, today)),
+        currency=currency,
+        monthly_unconverted=monthly_unconverted or 0,
+        yearly_unconverted=yearly_unconverted,
         category_breakdown=category_breakdown,
         recent_transactions=recent,
         notifications_count=notifications_count
@@ -592,77 +1130,200 @@ def get_dashboard_stats(db: Session = Depends(get_db)):
 
 
 @app.get("/api/analytics/monthly", response_model=List[schemas.MonthlySpend])
-def get_monthly_spend(months: int = 12, db: Session = Depends(get_db)):
+async def get_monthly_spend(
+    request: Request, months: int = 12, currency: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
     """Get spend by month for the last N months"""
+    return await cache.cached_json(request, lambda: monthly_spend(months, db, currency))
+
+
+async def monthly_spend(months: int, db: AsyncSession, currency: Optional[str] = None):
+    fx_rates = await db.run_sync(fx.rates)
+    currency = reporting_currency(fx_rates, currency)
     today = date.today()
     start_date = today - relativedelta(months=months)
 
-    results = db.query(
-        extract('year', models.Transaction.date).label('year'),
-        extract('month', models.Transaction.date).label('month'),
-        func.sum(models.Transaction.amount).label('total')
-    ).filter(
-        models.Transaction.date >= start_date
-    ).group_by('year', 'month').order_by('year', 'month').all()
+    results = await db.run_sync(rollups.spend_since, start_date, group_by=('year', 'month'))
 
     monthly_data = []
-    for result in results:
-        month_str = f"{int(result.year)}-{int(result.month):02d}"
+    for year, month, total, _, unconverted in results:
+        month_str = f"{year}-{month:02d}"
         monthly_data.append(schemas.MonthlySpend(
             month=month_str,
-            total=abs(result.total),
-            currency="GBP"
+            total=abs(fx_rates.from_base(total or 0.0, currency, today)),
+            currency=currency,
+            unconverted=unconverted
         ))
 
     return monthly_data
 
 
 @app.get("/api/analytics/yearly", response_model=List[schemas.YearlySpend])
-def get_yearly_spend(db: Session = Depends(get_db)):
+async def get_yearly_spend(
+    request: Request, currency: Optional[str] = None, db: AsyncSession = Depends(get_async_read_db)
+):
     """Get spend by year"""
-    results = db.query(
-        extract('year', models.Transaction.date).label('year'),
-        func.sum(models.Transaction.amount).label('total')
-    ).group_by('year').order_by('year').all()
+    return await cache.cached_json(request, lambda: yearly_spend(db, currency))
+
+
+async def yearly_spend(db: AsyncSession, currency: Optional[str] = None):
+    fx_rates = await db.run_sync(fx.rates)
+    currency = reporting_currency(fx_rates, currency)
+    today = date.today()
+    rollup = models.MonthlySpendRollup
+    results = (await db.execute(
+        select(
+            rollup.year.label('year'),
+            func.sum(rollup.base_total).label('total'),
+            func.sum(case((rollup.base_total.is_(None), rollup.transaction_count), else_=0)).label('unconverted')
+        ).group_by('year').order_by('year')
+    )).all()
 
     return [
         schemas.YearlySpend(
             year=int(result.year),
-            total=abs(result.total),
-            currency="GBP"
+            total=abs(fx_rates.from_base(result.total or 0.0, currency, today)),
+            currency=currency,
+            unconverted=result.unconverted
         )
         for result in results
     ]
 
 
 @app.get("/api/analytics/by-payment-method")
-def get_spending_by_payment_method(db: Session = Depends(get_db)):
+async def get_spending_by_payment_method(
+    request: Request, currency: Optional[str] = None, db: AsyncSession = Depends(get_async_read_db)
+):
     """Get spending breakdown by payment method"""
-    # Get all transactions with payment methods
-    results = db.query(
-        models.PaymentMethod.id,
-        models.PaymentMethod.name,
-        func.sum(models.Transaction.amount).label('total'),
-        func.count(models.Transaction.id).label('transaction_count')
-    ).join(
-        models.Transaction, models.Transaction.payment_method_id == models.PaymentMethod.id
-    ).group_by(
-        models.PaymentMethod.id, models.PaymentMethod.name
-    ).all()
+    return await cache.cached_json(request, lambda: spending_by_payment_method(db, currency))
+
+
+async def spending_by_payment_method(db: AsyncSession, currency: Optional[str] = None):
+    fx_rates = await db.run_sync(fx.rates)
+    currency = reporting_currency(fx_rates, currency)
+    today = date.today()
+
+    # Get all transactions with payment methods, from the monthly rollup
+    results = (await db.execute(
+        select(
+            models.PaymentMethod.id,
+            models.PaymentMethod.name,
+            func.sum(models.MonthlySpendRollup.base_total).label('total'),
+            func.sum(models.MonthlySpendRollup.transaction_count).label('transaction_count'),
+            func.sum(case(
+                (models.MonthlySpendRollup.base_total.is_(None), models.MonthlySpendRollup.transaction_count),
+                else_=0
+            )).label('unconverted')
+        ).join(
+            models.MonthlySpendRollup, models.MonthlySpendRollup.payment_method_id == models.PaymentMethod.id
+        ).group_by(
+            models.PaymentMethod.id, models.PaymentMethod.name
+        )
+    )).all()
 
     payment_method_spending = []
     for result in results:
         payment_method_spending.append({
             "payment_method_id": result.id,
             "payment_method_name": result.name,
-            "total": abs(result.total),
+            "total": abs(fx_rates.from_base(result.total or 0.0, currency, today)),
             "transaction_count": result.transaction_count,
-            "currency": "GBP"
+            "unconverted": result.unconverted,
+            "currency": currency
         })
 
     return payment_method_spending
 
 
+@app.get("/api/analytics/forecast", response_model=schemas.Forecast)
+async def get_forecast(
+    request: Request,
+    bucket: str = "month",
+    months: int = 12,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    bills: bool = False,
+    currency: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Projected spend from active subscriptions, bucketed by day, week or month.
+    The horizon runs from date_from (default today) for months months, or to date_to.
+    Pass bills=true to list every projected bill as well.
+    """
+    return await cache.cached_json(
+        request, lambda: spend_forecast(db, bucket, months, date_from, date_to, bills, currency)
+    )
+
+
+async def spend_forecast(
+    db: AsyncSession, bucket: str, months: int, date_from: date, date_to: date, bills: bool,
+    currency: Optional[str] = None
+):
+    fx_rates = await db.run_sync(fx.rates)
+    currency = reporting_currency(fx_rates, currency)
+    if bucket not in forecast.BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(forecast.BUCKETS)}")
+    date_from = date_from or date.today()
+    date_to = date_to or date_from + relativedelta(months=months) - timedelta(days=1)
+    if date_to < date_from or (date_to - date_from).days > forecast.MAX_HORIZON_DAYS:
+        raise HTTPException(
+            status_code=400, detail=f"date_to must be after date_from and at most {forecast.MAX_HORIZON_DAYS} days later"
+        )
+
+    projected = forecast.in_currency(await db.run_sync(forecast.projection, date_from, date_to), fx_rates, currency)
+    totals = forecast.bucket_totals(projected, bucket)
+    return schemas.Forecast(
+        date_from=date_from,
+        date_to=date_to,
+        bucket=bucket,
+        currency=currency,
+        totals={currency: round(total, 2) for currency, total in projected.groupby('currency')['amount'].sum().items()},
+        buckets=totals.to_dict('records'),
+        bills=projected.assign(date=projected['date'].dt.date).to_dict('records') if bills else None
+    )
+
+
+@app.post("/api/analytics/query", response_model=schemas.AnalyticsQueryResult)
+def query_analytics(request: schemas.AnalyticsQuery, db: Session = Depends(get_db)):
+    """Group, filter and time-bucket transactions over the columnar analytics store"""
+    if not analytics_store.available():
+        raise HTTPException(status_code=503, detail="Columnar analytics needs pyarrow: pip install -r requirements-analytics.txt")
+
+    fx_rates = fx.rates(db)
+    currency = reporting_currency(fx_rates, request.currency)
+
+    # Bring changed months up to date first; unchanged months are not rewritten
+    analytics_store.sync(db)
+    try:
+        result = analytics_store.query(
+            **request.model_dump(exclude={'currency'}), names=analytics_store.dimension_names(db, request.group_by),
+            rate=fx_rates.rate(currency, date.today())
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**result, "currency": currency}
+
+
+@app.get("/api/analytics/cache-stats")
+def get_analytics_cache_stats():
+    """Hit/miss counters for the analytics response cache"""
+    return cache.analytics_cache.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Request, SQL and stage metrics in the Prometheus text exposition format"""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/metrics/slow-queries")
+def get_slow_queries():
+    """The slowest SQL statements since startup, with the request path that ran them"""
+    return metrics.slowest_queries()
+
+
 @app.get("/")
 def root():
     return {"message": "Subscription Tracker API"}
@@ -0,0 +1,192 @@
+"""
+Merchant keys: one normalized form per merchant, so "AMZN Mktp UK", "Amazon" and
+"AMAZON.CO.UK" all become "amazon" and match each other by plain equality.
+
+A key is built in two stages. The normalizer's steps (case folding, stripping
+domains, punctuation, reference numbers and company suffixes) are pure and run
+wherever statements are parsed, including worker processes. The alias table is then
+applied by the writer, which has the database at hand.
+
+Usage:
+    python merchants.py alias <name> <merchant>   # treat <name> as another name for <merchant>
+    python merchants.py rekey                     # recompute every stored key after alias changes
+"""
+import sys
+import threading
+import pandas as pd
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models
+
+# Aliases every new database starts with: normalized name -> merchant key
+DEFAULT_ALIASES = {
+    'amzn': 'amazon',
+    'amzn mktp': 'amazon',
+    'amazon mktp': 'amazon',
+    'amazon prime': 'amazon',
+    'msft': 'microsoft',
+    'disney plus': 'disney',
+    'disneyplus': 'disney',
+}
+
+
+def casefold(names: pd.Series) -> pd.Series:
+    return names.str.casefold()
+
+
+def strip_domains(names: pd.Series) -> pd.Series:
+    return names.str.replace(r'\.(?:co\.uk|com|net|org|io|co)\b', ' ', regex=True)
+
+
+def strip_punctuation(names: pd.Series) -> pd.Series:
+    return names.str.replace(r"[^\w\s]|_", ' ', regex=True)
+
+
+def strip_references(names: pd.Series) -> pd.Series:
+    # Trailing tokens with digits in them: card numbers, store numbers, order refs
+    return names.str.replace(r'(?:\s+\w*\d\w*)+\s*$', '', regex=True)
+
+
+def strip_suffixes(names: pd.Series) -> pd.Series:
+    return names.str.replace(r'(?:\s+(?:ltd|limited|plc|inc|llc|gmbh|uk|gb|eu))+\s*$', '', regex=True)
+
+
+def collapse_whitespace(names: pd.Series) -> pd.Series:
+    return names.str.replace(r'\s+', ' ', regex=True).str.strip()
+
+
+class MerchantNormalizer:
+    """
+    Applies a list of steps, each a function from a Series of names to a Series of
+    names, in order. Swap the steps, or the whole normalizer via set_normalizer(),
+    to change how merchants are keyed; run `python merchants.py rekey` afterwards.
+    """
+
+    def __init__(self, steps=None):
+        self.steps = list(steps) if steps is not None else [
+            casefold, strip_domains, strip_punctuation, strip_references, strip_suffixes, collapse_whitespace,
+        ]
+
+    def __call__(self, names: pd.Series) -> pd.Series:
+        keys = names.astype(object).where(names.notna(), '').astype(str)
+        for step in self.steps:
+            keys = step(keys)
+        # A name made only of noise keeps its case-folded self rather than becoming empty
+        fallback = names.astype(object).where(names.notna(), '').astype(str).str.casefold().str.strip()
+        keys = keys.where(keys != '', fallback)
+        return keys.where(keys != '', None)
+
+
+normalizer = MerchantNormalizer()
+
+_lock = threading.Lock()
+_aliases = None
+
+
+def set_normalizer(new_normalizer):
+    global normalizer
+    normalizer = new_normalizer
+
+
+def invalidate():
+    """Forget cached aliases; call after the merchant_aliases table changes"""
+    global _aliases
+    with _lock:
+        _aliases = None
+
+
+def get_aliases(db: Session) -> dict:
+    global _aliases
+    with _lock:
+        if _aliases is None:
+            _aliases = dict(db.execute(
+                select(models.MerchantAlias.alias, models.MerchantAlias.merchant_key)
+            ).all())
+        return _aliases
+
+
+def apply_aliases(db: Session, keys: pd.Series) -> pd.Series:
+    """Replace normalized names that are aliases with the key they stand for"""
+    aliases = get_aliases(db)
+    if not aliases:
+        return keys
+    return keys.map(lambda key: aliases.get(key, key))
+
+
+def merchant_keys(db: Session, names: pd.Series) -> pd.Series:
+    """Full merchant keys for a Series of raw names"""
+    return apply_aliases(db, normalizer(names))
+
+
+def merchant_key(db: Session, name: str):
+    """The merchant key for one raw name"""
+    return merchant_keys(db, pd.Series([name], dtype=object)).iloc[0]
+
+
+def add_alias(db: Session, name: str, merchant: str):
+    """Record name as another way of writing merchant; both are normalized first"""
+    alias, target = normalizer(pd.Series([name, merchant], dtype=object))
+    target = get_aliases(db).get(target, target)
+    stmt = insert(models.MerchantAlias).values(alias=alias, merchant_key=target)
+    db.execute(stmt.on_conflict_do_update(index_elements=['alias'], set_={'merchant_key': target}))
+    db.commit()
+    invalidate()
+    return alias, target
+
+
+def rekey(db: Session):
+    """
+    Recompute merchant_key on every transaction and subscription, one UPDATE per
+    distinct name, then rebuild the merchant stats that are keyed by it.
+    Subscriptions whose key is already taken by an older one keep no key.
+    """
+    import detection
+
+    names = pd.Series(db.scalars(select(models.Transaction.merchant).distinct()).all(), dtype=object)
+    keys = merchant_keys(db, names)
+    transactions = models.Transaction.__table__
+    rows = [{'merchant_name': name, 'key': key} for name, key in zip(names, keys) if name is not None]
+    if rows:
+        db.execute(
+            update(transactions).where(transactions.c.merchant == bindparam('merchant_name'))
+            .values(merchant_key=bindparam('key')),
+            rows
+        )
+
+    subscriptions = db.execute(
+        select(models.Subscription.id, models.Subscription.name).order_by(models.Subscription.id)
+    ).all()
+    keys = merchant_keys(db, pd.Series([name for _, name in subscriptions], dtype=object))
+    seen = set()
+    rows = []
+    for (subscription_id, _), key in zip(subscriptions, keys):
+        rows.append({'id': subscription_id, 'merchant_key': None if key in seen else key})
+        seen.add(key)
+    if rows:
+        # Clear first so keys can move between subscriptions without tripping the unique index
+        db.execute(update(models.Subscription.__table__).values(merchant_key=None))
+        db.execute(update(models.Subscription), rows)
+
+    detection.rebuild_merchant_stats(db)
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+    import migrations
+
+    migrations.migrate(engine)
+    db = SessionLocal()
+    try:
+        if len(sys.argv) == 4 and sys.argv[1] == "alias":
+            alias, target = add_alias(db, sys.argv[2], sys.argv[3])
+            print(f"'{alias}' now maps to '{target}'; run `python merchants.py rekey` to apply it to stored rows")
+        elif len(sys.argv) == 2 and sys.argv[1] == "rekey":
+            rekey(db)
+            print("Merchant keys and stats rebuilt")
+        else:
+            print(__doc__)
+            sys.exit(2)
+    finally:
+        db.close()
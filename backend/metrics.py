@@ -0,0 +1,286 @@
+"""
+In-process request, SQL and stage metrics, exposed in the Prometheus text format.
+
+MetricsMiddleware times every request by route template. instrument_engine() hooks
+an engine's cursor events to count and time each statement, attributing it to the
+request that ran it and keeping the slowest ones. span() times a named stage of work
+such as "import.insert" or "detection.classify". Everything is held in memory and
+rendered by registry.render() for GET /metrics; no collector or extra package is
+needed.
+
+Set SLOW_REQUEST_MS to log requests slower than that, with their query count, SQL
+time and spans.
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from sqlalchemy import event
+
+# 0 turns slow-request logging off
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))
+SLOW_QUERY_KEEP = int(os.environ.get("SLOW_QUERY_KEEP", "20"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a cached lookup to a large import
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+logger = logging.getLogger("sub_tracker.requests")
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base for a labelled metric family; values are kept per tuple of label values"""
+    kind = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _label_text(self, label_values, extra=()) -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values)] + list(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            items = [(labels, list(value) if isinstance(value, list) else value) for labels, value in items]
+        for label_values, value in items:
+            lines.extend(self._render_value(label_values, value))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def _render_value(self, label_values, value):
+        return [f"{self.name}_total{self._label_text(label_values)} {_format(value)}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                # Per-bucket counts, then sum and count
+                state = self._values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def _render_value(self, label_values, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state):
+            cumulative += count
+            le = f'le="{_format(bound)}"'
+            lines.append(f"{self.name}_bucket{self._label_text(label_values, [le])} {cumulative}")
+        le = 'le="+Inf"'
+        lines.append(f"{self.name}_bucket{self._label_text(label_values, [le])} {state[-1]}")
+        lines.append(f"{self.name}_sum{self._label_text(label_values)} {_format(state[-2])}")
+        lines.append(f"{self.name}_count{self._label_text(label_values)} {state[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route", "status")
+))
+request_queries = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements executed per request", ("route",), QUERY_COUNT_BUCKETS
+))
+query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "SQL statement execution time by statement type", ("operation",)
+))
+query_errors = registry.register(Counter("db_query_errors", "SQL statements that raised", ("operation",)))
+span_duration = registry.register(Histogram("span_duration_seconds", "Time spent in named stages", ("span",)))
+
+
+class RequestStats:
+    """What one request has done so far; shared with the threads it hands work to"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+
+    def add_span(self, name: str, seconds: float):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+
+_current = ContextVar("request_stats", default=None)
+_slowest = []
+_slowest_lock = threading.Lock()
+_sequence = itertools.count()
+
+
+def _operation(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+
+def record_query(statement: str, seconds: float, executemany: bool = False):
+    """Add one executed statement to the query metrics and the slowest list"""
+    query_duration.observe(seconds, _operation(statement))
+    stats = _current.get()
+    if stats is not None:
+        stats.add_query(seconds)
+
+    with _slowest_lock:
+        if len(_slowest) >= SLOW_QUERY_KEEP and seconds <= _slowest[0][0]:
+            return
+        entry = {
+            "seconds": round(seconds, 6),
+            "statement": " ".join(statement.split())[:1000],
+            "executemany": executemany,
+            "path": stats.path if stats is not None else None,
+            "at": datetime.now().isoformat(timespec="seconds"),
+        }
+        item = (seconds, next(_sequence), entry)
+        if len(_slowest) < SLOW_QUERY_KEEP:
+            heapq.heappush(_slowest, item)
+        else:
+            heapq.heapreplace(_slowest, item)
+
+
+def slowest_queries() -> list:
+    """The slowest statements seen since startup, slowest first"""
+    with _slowest_lock:
+        return [entry for _, _, entry in sorted(_slowest, reverse=True)]
+
+
+def instrument_engine(engine):
+    """Count and time every statement run on a (sync) engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        record_query(statement, time.perf_counter() - conn.info["query_started"].pop(), executemany)
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
+        query_errors.inc(_operation(exception_context.statement or ""))
+
+
+@contextmanager
+def span(name: str, timings: dict = None):
+    """
+    Time the block as the named span. Handlers that report their own stage
+    breakdown can pass their timings dict to also add the seconds under the
+    last part of the name ("import.insert" -> timings["insert"]).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        span_duration.observe(seconds, name)
+        if timings is not None:
+            key = name.rsplit(".", 1)[-1]
+            timings[key] = timings.get(key, 0.0) + seconds
+        stats = _current.get()
+        if stats is not None:
+            stats.add_span(name, seconds)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and query counts per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope["path"])
+        token = _current.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = time.perf_counter() - started
+            _current.reset(token)
+            # The router leaves the matched route in the scope; templates keep label
+            # counts bounded, where raw paths would grow with every id
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            request_duration.observe(seconds, scope["method"], route, str(status))
+            request_queries.observe(stats.queries, route)
+            if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+                _log_slow_request(scope, status, seconds, stats)
+
+
+def _log_slow_request(scope, status: int, seconds: float, stats: RequestStats):
+    spans = ", ".join(f"{name}={value * 1000:.0f}ms" for name, value in sorted(stats.spans.items()))
+    logger.warning(
+        "Slow request: %s %s -> %s in %.0f ms (%d queries, %.0f ms in SQL%s)",
+        scope["method"], scope["path"], status, seconds * 1000, stats.queries, stats.query_seconds * 1000,
+        f"; {spans}" if spans else ""
+    )
@@ -0,0 +1,415 @@
+"""
+Versioned schema migrations, applied in order and recorded in schema_migrations.
+
+Usage:
+    python migrations.py               # apply pending migrations
+    python migrations.py status        # list applied and pending migrations
+    python migrations.py check-plans   # EXPLAIN QUERY PLAN the hot queries; fail on full scans
+    python migrations.py vacuum        # give space freed by migrations back to the filesystem
+"""
+import json
+import re
+import sys
+from contextlib import contextmanager
+from datetime import date, datetime
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import (
+    Column, Integer, String, DateTime, MetaData, Table, select, insert, update, bindparam, create_engine, or_,
+    inspect, event, func,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+import models
+import categorizer
+import merchants
+import importer
+import rawrows
+import fx
+import detection
+import forecast
+import lookups
+import notifications
+import rollups
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+def _create_indexes(conn, *names):
+    """Create the named indexes, as declared on the models, if they don't exist yet"""
+    indexes = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(conn, checkfirst=True)
+
+
+def initial_schema(conn):
+    # Creates any missing table; indexes only come with tables created here
+    Base.metadata.create_all(bind=conn)
+
+
+def transaction_keyset_indexes(conn):
+    _create_indexes(
+        conn,
+        "ix_transactions_date_id",
+        "ix_transactions_merchant_date_id",
+        "ix_transactions_payment_method_date_id",
+        "ix_transactions_subscription_date_id",
+    )
+
+
+def hot_path_indexes(conn):
+    _create_indexes(
+        conn,
+        "ix_subscriptions_active_next_billing",
+        "ix_subscriptions_category_id",
+        "ix_subscriptions_payment_method_id",
+        "ix_notifications_is_read_created_at",
+        "ix_notifications_created_at",
+        "ix_notifications_subscription_title_read",
+        "ix_monthly_spend_rollup_year_month",
+    )
+
+
+def category_rules(conn):
+    models.CategoryRule.__table__.create(conn, checkfirst=True)
+
+    # Seed with the keywords that used to be hard-coded, creating their categories
+    categories = {name: color for name, color in categorizer.DEFAULT_RULES.values()}
+    conn.execute(
+        sqlite_insert(models.Category).on_conflict_do_nothing(index_elements=['name']),
+        [{'name': name, 'color': color} for name, color in categories.items()]
+    )
+    category_ids = dict(conn.execute(
+        select(models.Category.name, models.Category.id).where(models.Category.name.in_(list(categories)))
+    ).all())
+    conn.execute(
+        sqlite_insert(models.CategoryRule).on_conflict_do_nothing(index_elements=['keyword']),
+        [
+            {'keyword': keyword, 'category_id': category_ids[name], 'priority': 0, 'created_at': datetime.utcnow()}
+            for keyword, (name, _) in categorizer.DEFAULT_RULES.items()
+        ]
+    )
+
+
+def merchant_keys(conn):
+    inspector = inspect(conn)
+    for table in ("transactions", "subscriptions"):
+        if "merchant_key" not in {column["name"] for column in inspector.get_columns(table)}:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN merchant_key VARCHAR")
+
+    # merchant_stats is derived data; the old table was keyed by raw merchant name
+    if "merchant_key" not in {column["name"] for column in inspector.get_columns("merchant_stats")}:
+        models.MerchantStats.__table__.drop(conn)
+        models.MerchantStats.__table__.create(conn)
+
+    models.MerchantAlias.__table__.create(conn, checkfirst=True)
+    conn.execute(
+        sqlite_insert(models.MerchantAlias).on_conflict_do_nothing(index_elements=['alias']),
+        [{'alias': alias, 'merchant_key': key} for alias, key in merchants.DEFAULT_ALIASES.items()]
+    )
+
+    # Backfill keys and stats, then index; the subscription index is unique, so
+    # rekey leaves later duplicates of a merchant without a key
+    merchants.invalidate()
+    merchants.rekey(Session(bind=conn))
+    _create_indexes(conn, "ix_transactions_merchant_key", "ix_subscriptions_merchant_key")
+
+
+def _account(raw_data):
+    # Imports only fingerprint an account column if the CSV had one
+    if not raw_data or '"account"' not in raw_data:
+        return None
+    return json.loads(raw_data).get('account')
+
+
+def import_fingerprints(conn):
+    inspector = inspect(conn)
+    if "fingerprint" not in {column["name"] for column in inspector.get_columns("transactions")}:
+        conn.exec_driver_sql("ALTER TABLE transactions ADD COLUMN fingerprint VARCHAR")
+    if "content_hash" not in {column["name"] for column in inspector.get_columns("import_jobs")}:
+        conn.exec_driver_sql("ALTER TABLE import_jobs ADD COLUMN content_hash VARCHAR")
+    models.ImportedFile.__table__.create(conn, checkfirst=True)
+
+    # Fingerprint imported history the way a fresh import would, numbering repeats
+    # in id order, so re-uploading an old statement finds its rows already there
+    trans = models.Transaction
+    rows = pd.DataFrame(conn.execute(
+        select(trans.id, trans.date, trans.amount, trans.description, models.PaymentMethod.name, trans.raw_data)
+        .outerjoin(models.PaymentMethod, models.PaymentMethod.id == trans.payment_method_id)
+        .where(trans.raw_data.isnot(None))
+        .order_by(trans.id)
+    ).all(), columns=['id', 'date', 'amount', 'description', 'payment_method', 'raw_data'])
+    if not rows.empty:
+        rows['fingerprint'] = importer.fingerprints(
+            rows['date'], rows['amount'], rows['description'], rows['payment_method'], rows['raw_data'].map(_account)
+        )
+        conn.execute(
+            update(trans.__table__).where(trans.id == bindparam('trans_id')).values(fingerprint=bindparam('value')),
+            [{'trans_id': int(trans_id), 'value': value} for trans_id, value in zip(rows['id'], rows['fingerprint'])]
+        )
+    _create_indexes(conn, "ix_transactions_fingerprint")
+
+
+# Legacy JSON rows re-encoded per chunk in compact_raw_rows
+RAW_MIGRATION_ROWS = 50_000
+
+
+def compact_raw_rows(conn):
+    models.RawBatch.__table__.create(conn, checkfirst=True)
+    columns = {column["name"] for column in inspect(conn).get_columns("transactions")}
+    if "raw_batch_id" not in columns:
+        conn.exec_driver_sql("ALTER TABLE transactions ADD COLUMN raw_batch_id INTEGER REFERENCES raw_batches (id)")
+    if "raw_values" not in columns:
+        conn.exec_driver_sql("ALTER TABLE transactions ADD COLUMN raw_values BLOB")
+
+    # Re-encode JSON rows a chunk at a time in id order; each distinct header in a
+    # chunk becomes one raw batch. Run `python migrations.py vacuum` to shrink the file.
+    trans = models.Transaction.__table__
+    last_id = 0
+    while True:
+        chunk = conn.execute(
+            select(trans.c.id, trans.c.raw_data).where(trans.c.raw_data.isnot(None), trans.c.id > last_id)
+            .order_by(trans.c.id).limit(RAW_MIGRATION_ROWS)
+        ).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+
+        by_header = {}
+        for trans_id, raw_data in chunk:
+            row = json.loads(raw_data)
+            by_header.setdefault(tuple(row), []).append((trans_id, list(row.values())))
+        for header, rows in by_header.items():
+            dictionary, values = rawrows.encode_rows([row for _, row in rows])
+            batch_id = conn.execute(insert(models.RawBatch.__table__).values(
+                columns=json.dumps(list(header)), dictionary=dictionary, created_at=datetime.utcnow()
+            ).returning(models.RawBatch.__table__.c.id)).scalar_one()
+            conn.execute(
+                update(trans).where(trans.c.id == bindparam('trans_id'))
+                .values(raw_batch_id=batch_id, raw_values=bindparam('value'), raw_data=None),
+                [{'trans_id': trans_id, 'value': value} for (trans_id, _), value in zip(rows, values)]
+            )
+
+
+def base_amounts(conn):
+    models.FxRate.__table__.create(conn, checkfirst=True)
+    for table, column in (("transactions", "base_amount"), ("monthly_spend_rollup", "base_total")):
+        if column not in {existing["name"] for existing in inspect(conn).get_columns(table)}:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} FLOAT")
+
+    # Amounts already in the base currency keep their value; others wait for rates
+    # to be loaded with `python fx.py load <csv>`, which revalues them
+    trans = models.Transaction.__table__
+    rollup = models.MonthlySpendRollup.__table__
+    conn.execute(update(trans).where(or_(func.upper(trans.c.currency) == fx.BASE_CURRENCY, trans.c.currency.is_(None)))
+                 .values(base_amount=trans.c.amount))
+    conn.execute(update(rollup).where(or_(func.upper(rollup.c.currency) == fx.BASE_CURRENCY, rollup.c.currency.is_(None)))
+                 .values(base_total=rollup.c.total))
+    _create_indexes(conn, "ix_transactions_date_base_amount")
+
+
+def recent_merchant_amounts(conn):
+    if "recent_amounts" not in {column["name"] for column in inspect(conn).get_columns("merchant_stats")}:
+        conn.exec_driver_sql("ALTER TABLE merchant_stats ADD COLUMN recent_amounts TEXT")
+    # min_amount and max_amount now cover only the recent window
+    detection.rebuild_merchant_stats(Session(bind=conn))
+
+
+# Every write to transactions, however it is issued, bumps the version of the months
+# it touches; the analytics store re-exports a month when its version moves
+_BUMP_MONTH = """
+    INSERT INTO transaction_month_versions (month, version) VALUES (substr({date}, 1, 7), 1)
+    ON CONFLICT (month) DO UPDATE SET version = version + 1;"""
+
+MONTH_VERSION_TRIGGERS = {
+    "transactions_month_version_insert": "AFTER INSERT ON transactions BEGIN"
+        + _BUMP_MONTH.format(date="NEW.date") + " END",
+    # Only columns the analytics store exports count, so rewriting a key to the
+    # value it already had (as a rekey does for most merchants) leaves months alone
+    "transactions_month_version_update": "AFTER UPDATE ON transactions WHEN "
+        + " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in (
+            "date", "amount", "base_amount", "currency", "merchant", "merchant_key",
+            "payment_method_id", "subscription_id", "is_matched",
+        )) + " BEGIN" + _BUMP_MONTH.format(date="OLD.date") + _BUMP_MONTH.format(date="NEW.date") + " END",
+    "transactions_month_version_delete": "AFTER DELETE ON transactions BEGIN"
+        + _BUMP_MONTH.format(date="OLD.date") + " END",
+    # Exported rows carry their subscription's category
+    "subscriptions_month_version_category": """AFTER UPDATE OF category_id ON subscriptions
+        WHEN OLD.category_id IS NOT NEW.category_id BEGIN
+        INSERT INTO transaction_month_versions (month, version)
+        SELECT DISTINCT substr(date, 1, 7), 1 FROM transactions WHERE subscription_id = NEW.id
+        ON CONFLICT (month) DO UPDATE SET version = version + 1; END""",
+}
+
+
+def transaction_month_versions(conn):
+    models.TransactionMonthVersion.__table__.create(conn, checkfirst=True)
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO transaction_month_versions (month, version) "
+        "SELECT DISTINCT substr(date, 1, 7), 1 FROM transactions"
+    )
+    for name, body in MONTH_VERSION_TRIGGERS.items():
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+# (version, name, function(connection)); append only, never renumber
+MIGRATIONS = [
+    (1, "initial schema", initial_schema),
+    (2, "transaction keyset indexes", transaction_keyset_indexes),
+    (3, "hot path indexes", hot_path_indexes),
+    (4, "category rules", category_rules),
+    (5, "merchant keys", merchant_keys),
+    (6, "import fingerprints", import_fingerprints),
+    (7, "compact raw rows", compact_raw_rows),
+    (8, "base amounts", base_amounts),
+    (9, "recent merchant amounts", recent_merchant_amounts),
+    (10, "transaction month versions", transaction_month_versions),
+]
+
+
+def applied_versions(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    return {row.version for row in conn.execute(select(schema_migrations.c.version))}
+
+
+def migrate(engine):
+    """Apply every pending migration, each in its own transaction. Returns the versions applied."""
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+
+    applied = []
+    for version, name, upgrade in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(insert(schema_migrations).values(version=version, name=name, applied_at=datetime.utcnow()))
+        applied.append(version)
+    return applied
+
+
+# Tables that grow with use, so a plan reading one in full is a regression; lookup
+# tables like categories and payment_methods are small enough to scan
+INDEXED_TABLES = ("transactions", "subscriptions", "notifications", "merchant_stats", "monthly_spend_rollup")
+
+
+@contextmanager
+def capture_statements(engine):
+    """Context manager yielding a list that fills with (sql, parameters) for every statement run on engine"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        # executemany passes one parameter set per row; the first is enough to explain
+        if parameters and isinstance(parameters, list) and isinstance(parameters[0], (tuple, dict)):
+            parameters = parameters[0]
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def full_scans(conn, statement: str, parameters=()):
+    """EXPLAIN QUERY PLAN one statement; returns (plan, the steps that read an INDEXED_TABLES table in full)"""
+    plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    # "SCAN t USING INDEX" walks an index in order; a bare "SCAN t" reads the whole table
+    pattern = re.compile(rf"SCAN ({'|'.join(INDEXED_TABLES)})\b")
+    return plan, [step for step in plan if pattern.match(step) and "USING" not in step]
+
+
+def run_hot_paths(db: Session):
+    """
+    Import a small statement and run detection, rollups, forecasting and notification
+    generation over it through their real functions, so the statements they issue
+    can be captured and explained.
+    """
+    today = date.today()
+    statement = pd.DataFrame(
+        [{'date': (today - relativedelta(months=months, days=-3)).isoformat(), 'description': 'Netflix',
+          'amount': -10.99, 'payment_method': 'Visa *1234'} for months in range(6)]
+        + [{'date': (today - relativedelta(days=days)).isoformat(), 'description': f'Shop {days}',
+            'amount': -5.0 - days, 'payment_method': None} for days in range(3)]
+    )
+    frame = importer.prepare_transactions(statement)
+    payment_method_ids = lookups.resolve_payment_methods(db, frame['payment_method'].dropna().unique())
+    inserted = importer.insert_transactions(db, frame, payment_method_ids)
+    detection.update_merchant_stats(db, inserted)
+    rollups.refresh_dates(db, inserted['date'])
+    db.commit()
+
+    detection.detect_and_create_subscriptions(inserted, db)
+    forecast.roll_forward(db)
+    db.commit()
+    forecast.project(forecast.load_subscriptions(db), today, today + relativedelta(months=1))
+    notifications.generate_notifications(db)
+    rollups.spend_since(db, today.replace(day=1))
+    rollups.subscription_months(db, 1)
+
+
+def check_query_plans():
+    """
+    Migrate a throwaway in-memory database, run run_hot_paths() on it and EXPLAIN
+    QUERY PLAN every statement it issued. Returns (statement, plan) for each one
+    that reads an INDEXED_TABLES table without an index.
+    """
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    migrate(engine)
+
+    # The lookup caches are process-wide; don't mix ids between this database and the app's
+    lookups.invalidate()
+    merchants.invalidate()
+    try:
+        with capture_statements(engine) as statements, Session(engine) as db:
+            run_hot_paths(db)
+    finally:
+        lookups.invalidate()
+        merchants.invalidate()
+
+    failures = []
+    with engine.connect() as conn:
+        for sql, parameters in statements:
+            if not sql.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+                continue
+            plan, scans = full_scans(conn, sql, parameters)
+            if scans:
+                failures.append((" ".join(sql.split()), plan))
+    return failures
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    if command == "migrate":
+        applied = migrate(engine)
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+    elif command == "status":
+        with engine.begin() as conn:
+            done = applied_versions(conn)
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>4}  {'applied' if version in done else 'pending':<8} {name}")
+    elif command == "check-plans":
+        failures = check_query_plans()
+        for sql, plan in failures:
+            print(f"Full table scan in {sql}: {plan}")
+        if not failures:
+            print("Every hot query uses an index")
+        sys.exit(1 if failures else 0)
+    elif command == "vacuum":
+        # VACUUM can't run inside a transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("VACUUM")
+        print("Database vacuumed")
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Text, Index, LargeBinary
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
+import json
 from database import Base
+import rawrows
 
 
 class Category(Base):
@@ -12,6 +14,19 @@ class Category(Base):
     color = Column(String, default="#3b82f6")  # Default blue color for pie chart
 
     subscriptions = relationship("Subscription", back_populates="category")
+    rules = relationship("CategoryRule", back_populates="category", cascade="all, delete-orphan")
+
+
+class CategoryRule(Base):
+    __tablename__ = "category_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    keyword = Column(String, unique=True, nullable=False)  # Lowercase; matched anywhere in the merchant name
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False, index=True)
+    priority = Column(Integer, default=0, nullable=False)  # Higher wins when several keywords match
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    category = relationship("Category", back_populates="rules")
 
 
 class PaymentMethod(Base):
@@ -30,6 +45,7 @@ class Subscription(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
+    merchant_key = Column(String, nullable=True)  # Normalized merchant this subscription is billed by
     description = Column(Text, nullable=True)
     amount = Column(Float, nullable=False)
     currency = Column(String, default="GBP")
@@ -46,6 +62,13 @@ class Subscription(Base):
     payment_method = relationship("PaymentMethod", back_populates="subscriptions")
     transactions = relationship("Transaction", back_populates="subscription")
 
+    __table_args__ = (
+        Index("ix_subscriptions_active_next_billing", "is_active", "next_billing_date"),  # Upcoming bills
+        Index("ix_subscriptions_category_id", "category_id"),
+        Index("ix_subscriptions_payment_method_id", "payment_method_id"),
+        Index("ix_subscriptions_merchant_key", "merchant_key", unique=True),  # One subscription per merchant
+    )
+
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -56,14 +79,42 @@ class Transaction(Base):
     description = Column(String, nullable=False)
     amount = Column(Float, nullable=False)
     currency = Column(String, default="GBP")
+    base_amount = Column(Float, nullable=True)  # amount in fx.BASE_CURRENCY; NULL while its currency has no rates
     merchant = Column(String, nullable=True, index=True)
+    merchant_key = Column(String, nullable=True)  # merchants.merchant_keys() of merchant
     payment_method_id = Column(Integer, ForeignKey("payment_methods.id"), nullable=True)
-    raw_data = Column(Text, nullable=True)  # Store original CSV row as JSON
+    # Original CSV row: rows imported before raw_batches have JSON in raw_data; newer
+    # ones keep compressed values and point at the batch holding the column names.
+    # Deferred so lists never load them; read through raw_row
+    raw_data = deferred(Column(Text, nullable=True))
+    raw_batch_id = Column(Integer, ForeignKey("raw_batches.id"), nullable=True)
+    raw_values = deferred(Column(LargeBinary, nullable=True))
+    fingerprint = Column(String, nullable=True)  # importer.fingerprints(); NULL for manual entries
     is_matched = Column(Boolean, default=False)  # Whether it's matched to a subscription
     created_at = Column(DateTime, default=datetime.utcnow)
 
     subscription = relationship("Subscription", back_populates="transactions")
     payment_method = relationship("PaymentMethod", back_populates="transactions")
+    raw_batch = relationship("RawBatch")
+
+    @property
+    def raw_row(self):
+        """The original CSV row as a dict, or None for manually created transactions"""
+        if self.raw_values is not None and self.raw_batch is not None:
+            return rawrows.decode_row(self.raw_batch.column_names, self.raw_batch.dictionary, self.raw_values)
+        return json.loads(self.raw_data) if self.raw_data else None
+
+    # Keyset pagination walks (date, id) newest first; each filter gets an index
+    # that leads with its column and keeps that order
+    __table_args__ = (
+        Index("ix_transactions_date_id", "date", "id"),
+        Index("ix_transactions_merchant_date_id", "merchant", "date", "id"),
+        Index("ix_transactions_payment_method_date_id", "payment_method_id", "date", "id"),
+        Index("ix_transactions_subscription_date_id", "subscription_id", "date", "id"),
+        Index("ix_transactions_merchant_key", "merchant_key"),
+        Index("ix_transactions_fingerprint", "fingerprint", unique=True),  # Re-imports skip known rows
+        Index("ix_transactions_date_base_amount", "date", "base_amount"),  # Date-range sums read only the index
+    )
 
 
 class Notification(Base):
@@ -78,3 +129,122 @@ class Notification(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     subscription = relationship("Subscription")
+
+    __table_args__ = (
+        Index("ix_notifications_is_read_created_at", "is_read", "created_at"),  # Unread list, newest first
+        Index("ix_notifications_created_at", "created_at"),
+        Index("ix_notifications_subscription_title_read", "subscription_id", "title", "is_read"),  # Dedup check
+    )
+
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    id = Column(String, primary_key=True, index=True)  # Opaque job id handed to the client
+    filename = Column(String, nullable=False)
+    file_path = Column(String, nullable=True)  # Stored upload, removed once the job completes
+    state = Column(String, default="queued", index=True)  # queued, running, completed, failed
+    chunk_rows = Column(Integer, nullable=False)
+    rows_read = Column(Integer, default=0)
+    rows_committed = Column(Integer, default=0)
+    subscriptions_detected = Column(Integer, default=0)
+    content_hash = Column(String, nullable=True)  # SHA-256 of the upload, recorded in imported_files on success
+    timings = Column(Text, nullable=True)  # Seconds spent per stage, as JSON
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    @property
+    def stage_timings(self):
+        return json.loads(self.timings) if self.timings else {}
+
+
+class RawBatch(Base):
+    __tablename__ = "raw_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    columns = Column(Text, nullable=False)  # CSV column names, as a JSON list
+    dictionary = Column(LargeBinary, nullable=False)  # Preset deflate dictionary for the batch's rows
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    @property
+    def column_names(self):
+        return json.loads(self.columns)
+
+
+class ImportedFile(Base):
+    __tablename__ = "imported_files"
+
+    content_hash = Column(String, primary_key=True)  # SHA-256 of the uploaded bytes
+    filename = Column(String, nullable=False)
+    transaction_count = Column(Integer, nullable=False, default=0)  # New rows it added
+    duplicate_count = Column(Integer, nullable=False, default=0)  # Rows already in the database
+    imported_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MerchantStats(Base):
+    __tablename__ = "merchant_stats"
+
+    merchant_key = Column(String, primary_key=True)
+    merchant = Column(String, nullable=False)  # Name as first seen, used for new subscriptions
+    transaction_count = Column(Integer, nullable=False, default=0)
+    first_date = Column(Date, nullable=False)
+    last_date = Column(Date, nullable=False)
+    amount_sum = Column(Float, nullable=False, default=0.0)  # Running sums over absolute amounts
+    amount_sq_sum = Column(Float, nullable=False, default=0.0)
+    min_amount = Column(Float, nullable=False)
+    max_amount = Column(Float, nullable=False)  # min and max of recent_amounts
+    recent_amounts = Column(Text, nullable=True)  # Latest detection.RECENT_AMOUNTS [date, amount] pairs, as JSON
+    currency = Column(String, default="GBP")  # Currency of the earliest charge
+    subscription_id = Column(Integer, ForeignKey("subscriptions.id"), nullable=True)  # Set once detected as recurring
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def mean_interval(self):
+        """Mean days between charges; order-independent, so late-arriving history is fine"""
+        if self.transaction_count < 2:
+            return None
+        return (self.last_date - self.first_date).days / (self.transaction_count - 1)
+
+
+class MerchantAlias(Base):
+    __tablename__ = "merchant_aliases"
+
+    alias = Column(String, primary_key=True)  # Normalized name, e.g. "amzn mktp"
+    merchant_key = Column(String, nullable=False)  # Key it stands for, e.g. "amazon"
+
+
+class MonthlySpendRollup(Base):
+    __tablename__ = "monthly_spend_rollup"
+
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    currency = Column(String, nullable=True)
+    payment_method_id = Column(Integer, ForeignKey("payment_methods.id"), nullable=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)  # Via the matched subscription
+    total = Column(Float, nullable=False, default=0.0)  # Signed sum of transaction amounts
+    base_total = Column(Float, nullable=True)  # Signed sum of their base amounts
+    transaction_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_monthly_spend_rollup_year_month", "year", "month"),
+    )
+
+
+class TransactionMonthVersion(Base):
+    __tablename__ = "transaction_month_versions"
+
+    month = Column(String, primary_key=True)  # 'YYYY-MM'
+    # Bumped by triggers (see migrations.py) whenever one of the month's transactions,
+    # or the category of a subscription one belongs to, changes
+    version = Column(Integer, nullable=False, default=0)
+
+
+class FxRate(Base):
+    __tablename__ = "fx_rates"
+
+    currency = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)  # Applies from this day until the currency's next rate
+    rate = Column(Float, nullable=False)  # Value of one unit in fx.BASE_CURRENCY
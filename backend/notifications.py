@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, insert, exists, func, case, cast, literal, Integer, String
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+import forecast
+import models
+
+# Seconds between scheduled notification runs
+NOTIFICATION_INTERVAL = float(os.environ.get("NOTIFICATION_INTERVAL", "3600"))
+UPCOMING_DAYS = 7
+
+logger = logging.getLogger("sub_tracker.notifications")
+
+
+def generate_notifications(db: Session):
+    """
+    Generate notifications for upcoming bills, as a single INSERT ... SELECT that
+    skips subscriptions which already have an unread upcoming-payment notification.
+    Returns the number of notifications created.
+    """
+    today = date.today()
+    week_from_now = today + timedelta(days=UPCOMING_DAYS)
+    sub = models.Subscription
+    notification = models.Notification
+
+    days_until = cast(func.julianday(sub.next_billing_date) - func.julianday(today.isoformat()), Integer)
+    message = (
+        sub.name + " - £" + func.printf('%.2f', sub.amount) + " due in "
+        + cast(days_until, String) + " day" + case((days_until != 1, 's'), else_='')
+    )
+
+    already_notified = exists().where(
+        notification.subscription_id == sub.id,
+        notification.title == "Upcoming Payment",
+        notification.is_read == False
+    )
+
+    upcoming = select(
+        literal("Upcoming Payment"),
+        message,
+        literal("warning"),
+        literal(False),
+        sub.id,
+        literal(datetime.utcnow()),
+    ).where(
+        sub.is_active == True,
+        sub.next_billing_date != None,
+        sub.next_billing_date >= today,
+        sub.next_billing_date <= week_from_now,
+        ~already_notified
+    )
+
+    result = db.execute(insert(notification).from_select(
+        ['title', 'message', 'type', 'is_read', 'subscription_id', 'created_at'], upcoming
+    ))
+    db.commit()
+    return result.rowcount
+
+
+class NotificationScheduler:
+    """
+    Background thread that rolls overdue next_billing_dates forward and then runs
+    generate_notifications, every interval seconds
+    """
+
+    def __init__(self, interval: float = NOTIFICATION_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        """Roll billing dates forward, then generate notifications; one failing doesn't skip the other"""
+        db = SessionLocal()
+        try:
+            try:
+                forecast.roll_forward(db)
+            except Exception:
+                db.rollback()
+                logger.exception("Rolling billing dates forward failed")
+            return generate_notifications(db)
+        finally:
+            db.close()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                # Try again next interval; a locked database shouldn't kill the thread
+                logger.exception("Scheduled notification run failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="notification-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,188 @@
+"""
+Monthly spend rollup, kept up to date on write so analytics never scan transactions.
+
+Usage:
+    python rollups.py rebuild   # recompute every bucket from the transactions table
+    python rollups.py check     # report buckets that disagree with the transactions table
+"""
+import sys
+from datetime import date
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select, insert, delete, func, extract, and_, or_, case
+from sqlalchemy.orm import Session
+
+import models
+
+ROLLUP_COLUMNS = [
+    'year', 'month', 'currency', 'payment_method_id', 'category_id', 'total', 'transaction_count', 'base_total'
+]
+KEY_COLUMNS = ROLLUP_COLUMNS[:5]
+
+
+def _sort_key(values):
+    # None sorts last within each position without comparing it to real values
+    return tuple((value is None, value if value is not None else 0) for value in values)
+
+
+def month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def months_between(first: date, last: date):
+    """Every (year, month) from first's month to last's month inclusive"""
+    current = month_start(first)
+    while current <= last:
+        yield current.year, current.month
+        current += relativedelta(months=1)
+
+
+def _aggregate(*filters):
+    """SELECT producing rollup rows from transactions, grouped by every rollup key"""
+    trans = models.Transaction
+    year = extract('year', trans.date)
+    month = extract('month', trans.date)
+    return select(
+        year,
+        month,
+        trans.currency,
+        trans.payment_method_id,
+        models.Subscription.category_id,
+        func.sum(trans.amount),
+        func.count(trans.id),
+        func.sum(trans.base_amount),
+    ).outerjoin(
+        models.Subscription, models.Subscription.id == trans.subscription_id
+    ).where(*filters).group_by(
+        year, month, trans.currency, trans.payment_method_id, models.Subscription.category_id
+    )
+
+
+def refresh_months(db: Session, months):
+    """
+    Recompute the rollup buckets of the given (year, month) pairs from their
+    transactions. Each month is one indexed date-range scan. Does not commit.
+    """
+    rollup = models.MonthlySpendRollup
+    for year, month in sorted(set(months)):
+        start = date(int(year), int(month), 1)
+        end = start + relativedelta(months=1)
+        db.execute(delete(rollup).where(rollup.year == year, rollup.month == month))
+        db.execute(insert(rollup).from_select(ROLLUP_COLUMNS, _aggregate(
+            models.Transaction.date >= start, models.Transaction.date < end
+        )))
+
+
+def refresh_dates(db: Session, dates):
+    """Recompute the buckets of every month that one of dates falls in. Does not commit."""
+    refresh_months(db, {(d.year, d.month) for d in dates if d is not None})
+
+
+def subscription_months(db: Session, subscription_id: int):
+    """The (year, month) pairs holding a subscription's transactions"""
+    trans = models.Transaction
+    dates = db.query(trans.date).filter(trans.subscription_id == subscription_id).distinct()
+    return {(row.date.year, row.date.month) for row in dates}
+
+
+def rebuild(db: Session):
+    """Recompute the whole rollup table from scratch"""
+    db.execute(delete(models.MonthlySpendRollup))
+    db.execute(insert(models.MonthlySpendRollup).from_select(ROLLUP_COLUMNS, _aggregate()))
+    db.commit()
+
+
+def check(db: Session):
+    """
+    Compare every bucket with a fresh aggregate of the transactions table.
+    Returns a list of (key, rollup total, actual total) for buckets that differ,
+    in either currency: totals are (total, base_total) pairs.
+    """
+    rollup = models.MonthlySpendRollup
+    expected = {tuple(row[:5]): tuple(row[5:]) for row in db.execute(_aggregate()).all()}
+    stored = {
+        tuple(row[:5]): tuple(row[5:])
+        for row in db.execute(select(*[getattr(rollup, col) for col in ROLLUP_COLUMNS])).all()
+    }
+
+    def differs(a, b):
+        return (a is None) != (b is None) or (a is not None and abs(a - b) > 0.005)
+
+    mismatches = []
+    for key in sorted(set(expected) | set(stored), key=_sort_key):
+        want = expected.get(key, (0.0, 0, None))
+        have = stored.get(key, (0.0, 0, None))
+        if have[1] != want[1] or differs(have[0] or 0.0, want[0] or 0.0) or differs(have[2], want[2]):
+            mismatches.append((dict(zip(KEY_COLUMNS, key)), (have[0], have[2]), (want[0], want[2])))
+    return mismatches
+
+
+def spend_since(db: Session, start: date, group_by=()):
+    """
+    Sum spend in the base currency from start onwards, optionally grouped by rollup
+    columns. Whole months come from the rollup; the partial first month is summed
+    from transactions. Returns rows of (*group_by values, base total, transaction_count,
+    unconverted), where unconverted counts the transactions left out of the total
+    because their currency has no rates.
+    """
+    rollup = models.MonthlySpendRollup
+    trans = models.Transaction
+    columns = [getattr(rollup, col) for col in group_by]
+
+    rows = db.query(
+        *columns, func.sum(rollup.base_total), func.sum(rollup.transaction_count),
+        func.sum(case((rollup.base_total.is_(None), rollup.transaction_count), else_=0))
+    ).filter(
+        or_(rollup.year > start.year, and_(rollup.year == start.year, rollup.month > start.month))
+    ).group_by(*columns).all()
+
+    # Partial first month, read straight from the date index
+    partial_end = month_start(start) + relativedelta(months=1)
+    partial_columns = []
+    for col in group_by:
+        if col == 'year':
+            partial_columns.append(extract('year', trans.date))
+        elif col == 'month':
+            partial_columns.append(extract('month', trans.date))
+        elif col == 'category_id':
+            partial_columns.append(models.Subscription.category_id)
+        else:
+            partial_columns.append(getattr(trans, col))
+    partial = db.query(
+        *partial_columns, func.sum(trans.base_amount), func.count(trans.id),
+        func.sum(case((trans.base_amount.is_(None), 1), else_=0))
+    ).select_from(trans).outerjoin(
+        models.Subscription, models.Subscription.id == trans.subscription_id
+    ).filter(
+        trans.date >= start, trans.date < partial_end
+    ).group_by(*partial_columns).all()
+
+    merged = {}
+    for row in list(rows) + list(partial):
+        key = tuple(int(v) if col in ('year', 'month') else v for col, v in zip(group_by, row[:-3]))
+        total, count, unconverted = merged.get(key, (0.0, 0, 0))
+        merged[key] = (total + (row[-3] or 0.0), count + (row[-2] or 0), unconverted + (row[-1] or 0))
+    return [(*key, *values) for key, values in sorted(merged.items(), key=lambda item: _sort_key(item[0]))]
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+    import migrations
+
+    migrations.migrate(engine)
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    db = SessionLocal()
+    try:
+        if command == "rebuild":
+            rebuild(db)
+            print("Rollup rebuilt")
+        elif command == "check":
+            mismatches = check(db)
+            for key, have, want in mismatches:
+                print(f"{key}: rollup={have} actual={want}")
+            print(f"{len(mismatches)} mismatched bucket(s)")
+            sys.exit(1 if mismatches else 0)
+        else:
+            print(__doc__)
+            sys.exit(2)
+    finally:
+        db.close()
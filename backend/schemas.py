@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, field_validator
+from typing import Optional, List, Dict, Any, Union
 from datetime import date, datetime
 
 
@@ -19,6 +19,40 @@ class Category(CategoryBase):
         from_attributes = True
 
 
+class CategoryRuleBase(BaseModel):
+    keyword: str
+    category_id: int
+    priority: int = 0
+
+
+class CategoryRuleCreate(CategoryRuleBase):
+    pass
+
+
+class CategoryRuleUpdate(BaseModel):
+    keyword: Optional[str] = None
+    category_id: Optional[int] = None
+    priority: Optional[int] = None
+
+
+class CategoryRule(CategoryRuleBase):
+    id: int
+    created_at: datetime
+    category: Category
+
+    class Config:
+        from_attributes = True
+
+
+class CategoryClassifyRequest(BaseModel):
+    merchants: List[str]
+
+
+class CategoryMatch(BaseModel):
+    merchant: str
+    category_id: Optional[int] = None
+
+
 class PaymentMethodBase(BaseModel):
     name: str
 
@@ -35,6 +69,12 @@ class PaymentMethod(PaymentMethodBase):
         from_attributes = True
 
 
+# Helper function
+def currency_code(value):
+    """Currency codes are stored upper-case, as imports and exchange rates use them"""
+    return value.strip().upper() if isinstance(value, str) else value
+
+
 class SubscriptionBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -47,6 +87,8 @@ class SubscriptionBase(BaseModel):
     next_billing_date: Optional[date] = None
     is_active: bool = True
 
+    _currency = field_validator("currency")(currency_code)
+
 
 class SubscriptionCreate(SubscriptionBase):
     pass
@@ -64,9 +106,12 @@ class SubscriptionUpdate(BaseModel):
     next_billing_date: Optional[date] = None
     is_active: Optional[bool] = None
 
+    _currency = field_validator("currency")(currency_code)
+
 
 class Subscription(SubscriptionBase):
     id: int
+    merchant_key: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     category: Optional[Category] = None
@@ -84,12 +129,13 @@ class TransactionBase(BaseModel):
     currency: str = "GBP"
     merchant: Optional[str] = None
     payment_method_id: Optional[int] = None
-    raw_data: Optional[str] = None
     is_matched: bool = False
 
+    _currency = field_validator("currency")(currency_code)
+
 
 class TransactionCreate(TransactionBase):
-    pass
+    raw_data: Optional[str] = None
 
 
 class Transaction(TransactionBase):
@@ -101,16 +147,22 @@ class Transaction(TransactionBase):
         from_attributes = True
 
 
+class TransactionDetail(Transaction):
+    raw_row: Optional[dict] = None  # The original CSV row
+
+
 class MonthlySpend(BaseModel):
     month: str
     total: float
     currency: str
+    unconverted: int = 0  # Transactions left out of total: their currency has no rates
 
 
 class YearlySpend(BaseModel):
     year: int
     total: float
     currency: str
+    unconverted: int = 0
 
 
 class CategorySpend(BaseModel):
@@ -145,6 +197,73 @@ class DashboardStats(BaseModel):
     monthly_spend: float
     yearly_spend: float
     currency: str
+    monthly_unconverted: int = 0  # Transactions left out of monthly_spend and yearly_spend for lack of rates
+    yearly_unconverted: int = 0
     category_breakdown: List[CategorySpend]
     recent_transactions: List[Transaction]
     notifications_count: int = 0
+
+
+class ForecastBucket(BaseModel):
+    period: date
+    currency: str
+    total: float
+    count: int
+
+
+class ForecastBill(BaseModel):
+    subscription_id: int
+    name: str
+    date: date
+    amount: float
+    currency: str
+
+
+class Forecast(BaseModel):
+    date_from: date
+    date_to: date
+    bucket: str
+    currency: str  # Bills in a currency without exchange rates stay in their own
+    totals: Dict[str, float]
+    buckets: List[ForecastBucket]
+    bills: Optional[List[ForecastBill]] = None
+
+
+class AnalyticsQuery(BaseModel):
+    group_by: List[str] = []
+    bucket: Optional[str] = None
+    metrics: List[str] = ["total", "count"]
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    filters: Dict[str, List[Union[bool, int, str]]] = {}
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    order_by: Optional[str] = None
+    descending: bool = True
+    limit: int = 1000
+    currency: Optional[str] = None  # Reporting currency for amount metrics; defaults to BASE_CURRENCY
+
+
+class AnalyticsQueryResult(BaseModel):
+    rows: List[Dict[str, Any]]
+    row_count: int
+    rows_matched: int
+    elapsed_ms: float
+    currency: str
+
+
+class ImportJob(BaseModel):
+    id: str
+    filename: str
+    state: str
+    rows_read: int = 0
+    rows_committed: int = 0
+    subscriptions_detected: int = 0
+    stage_timings: Dict[str, float] = {}
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,79 @@
+"""
+Tests run against a throwaway SQLite database: DATABASE_URL and the data directories
+point into a temporary directory before any backend module is imported, so nothing
+touches ./subscriptions.db.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix="sub-tracker-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ["ANALYTICS_DIR"] = os.path.join(_workdir, "analytics")
+os.environ["IMPORT_DIR"] = os.path.join(_workdir, "imports")
+os.environ["IMPORT_PROCESSES"] = "1"
+for name in ("READ_DATABASE_URL", "ASYNC_DATABASE_URL", "DB_READ_POOL"):
+    os.environ.pop(name, None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+import cache  # noqa: E402
+import categorizer  # noqa: E402
+import forecast  # noqa: E402
+import fx  # noqa: E402
+import lookups  # noqa: E402
+import merchants  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+
+# Seeded by migrations and left in place between tests, apart from categories added since
+SEEDED_TABLES = {"categories", "category_rules", "merchant_aliases"}
+with engine.connect() as _conn:
+    SEEDED_CATEGORY_IDS = _conn.execute(Base.metadata.tables["categories"].select()).scalars().all()
+    SEEDED_ALIASES = _conn.execute(Base.metadata.tables["merchant_aliases"].select()).scalars().all()
+    SEEDED_RULE_IDS = _conn.execute(Base.metadata.tables["category_rules"].select()).scalars().all()
+
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            if table.name not in SEEDED_TABLES:
+                conn.execute(table.delete())
+        categories = Base.metadata.tables["categories"]
+        rules = Base.metadata.tables["category_rules"]
+        conn.execute(rules.delete().where(rules.c.id.not_in(SEEDED_RULE_IDS)))
+        conn.execute(categories.delete().where(categories.c.id.not_in(SEEDED_CATEGORY_IDS)))
+        aliases = Base.metadata.tables["merchant_aliases"]
+        conn.execute(aliases.delete().where(aliases.c.alias.not_in(SEEDED_ALIASES)))
+    lookups.invalidate()
+    categorizer.invalidate()
+    merchants.invalidate()
+    fx.invalidate()
+    cache.analytics_cache.bump()
+    forecast.bump()
+    yield
+
+
+@pytest.fixture(scope="session")
+def client():
+    # The scheduler would write notifications behind the tests' backs
+    main.notification_scheduler.start = lambda: None
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def csv_upload(text: str, name: str = "statement.csv"):
+    return {"file": (name, text.encode(), "text/csv")}
@@ -0,0 +1,73 @@
+from datetime import date
+
+import pytest
+
+import analytics_store
+import merchants
+import models
+from conftest import csv_upload
+
+STATEMENT = "date,description,amount\n" + "".join(
+    f"2026-{month:02d}-03,Netflix,-10.99\n" for month in range(1, 7)
+) + "2026-02-14,Spotify,-9.99\n2026-03-20,Coffee,-3.50\n"
+
+
+def test_signatures_move_when_exported_columns_change(client, db):
+    assert client.post("/api/transactions/import", files=csv_upload(STATEMENT)).status_code == 200
+    before = analytics_store.month_signatures(db)
+    assert sorted(before) == [f"2026-{month:02d}" for month in range(1, 7)]
+
+    # A rekey rewrites merchant_key on every row but changes only the aliased merchant's
+    merchants.add_alias(db, "Spotify", "Music Service")
+    merchants.rekey(db)
+    db.commit()
+    after_rekey = analytics_store.month_signatures(db)
+    assert {month for month in before if before[month] != after_rekey[month]} == {"2026-02"}
+
+    # Linking a transaction to a subscription without a category
+    subscription = models.Subscription(name="Coffee Club", amount=3.5, billing_cycle="monthly", start_date=date(2026, 3, 20))
+    db.add(subscription)
+    db.flush()
+    coffee = db.query(models.Transaction).filter_by(merchant="Coffee").one()
+    coffee.subscription_id = subscription.id
+    db.commit()
+    after_link = analytics_store.month_signatures(db)
+    assert {month for month in before if after_rekey[month] != after_link[month]} == {"2026-03"}
+
+    # Categorizing that subscription changes the category its months export
+    subscription.category_id = db.query(models.Category.id).first()[0]
+    db.commit()
+    after_category = analytics_store.month_signatures(db)
+    assert {month for month in before if after_link[month] != after_category[month]} == {"2026-03"}
+
+
+def test_sync_exports_changed_months_and_query_reads_them(client, db, tmp_path):
+    pytest.importorskip("pyarrow")
+    assert client.post("/api/transactions/import", files=csv_upload(STATEMENT)).status_code == 200
+
+    assert analytics_store.sync(db, root=str(tmp_path)) == [f"2026-{month:02d}" for month in range(1, 7)]
+    assert analytics_store.sync(db, root=str(tmp_path)) == []
+
+    result = analytics_store.query(group_by=["merchant_key"], metrics=["total", "count"], root=str(tmp_path))
+    totals = {row["merchant_key"]: (round(row["total"], 2), row["count"]) for row in result["rows"]}
+    assert totals["netflix"] == (-65.94, 6)
+    assert result["rows_matched"] == 8
+
+    merchants.add_alias(db, "Spotify", "Music Service")
+    merchants.rekey(db)
+    db.commit()
+    assert analytics_store.sync(db, root=str(tmp_path)) == ["2026-02"]
+    result = analytics_store.query(
+        bucket="month", metrics=["count"], filters={"merchant_key": ["music service"]}, root=str(tmp_path)
+    )
+    assert [(row["bucket"], row["count"]) for row in result["rows"]] == [(date(2026, 2, 1), 1)]
+
+
+def test_query_endpoint(client):
+    pytest.importorskip("pyarrow")
+    assert client.post("/api/transactions/import", files=csv_upload(STATEMENT)).status_code == 200
+
+    response = client.post("/api/analytics/query", json={"group_by": ["merchant"], "metrics": ["count"], "order_by": "count"})
+    assert response.status_code == 200, response.text
+    assert response.json()["rows"][0]["count"] == 6
+    assert client.post("/api/analytics/query", json={"group_by": ["amount"]}).status_code == 400
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+import httpx
+
+import detection
+import fx
+import main
+from conftest import csv_upload
+
+STATEMENT = "date,description,amount\n" + "".join(
+    f"2026-{month:02d}-03,Netflix,-10.99\n" for month in range(1, 7)
+)
+READS = ["/api/analytics/dashboard", "/api/analytics/monthly", "/api/analytics/yearly",
+         "/api/analytics/by-payment-method", "/api/analytics/forecast", "/api/notifications"]
+
+
+def _run(coroutine, timeout: float = 30):
+    """Run coroutine on its own event loop in a thread; fails instead of hanging if the loop blocks"""
+    result = []
+    worker = threading.Thread(target=lambda: result.append(asyncio.run(coroutine)), daemon=True)
+    worker.start()
+    worker.join(timeout)
+    assert not worker.is_alive(), "event loop blocked"
+    return result[0]
+
+
+def test_reads_are_served_while_an_import_runs(client, monkeypatch):
+    detect = detection.detect_and_create_subscriptions
+    importing, release = threading.Event(), threading.Event()
+
+    def slow_detection(transactions, db):
+        importing.set()
+        release.wait(10)
+        return detect(transactions, db)
+    monkeypatch.setattr(detection, "detect_and_create_subscriptions", slow_detection)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            upload = asyncio.create_task(http.post("/api/transactions/import", files=csv_upload(STATEMENT)))
+            await asyncio.get_running_loop().run_in_executor(None, importing.wait, 10)
+            # The import is parked in the threadpool; the loop still answers reads,
+            # concurrently, including ones that each find the rates cache empty
+            fx.invalidate()
+            reads = await asyncio.gather(*(http.get(path) for path in READS * 3))
+            release.set()
+            return reads, await upload
+
+    reads, upload = _run(scenario())
+    assert [response.status_code for response in reads] == [200] * len(READS) * 3
+    assert upload.status_code == 200, upload.text
+    assert upload.json()["subscriptions_detected"] == 1
@@ -0,0 +1,58 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import benchmark
+
+
+def _results(**scenarios):
+    return {"scenarios": {
+        name: {"p95_ms": p95, "throughput": throughput, "throughput_unit": "requests/s", "peak_rss_mb": rss}
+        for name, (p95, throughput, rss) in scenarios.items()
+    }}
+
+
+def test_compare_flags_each_metric_past_the_threshold():
+    baseline = _results(list=(10.0, 100.0, 200.0), detect=(50.0, 20.0, 300.0), export=(5.0, None, 100.0))
+    current = _results(
+        list=(12.5, 79.0, 250.0),     # p95 +25%, throughput -21%, RSS +25% and +50 MB
+        detect=(59.0, 17.0, 350.0),   # all within 20%
+        export=(5.0, 40.0, 100.0),    # no baseline throughput to compare
+        forecast=(500.0, 1.0, 900.0), # new scenario
+    )
+
+    assert benchmark.compare(baseline, current, threshold_pct=20) == [
+        ("list", "p95_ms", 10.0, 12.5),
+        ("list", "throughput", 100.0, 79.0),
+        ("list", "peak_rss_mb", 200.0, 250.0),
+    ]
+    assert benchmark.compare(baseline, current, threshold_pct=30) == []
+
+
+def test_compare_ignores_small_absolute_differences():
+    baseline = _results(category=(0.5, 2000.0, 40.0))
+    current = _results(category=(1.2, 1900.0, 52.0))  # +140% p95 but under 1 ms, +30% RSS but under 16 MB
+
+    assert benchmark.compare(baseline, current, threshold_pct=20) == []
+
+
+def test_compare_command_exits_non_zero_on_regression(tmp_path):
+    baseline, current = tmp_path / "baseline.json", tmp_path / "current.json"
+    baseline.write_text(json.dumps(_results(list=(10.0, 100.0, 200.0))))
+
+    def run():
+        return subprocess.run(
+            [sys.executable, "benchmark.py", "compare", str(baseline), str(current)],
+            capture_output=True, text=True, cwd=Path(benchmark.__file__).parent,
+            env={**os.environ, "BENCH_REGRESSION_PCT": "20"}
+        )
+
+    current.write_text(json.dumps(_results(list=(10.5, 98.0, 200.0))))
+    assert run().returncode == 0
+
+    current.write_text(json.dumps(_results(list=(30.0, 98.0, 200.0))))
+    result = run()
+    assert result.returncode == 1
+    assert "Regression in list: p95_ms 10.0 -> 30.0" in result.stdout
@@ -0,0 +1,45 @@
+import cache
+from conftest import csv_upload
+
+STATEMENT = "date,description,amount\n2026-01-03,Netflix,-10.99\n2026-02-03,Netflix,-10.99\n"
+
+
+def test_analytics_responses_are_cached_until_a_write_commits(client):
+    first = client.get("/api/analytics/yearly")
+    assert first.headers["X-Cache"] == "MISS"
+    etag = first.headers["ETag"]
+
+    again = client.get("/api/analytics/yearly")
+    assert (again.headers["X-Cache"], again.json()) == ("HIT", first.json())
+    # Query strings are part of the key
+    assert client.get("/api/analytics/monthly?months=3").headers["X-Cache"] == "MISS"
+
+    unchanged = client.get("/api/analytics/yearly", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+
+    assert client.post("/api/transactions/import", files=csv_upload(STATEMENT)).status_code == 200
+    changed = client.get("/api/analytics/yearly", headers={"If-None-Match": etag})
+    assert (changed.status_code, changed.headers["X-Cache"]) == (200, "MISS")
+    assert changed.headers["ETag"] != etag
+
+
+def test_cache_evicts_least_recently_used_and_expires_entries():
+    responses = cache.ResponseCache(max_entries=2, ttl=60)
+    for key in ("a", "b"):
+        responses.set(key, b"{}", responses.generation)
+    responses.get("a")
+    responses.set("c", b"{}", responses.generation)
+    assert responses.get("b") is None
+    assert responses.get("a") is not None
+
+    # An entry computed before a write is stale as soon as it is stored
+    generation = responses.generation
+    responses.bump()
+    responses.set("d", b"{}", generation)
+    assert responses.get("d") is None
+
+    expired = cache.ResponseCache(ttl=-1)
+    expired.set("a", b"{}", expired.generation)
+    assert expired.get("a") is None
+    assert responses.stats()["evictions"] == 2
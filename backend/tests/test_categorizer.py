@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import categorizer
+import models
+
+
+def test_matcher_finds_keywords_anywhere_including_overlaps():
+    matcher = categorizer.KeywordMatcher([("he", 3, "he"), ("she", 2, "she"), ("hers", 1, "hers"), ("his", 4, "his")])
+    assert matcher.match("USHERS") == "hers"
+    # "she" ends inside "ushe" through a fail link and beats "he"
+    assert matcher.match("ushe") == "she"
+    assert matcher.match("this") == "his"
+    assert matcher.match("xyz") is None
+
+
+def test_rules_rank_by_priority_then_keyword_length_then_age():
+    def rule(rule_id, keyword, priority, category_id):
+        return SimpleNamespace(id=rule_id, keyword=keyword, priority=priority, category_id=category_id)
+
+    matcher = categorizer.compile_rules([
+        rule(1, "amazon", 0, "shopping"),
+        rule(2, "amazon prime", 0, "streaming"),
+        rule(3, "prime", 5, "priority"),
+        rule(4, "aws", 0, "cloud"),
+        rule(5, "aws", 0, "newer"),
+    ])
+    assert matcher.match("AMAZON PRIME VIDEO") == "priority"
+    assert matcher.match("Amazon Prime Now") == "priority"
+    assert matcher.match("amazon primevideo") == "priority"
+    assert matcher.match("Amazon Marketplace") == "shopping"
+    assert matcher.match("AWS EMEA") == "cloud"
+
+    matcher = categorizer.compile_rules([rule(1, "amazon", 0, "shopping"), rule(2, "amazon prime", 0, "streaming")])
+    assert matcher.match("AMAZON PRIME VIDEO") == "streaming"
+
+
+def test_category_rule_crud_recompiles_the_matcher(client, db):
+    gym = client.post("/api/categories", json={"name": "Fitness", "color": "#22c55e"}).json()["id"]
+    classify = lambda: client.post("/api/category-rules/classify", json={"merchants": ["PureGym Ltd"]}).json()
+
+    assert classify() == [{"merchant": "PureGym Ltd", "category_id": None}]
+    response = client.post("/api/category-rules", json={"keyword": "  PureGym ", "category_id": gym})
+    assert response.status_code == 200, response.text
+    rule = response.json()
+    assert (rule["keyword"], rule["category"]["name"]) == ("puregym", "Fitness")
+    assert classify()[0]["category_id"] == gym
+
+    assert client.post("/api/category-rules", json={"keyword": "puregym", "category_id": gym}).status_code == 400
+    assert client.post("/api/category-rules", json={"keyword": " ", "category_id": gym}).status_code == 400
+    assert client.post("/api/category-rules", json={"keyword": "gym", "category_id": 9999}).status_code == 400
+
+    other = db.query(models.Category).filter(models.Category.id != gym).first().id
+    response = client.put(f"/api/category-rules/{rule['id']}", json={"category_id": other, "priority": 3})
+    assert (response.json()["category_id"], response.json()["priority"]) == (other, 3)
+    assert classify()[0]["category_id"] == other
+    assert client.get("/api/category-rules").json()[0]["keyword"] == "puregym"
+
+    assert client.delete(f"/api/category-rules/{rule['id']}").status_code == 200
+    assert classify()[0]["category_id"] is None
+    assert client.delete(f"/api/category-rules/{rule['id']}").status_code == 404
+    assert client.put(f"/api/category-rules/{rule['id']}", json={"priority": 1}).status_code == 404
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import database
+from database import SQLALCHEMY_DATABASE_URL, engine
+
+
+def _pragmas(conn):
+    names = ("journal_mode", "synchronous", "busy_timeout", "cache_size", "query_only")
+    return {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in names}
+
+
+def test_connections_get_the_tuning_pragmas():
+    with engine.connect() as conn:
+        assert _pragmas(conn) == {
+            "journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000, "cache_size": -65536, "query_only": 0
+        }
+
+    # A fresh engine, as pooled aiosqlite connections belong to the event loop that opened them
+    async def read():
+        async_engine = database.create_async_db_engine(database.async_url(SQLALCHEMY_DATABASE_URL))
+        try:
+            async with async_engine.connect() as conn:
+                return await conn.run_sync(_pragmas)
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(read())["busy_timeout"] == 5000
+
+
+def test_read_only_pool_refuses_writes():
+    read_engine = database.create_db_engine(database.read_only_url(SQLALCHEMY_DATABASE_URL), read_only=True)
+    try:
+        with read_engine.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM transactions")).scalar() == 0
+            assert _pragmas(conn)["query_only"] == 1
+            with pytest.raises(OperationalError):
+                conn.execute(text("DELETE FROM transactions"))
+    finally:
+        read_engine.dispose()
+
+
+def test_urls():
+    assert database.read_only_url("sqlite:///./data.db") == "sqlite:///file:./data.db?mode=ro&uri=true"
+    assert database.async_url("sqlite:///./data.db") == "sqlite+aiosqlite:///./data.db"
+    assert database.async_url("postgresql://db/app") == "postgresql+asyncpg://db/app"
@@ -0,0 +1,120 @@
+import json
+
+import pandas as pd
+from sqlalchemy import event
+
+import detection
+import models
+import rollups
+from conftest import csv_upload
+from database import engine
+
+STATEMENT = "date,description,amount\n" + "".join(
+    f"2026-{month:02d}-03,Netflix,-10.99\n" for month in range(1, 7)
+) + "2026-02-14,Tesco,-23.10\n"
+
+
+def test_rollups_and_stats_commit_with_the_rows_when_detection_fails(client, db, monkeypatch):
+    def fail(transactions, db):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(detection, "detect_and_create_subscriptions", fail)
+
+    assert client.post("/api/transactions/import", files=csv_upload(STATEMENT)).status_code == 500
+
+    assert db.query(models.Transaction).count() == 7
+    assert db.query(models.MonthlySpendRollup).count() > 0
+    assert rollups.check(db) == []
+    assert {row.merchant_key: row.transaction_count for row in db.query(models.MerchantStats)} == {
+        "netflix": 6, "tesco": 1
+    }
+
+
+def test_rollups_follow_linked_history(client, db):
+    response = client.post("/api/transactions/import", files=csv_upload(STATEMENT))
+    assert response.json()["subscriptions_detected"] == 1
+
+    assert rollups.check(db) == []
+    linked = db.query(models.Transaction).filter(models.Transaction.subscription_id.isnot(None)).count()
+    assert linked == 6
+
+
+def test_old_outlier_leaves_the_recent_window(client, db):
+    history = "date,description,amount\n2026-01-03,Netflix,-10.99\n2026-02-03,Netflix,-25.00\n2026-03-03,Netflix,-10.99\n"
+    assert client.post("/api/transactions/import", files=csv_upload(history)).json()["subscriptions_detected"] == 0
+
+    recent = "date,description,amount\n" + "".join(f"2026-{month:02d}-03,Netflix,-10.99\n" for month in range(4, 9))
+    response = client.post("/api/transactions/import", files=csv_upload(recent, "recent.csv"))
+    assert response.json()["subscriptions_detected"] == 1
+
+    stats = db.get(models.MerchantStats, "netflix")
+    assert stats.transaction_count == 8
+    assert (stats.min_amount, stats.max_amount) == (10.99, 10.99)
+    assert db.query(models.Subscription).one().amount == 10.99
+
+
+def test_manual_subscription_updates_merchant_stats(client, db):
+    response = client.post("/api/subscriptions", json={
+        "name": "Netflix", "amount": 10.99, "billing_cycle": "monthly",
+        "start_date": "2026-01-03", "next_billing_date": "2026-02-03",
+    })
+    assert response.status_code == 200, response.text
+
+    stats = db.get(models.MerchantStats, "netflix")
+    assert stats.transaction_count == 1
+    assert stats.subscription_id == response.json()["id"]
+
+
+def test_rebuild_matches_incremental_stats(client, db):
+    statement = "date,description,amount\n" + "".join(
+        f"2026-{month:02d}-03,Netflix,-{10.99 if month > 2 else 25.00}\n" for month in range(1, 10)
+    )
+    client.post("/api/transactions/import", files=csv_upload(statement))
+    columns = ("transaction_count", "min_amount", "max_amount", "first_date", "last_date")
+    incremental = db.get(models.MerchantStats, "netflix")
+    before = [getattr(incremental, column) for column in columns]
+    window = sorted(json.loads(incremental.recent_amounts))
+
+    detection.rebuild_merchant_stats(db)
+    db.expire_all()
+    rebuilt = db.get(models.MerchantStats, "netflix")
+    assert [getattr(rebuilt, column) for column in columns] == before
+    assert sorted(json.loads(rebuilt.recent_amounts)) == window
+    assert len(window) == detection.RECENT_AMOUNTS
+
+
+def test_billing_cycle_follows_the_mean_gap():
+    gaps = pd.Series([7.0, 30.4, 91.0, 365.0])
+    assert list(detection.classify_billing_cycle(gaps)) == ["monthly", "monthly", "quarterly", "yearly"]
+
+
+def test_batch_creates_every_recurring_merchant_in_one_pass(client, db):
+    statement = "date,description,amount\n" + "".join(
+        f"2026-{month:02d}-0{day},{merchant},-{amount}\n"
+        for month in range(1, 7)
+        for day, merchant, amount in ((3, "Netflix", 10.99), (5, "Spotify", 9.99), (7, "Gym", 30.00))
+    ) + "".join(f"2025-{month:02d}-10,Insurance,-60.00\n" for month in (1, 4, 7, 10)) + (
+        "2026-01-12,Tesco,-23.10\n2026-02-12,Tesco,-71.40\n2026-03-01,Cinema,-12.00\n"
+    )
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.post("/api/transactions/import", files=csv_upload(statement))
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert response.json()["subscriptions_detected"] == 4
+
+    cycles = dict(db.query(models.Subscription.name, models.Subscription.billing_cycle).all())
+    assert cycles == {"Netflix": "monthly", "Spotify": "monthly", "Gym": "monthly", "Insurance": "quarterly"}
+    assert len([s for s in statements if s.startswith("INSERT INTO subscriptions")]) == 1
+    # Tesco's amounts vary too much and Cinema was charged once
+    assert db.query(models.Transaction).filter(models.Transaction.subscription_id.is_(None)).count() == 3
+
+    # Later charges of known subscriptions are linked without new subscriptions
+    more = "date,description,amount\n2026-07-03,Netflix,-10.99\n2026-07-05,Spotify,-9.99\n"
+    response = client.post("/api/transactions/import", files=csv_upload(more, "july.csv"))
+    assert response.json()["subscriptions_detected"] == 0
+    assert db.query(models.Transaction).filter(models.Transaction.subscription_id.is_(None)).count() == 3
@@ -0,0 +1,138 @@
+import asyncio
+
+from sqlalchemy import event, insert, update
+from starlette.requests import Request
+
+import events
+import main
+import models
+import notifications
+from conftest import csv_upload
+from database import AsyncReadSessionLocal, SessionLocal
+
+STATEMENT = "date,description,amount\n" + "".join(
+    f"2026-{month:02d}-03,Netflix,-10.99\n" for month in range(1, 7)
+)
+
+
+def test_imports_and_scheduler_run_with_commit_listener(client, monkeypatch):
+    published = []
+    monkeypatch.setattr(events.broker, "publish", lambda kind, data, event_id=None: published.append((kind, data)))
+
+    response = client.post("/api/transactions/import", files=csv_upload(STATEMENT))
+    assert response.status_code == 200, response.text
+    assert response.json()["count"] == 6
+    assert response.json()["subscriptions_detected"] == 1
+
+    response = client.post(
+        "/api/transactions/import?stream=true&chunk_rows=2",
+        files=csv_upload(STATEMENT.replace("-10.99", "-11.99"), "second.csv")
+    )
+    assert response.status_code == 200, response.text
+
+    notifications.NotificationScheduler().run_once()
+
+    changed = set().union(*(data["tables"] for kind, data in published if kind == "changed"))
+    assert {"transactions", "subscriptions", "monthly_spend_rollup"} <= changed
+
+
+def test_commit_listener_leaves_do_orm_execute_to_later_listeners(client, db, monkeypatch):
+    published = []
+    monkeypatch.setattr(events.broker, "publish", lambda kind, data, event_id=None: published.append((kind, data)))
+    seen = []
+
+    def listener(orm_execute_state):
+        seen.append(orm_execute_state.statement)
+
+    # Registered after watch_commits, as main.py does
+    event.listen(SessionLocal, "do_orm_execute", listener)
+    try:
+        db.execute(update(models.Notification).values(is_read=True))
+        db.commit()
+        db.execute(update(models.Subscription).values(is_active=True))
+        db.execute(insert(models.Category).values(name="Gym"))
+        db.commit()
+    finally:
+        event.remove(SessionLocal, "do_orm_execute", listener)
+
+    assert len(seen) == 3
+    # The first commit matched no rows, so only the second is published
+    assert published == [("changed", {"tables": ["categories"]})]
+
+
+def test_subscriber_merges_queued_changed_events():
+    async def drain():
+        subscriber = events.Subscriber(asyncio.get_running_loop(), max_events=10)
+        subscriber.offer("changed", {"tables": ["transactions"]})
+        subscriber.offer("notification", {"title": "Netflix"}, 7)
+        subscriber.offer("changed", {"tables": ["subscriptions", "transactions"]})
+        first = await subscriber.next(timeout=1)
+        subscriber.offer("changed", {"tables": ["notifications"]})
+        return first, await subscriber.next(timeout=1)
+
+    first, second = asyncio.run(drain())
+    assert [(item["event"], item["data"]) for item in first] == [
+        ("changed", {"tables": ["subscriptions", "transactions"]}),
+        ("notification", {"title": "Netflix"}),
+    ]
+    # Once sent, a "changed" event no longer absorbs later ones
+    assert [item["data"] for item in second] == [{"tables": ["notifications"]}]
+
+
+def test_subscriber_that_falls_behind_gets_one_resync():
+    dropped = events.events_dropped._values.get((), 0)
+
+    async def drain():
+        subscriber = events.Subscriber(asyncio.get_running_loop(), max_events=3)
+        for event_id in range(1, 6):
+            subscriber.offer("notification", {}, event_id)
+        return await subscriber.next(timeout=1)
+
+    pending = asyncio.run(drain())
+    assert [(item["event"], item["id"]) for item in pending] == [("resync", None), ("notification", 4), ("notification", 5)]
+    assert events.events_dropped._values.get((), 0) - dropped == 3
+
+
+def test_event_stream_refuses_subscribers_past_the_limit(client, monkeypatch):
+    monkeypatch.setattr(events.broker, "max_subscribers", 0)
+    response = client.get("/api/events")
+    assert response.status_code == 503
+
+
+def _replayed(headers=(), since_id=None):
+    """The events GET /api/events sends before waiting for live ones"""
+    async def read():
+        request = Request({"type": "http", "method": "GET", "path": "/api/events", "query_string": b"",
+                           "headers": [(name.encode(), value.encode()) for name, value in headers]})
+        async with AsyncReadSessionLocal() as db:
+            response = await main.stream_events(request, since_id, db)
+        body = response.body_iterator
+        try:
+            # The retry line, the replay, then nothing until a live event
+            chunks = [await body.__anext__()]
+            while True:
+                chunks.append(await asyncio.wait_for(body.__anext__(), 0.2))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            await body.aclose()
+        return chunks[1:]
+
+    return asyncio.run(read())
+
+
+def test_event_stream_replays_missed_notifications(client, db, monkeypatch):
+    notes = [models.Notification(title=f"Bill {n}", message="Due soon") for n in range(3)]
+    db.add_all(notes)
+    db.commit()
+
+    replayed = _replayed(headers=[("last-event-id", str(notes[0].id))])
+    assert [chunk.split("\n")[:2] for chunk in replayed] == [
+        [f"id: {note.id}", "event: notification"] for note in notes[1:]
+    ]
+    # since_id takes precedence over the header
+    assert len(_replayed(headers=[("last-event-id", "0")], since_id=notes[1].id)) == 1
+
+    # More missed than a queue holds: reload everything instead
+    monkeypatch.setattr(events, "EVENT_QUEUE_SIZE", 1)
+    assert _replayed(since_id=0) == ["event: resync\ndata: {}\n\n"]
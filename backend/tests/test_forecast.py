@@ -0,0 +1,36 @@
+from datetime import date
+
+from sqlalchemy import update
+
+import forecast
+import models
+
+
+def add_subscription(db, **fields):
+    subscription = models.Subscription(**{
+        "name": "Netflix", "amount": 10.99, "billing_cycle": "monthly",
+        "start_date": date(2026, 1, 3), "next_billing_date": date(2026, 11, 3), **fields,
+    })
+    db.add(subscription)
+    db.commit()
+    return subscription
+
+
+def test_bulk_update_of_subscriptions_bumps_generation(db):
+    subscription = add_subscription(db)
+    before = forecast.generation()
+
+    db.execute(update(models.Subscription).where(models.Subscription.id == subscription.id).values(amount=12.99))
+    db.commit()
+
+    assert forecast.generation() > before
+
+
+def test_roll_forward_bumps_generation(db):
+    add_subscription(db, next_billing_date=date(2026, 7, 3))
+    before = forecast.generation()
+
+    assert forecast.roll_forward(db, today=date(2026, 10, 18)) == 1
+    db.commit()
+
+    assert forecast.generation() > before
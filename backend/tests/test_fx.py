@@ -0,0 +1,79 @@
+import asyncio
+import threading
+from datetime import date
+
+import httpx
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import update
+
+import fx
+import main
+import models
+from conftest import csv_upload
+
+
+def test_totals_count_unconverted_transactions_and_use_todays_rate(client, db):
+    today = date.today()
+    earlier = (today - relativedelta(months=2)).replace(day=5)
+    fx.load_rates(db, pd.DataFrame([
+        {'date': earlier - relativedelta(months=1), 'currency': 'USD', 'rate': 0.5},
+        {'date': today.replace(day=1), 'currency': 'USD', 'rate': 0.8},
+    ]))
+    statement = (
+        "date,description,amount,currency\n"
+        f"{earlier},Netflix,-10.00,GBP\n"
+        f"{today.replace(day=1)},Tesco,-20.00,GBP\n"
+        f"{today.replace(day=1)},Baguette,-5.00,EUR\n"
+    )
+    assert client.post("/api/transactions/import", files=csv_upload(statement)).status_code == 200
+
+    dashboard = client.get("/api/analytics/dashboard").json()
+    assert dashboard["monthly_spend"] == 20.0
+    assert (dashboard["monthly_unconverted"], dashboard["yearly_unconverted"]) == (1, 1)
+
+    months = {row["month"]: row for row in client.get("/api/analytics/monthly?currency=USD").json()}
+    assert months[f"{earlier:%Y-%m}"]["total"] == 12.5
+    assert months[f"{today:%Y-%m}"]["unconverted"] == 1
+    years = client.get("/api/analytics/yearly").json()
+    assert sum(row["unconverted"] for row in years) == 1
+
+
+def test_concurrent_requests_reload_rates_without_blocking_the_event_loop(client, db):
+    # Async handlers load rates through run_sync on the event loop thread; one
+    # awaiting its query must not leave the others stuck on the cache lock
+    paths = [f"/api/analytics/{path}?currency={currency}"
+             for path in ("dashboard", "monthly", "yearly", "by-payment-method")
+             for currency in ("GBP", "USD", "EUR")]
+    fx.load_rates(db, pd.DataFrame([
+        {'date': date.today(), 'currency': 'USD', 'rate': 0.8},
+        {'date': date.today(), 'currency': 'EUR', 'rate': 0.85},
+    ]))
+    fx.invalidate()
+
+    async def fetch_all():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*(http.get(path) for path in paths))
+
+    responses = []
+    worker = threading.Thread(target=lambda: responses.extend(asyncio.run(fetch_all())), daemon=True)
+    worker.start()
+    worker.join(timeout=30)
+    assert not worker.is_alive(), "event loop blocked loading exchange rates"
+    assert [response.status_code for response in responses] == [200] * len(paths)
+
+
+def test_rate_load_revalues_lower_case_currencies(client, db):
+    response = client.post("/api/subscriptions", json={
+        "name": "Cloud Storage", "amount": 10, "currency": "usd", "start_date": str(date.today()),
+    })
+    assert response.json()["currency"] == "USD"
+    # A row stored before codes were upper-cased on the way in
+    db.execute(update(models.Transaction).values(currency="usd"))
+    db.commit()
+
+    fx.load_rates(db, pd.DataFrame([{'date': date.today(), 'currency': 'USD', 'rate': 0.8}]))
+    assert db.query(models.Transaction.base_amount).scalar() == -8.0
+    assert fx.missing_currencies(db) == []
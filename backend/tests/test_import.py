@@ -0,0 +1,198 @@
+import io
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import create_mock_engine, event
+from sqlalchemy.orm import Session
+
+import detection
+import importer
+import main
+import models
+from conftest import csv_upload
+from database import engine
+
+FIRST = "date,description,amount\n2026-01-03,Netflix,-10.99\n2026-01-05,Tesco,-23.10\n"
+SECOND = FIRST + "2026-01-07,Boots,-4.50\n2026-01-09,Pret,-6.20\n"
+
+
+def test_insert_returns_ids_of_new_rows_only(db):
+    main.write_transactions_frame(importer.parse_statement("first.csv", FIRST.encode())["frame"], db)
+
+    imported, duplicates = main.write_transactions_frame(
+        importer.parse_statement("second.csv", SECOND.encode())["frame"], db
+    )
+
+    assert duplicates == 2
+    stored = dict(db.query(models.Transaction.id, models.Transaction.fingerprint).all())
+    assert len(stored) == 4
+    assert all(stored[i] == fingerprint for i, fingerprint in zip(imported["id"], imported["fingerprint"]))
+    assert sorted(imported["amount"]) == [-6.20, -4.50]
+
+
+def test_batch_import_parses_in_worker_processes(client):
+    response = client.post("/api/transactions/import/batch", files=[
+        ("files", ("first.csv", FIRST.encode(), "text/csv")),
+        ("files", ("second.csv", SECOND.encode(), "text/csv")),
+    ])
+    assert response.status_code == 200, response.text
+    assert sum(f["count"] for f in response.json()["files"]) == 4
+
+
+def test_resumed_import_numbers_identical_rows_after_the_skipped_ones(client, db):
+    header = "date,description,amount\n"
+    coffee = "2026-09-01,COFFEE,-3.00\n"
+    first = client.post("/api/transactions/import?stream=true", files=csv_upload(header + coffee * 2))
+    assert first.json()["count"] == 2
+
+    response = client.post(
+        "/api/transactions/import?stream=true&resume_from=2&chunk_rows=1",
+        files=csv_upload(header + coffee * 4, "full.csv")
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["count"] == 2
+    assert db.query(models.Transaction).count() == 4
+
+
+def test_recovered_job_numbers_identical_rows_after_the_skipped_ones(client, db, tmp_path):
+    header = "date,description,amount\n"
+    coffee = "2026-09-01,COFFEE,-3.00\n"
+    client.post("/api/transactions/import?stream=true", files=csv_upload(header + coffee * 2))
+    upload = tmp_path / "full.csv"
+    upload.write_text(header + coffee * 4)
+    db.add(models.ImportJob(
+        id="job-1", filename="full.csv", file_path=str(upload), state="running", chunk_rows=1, rows_read=2
+    ))
+    db.commit()
+
+    main.run_import_job("job-1")
+
+    db.expire_all()
+    assert db.get(models.ImportJob, "job-1").state == "completed"
+    assert db.query(models.Transaction).count() == 4
+
+
+def test_job_progress_commits_with_each_chunk(db, tmp_path, monkeypatch):
+    upload = tmp_path / "statement.csv"
+    upload.write_text(FIRST + "2026-01-07,Boots,-4.50\n2026-01-09,Pret,-6.20\n")
+    db.add(models.ImportJob(id="job-1", filename="statement.csv", file_path=str(upload), state="queued", chunk_rows=2))
+    db.commit()
+
+    detect = detection.detect_and_create_subscriptions
+    calls = []
+
+    def fail_second_chunk(transactions, db):
+        calls.append(len(transactions))
+        if len(calls) == 2:
+            raise RuntimeError("database is locked")
+        return detect(transactions, db)
+    monkeypatch.setattr(detection, "detect_and_create_subscriptions", fail_second_chunk)
+
+    main.run_import_job("job-1")
+
+    db.expire_all()
+    job = db.get(models.ImportJob, "job-1")
+    assert job.state == "failed"
+    assert (job.rows_read, job.rows_committed) == (4, 4)
+    assert db.query(models.Transaction).count() == 4
+
+
+def test_failed_stream_import_closes_the_chunk_reader(client, monkeypatch):
+    chunks = importer.iter_csv_chunks
+    closed = []
+
+    def tracked(*args, **kwargs):
+        try:
+            yield from chunks(*args, **kwargs)
+        finally:
+            closed.append(True)
+    monkeypatch.setattr(importer, "iter_csv_chunks", tracked)
+    monkeypatch.setattr(detection, "detect_and_create_subscriptions", lambda transactions, db: 1 / 0)
+
+    response = client.post("/api/transactions/import?stream=true&chunk_rows=1", files=csv_upload(FIRST))
+    assert response.status_code == 500
+    assert closed == [True]
+
+
+def test_upserts_follow_the_database_dialect():
+    postgres = Session(bind=create_mock_engine("postgresql://", lambda *args, **kwargs: None))
+    stmt = importer.upsert(postgres, models.ImportedFile.__table__).on_conflict_do_nothing(
+        index_elements=['content_hash']
+    )
+    assert "ON CONFLICT (content_hash) DO NOTHING" in str(stmt.compile(dialect=postgres.get_bind().dialect))
+
+
+def test_prepare_transactions_normalizes_columns_at_once():
+    frame = importer.prepare_transactions(pd.DataFrame({
+        'date': ['2026-01-03', '05/01/2026', 'not a date'],
+        'description': ['NETFLIX.COM 123', 'Tesco Stores', 'Pret'],
+        'amount': ['-10.99', '-23.10', '-6.20'],
+        'merchant': [None, 'Tesco', None],
+        'currency': [' usd', None, 'GBP'],
+    }))
+
+    assert list(frame['date']) == [date(2026, 1, 3), date(2026, 5, 1)]
+    assert list(frame['merchant']) == ['NETFLIX.COM', 'Tesco']
+    assert list(frame['currency']) == ['USD', 'GBP']
+    assert list(frame['amount']) == [-10.99, -23.10]
+    assert frame['fingerprint'].is_unique
+
+
+def test_import_inserts_in_bulk_and_reports_throughput(client, db):
+    statement = "date,description,amount\n" + "".join(
+        f"2026-01-{day % 28 + 1:02d},Shop {day},-{day}.50\n" for day in range(500)
+    )
+    inserts = []
+
+    def count_inserts(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO transactions"):
+            inserts.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_inserts)
+    try:
+        response = client.post("/api/transactions/import", files=csv_upload(statement))
+    finally:
+        event.remove(engine, "before_cursor_execute", count_inserts)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["count"] == 500
+    assert response.json()["rows_per_second"] > 0
+    assert len(inserts) == 1
+    assert db.query(models.Transaction).count() == 500
+
+
+def test_stream_import_commits_chunk_by_chunk_and_resumes(client, db, monkeypatch):
+    statement = "date,description,amount\n" + "".join(f"2026-02-{day:02d},Shop {day},-{day}.00\n" for day in range(1, 8))
+    response = client.post("/api/transactions/import?stream=true&chunk_rows=3", files=csv_upload(statement))
+    assert response.status_code == 200, response.text
+    assert (response.json()["count"], response.json()["chunks"], response.json()["rows_read"]) == (7, 3, 7)
+
+    # A failing chunk keeps the ones before it and says where to resume
+    statement = statement.replace("2026-02", "2026-03")
+    write = main.write_transactions_frame
+    calls = []
+
+    def fail_third_chunk(frame, db, before_commit=None):
+        calls.append(len(frame))
+        if len(calls) == 3:
+            raise RuntimeError("database is locked")
+        return write(frame, db, before_commit)
+    monkeypatch.setattr(main, "write_transactions_frame", fail_third_chunk)
+    response = client.post("/api/transactions/import?stream=true&chunk_rows=3", files=csv_upload(statement, "march.csv"))
+    assert response.status_code == 500
+    assert "resume_from=6" in response.json()["detail"]
+    assert db.query(models.Transaction).count() == 13
+    monkeypatch.undo()
+
+    response = client.post(
+        "/api/transactions/import?stream=true&chunk_rows=3&resume_from=6", files=csv_upload(statement, "march.csv")
+    )
+    assert (response.json()["count"], response.json()["duplicates"]) == (1, 0)
+    assert db.query(models.Transaction).count() == 14
+
+
+def test_iter_csv_chunks_skips_rows_after_the_header():
+    upload = io.BytesIO(b"date,description,amount\n" + b"".join(b"2026-01-0%d,Shop,-1\n" % day for day in range(1, 6)))
+    chunks = list(importer.iter_csv_chunks(upload, chunk_rows=2, skip_rows=1))
+    assert [len(chunk) for chunk in chunks] == [2, 2]
+    assert chunks[0]['date'].iloc[0] == "2026-01-02"
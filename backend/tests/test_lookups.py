@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+from sqlalchemy import event
+
+import importer
+import lookups
+import main
+import models
+from database import SessionLocal, engine
+
+
+def _frame():
+    return importer.prepare_transactions(pd.DataFrame([
+        {'date': '2026-03-01', 'description': 'Netflix', 'amount': -10.99, 'payment_method': 'Amex'},
+    ]))
+
+
+def test_lookup_inserts_commit_with_the_import(db, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(importer, "insert_transactions", fail)
+    with pytest.raises(RuntimeError):
+        main.write_transactions_frame(_frame(), db)
+    db.rollback()
+    assert db.query(models.PaymentMethod).filter_by(name="Amex").count() == 0
+    monkeypatch.undo()
+
+    commits = []
+
+    def committed(session):
+        commits.append(session)
+
+    event.listen(SessionLocal, "after_commit", committed)
+    try:
+        main.write_transactions_frame(_frame(), db)
+    finally:
+        event.remove(SessionLocal, "after_commit", committed)
+    assert len(commits) == 1
+
+    # The cache picks the committed payment method up without inserting it again
+    amex = db.query(models.PaymentMethod).filter_by(name="Amex").one()
+    assert lookups.resolve_payment_methods(db, ["Amex"]) == {"Amex": amex.id}
+    assert "lookups_inserted" not in db.info
+
+
+def _statements(run):
+    """The SQL statements run() executes on the main engine"""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        run()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return executed
+
+
+def test_known_payment_methods_resolve_from_the_cache(client, db):
+    visa = client.post("/api/payment-methods", json={"name": "Visa"}).json()["id"]
+    assert lookups.resolve_payment_methods(db, ["Visa"]) == {"Visa": visa}
+    assert _statements(lambda: lookups.resolve_payment_methods(db, ["Visa", "Visa"])) == []
+
+    # Deleting through the API drops the cached id, so the next import creates it again
+    assert client.delete(f"/api/payment-methods/{visa}").status_code == 200
+    executed = _statements(lambda: lookups.resolve_payment_methods(db, ["Visa"]))
+    assert any(statement.startswith("INSERT INTO payment_methods") for statement in executed)
+    db.commit()
+    assert db.query(models.PaymentMethod).filter_by(name="Visa").count() == 1
+
+
+def test_unmatched_merchants_get_the_default_category_in_one_batch(db):
+    ids = lookups.resolve_categories(db, ["Zzyzx Holdings", "Qwerty Ltd"])
+    default = db.query(models.Category).filter_by(name=lookups.DEFAULT_CATEGORY[0]).one()
+    assert ids == {"Zzyzx Holdings": default.id, "Qwerty Ltd": default.id}
@@ -0,0 +1,88 @@
+import sys
+import threading
+
+from sqlalchemy import event
+
+import metrics
+from conftest import csv_upload
+from database import engine
+
+
+def test_concurrent_updates_are_not_lost():
+    stats = metrics.RequestStats("/api/transactions")
+    counter = metrics.Counter("test_events", "Events", ("kind",))
+    histogram = metrics.Histogram("test_seconds", "Seconds")
+
+    def work():
+        for _ in range(5000):
+            stats.add_query(0.001)
+            stats.add_span("import.insert", 0.001)
+            counter.inc("a")
+            histogram.observe(0.001)
+
+    # Switch threads as often as possible, so an unguarded += would lose updates
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert stats.queries == 40000
+    assert round(stats.spans["import.insert"], 6) == 40.0
+    assert 'test_events_total{kind="a"} 40000' in counter.render()
+    assert "test_seconds_count 40000" in histogram.render()
+
+
+def test_metrics_render_in_the_prometheus_text_format():
+    counter = metrics.Counter("test_errors", "Errors", ("operation",))
+    histogram = metrics.Histogram("test_latency_seconds", "Latency", ("route",), buckets=(0.1, 1))
+    counter.inc('SE"LECT\n')
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5, "/a")
+
+    assert counter.render() == [
+        "# HELP test_errors Errors",
+        "# TYPE test_errors counter",
+        'test_errors_total{operation="SE\\"LECT\\n"} 1',
+    ]
+    assert histogram.render()[2:] == [
+        'test_latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'test_latency_seconds_bucket{route="/a",le="1"} 2',
+        'test_latency_seconds_bucket{route="/a",le="+Inf"} 3',
+        'test_latency_seconds_sum{route="/a"} 5.55',
+        'test_latency_seconds_count{route="/a"} 3',
+    ]
+
+
+def test_requests_record_their_query_count_by_route_template(client):
+    client.post("/api/transactions/import", files=csv_upload("date,description,amount\n2026-03-01,Gym,-30.00\n"))
+    transaction = client.get("/api/transactions").json()[0]
+    route = ("/api/transactions/{transaction_id}",)
+    before = list(metrics.request_queries._values.get(route, [0] * 12))
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "after_cursor_execute", count)
+    try:
+        assert client.get(f"/api/transactions/{transaction['id']}").status_code == 200
+        assert client.get("/api/transactions/999999").status_code == 404
+    finally:
+        event.remove(engine, "after_cursor_execute", count)
+
+    after = metrics.request_queries._values[route]
+    assert after[-1] - before[-1] == 2
+    assert after[-2] - before[-2] == len(statements) > 0
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    assert "# TYPE http_request_db_queries histogram" in response.text
+    assert 'http_request_db_queries_bucket{route="/api/transactions/{transaction_id}",le="+Inf"}' in response.text
+    assert f"/api/transactions/{transaction['id']}\"" not in response.text
@@ -0,0 +1,26 @@
+from datetime import date, timedelta
+
+import forecast
+import models
+import notifications
+
+
+def test_run_once_generates_notifications_when_roll_forward_fails(db, monkeypatch):
+    db.add(models.Subscription(
+        name="Netflix", amount=10.99, billing_cycle="monthly",
+        start_date=date.today() - timedelta(days=60), next_billing_date=date.today() + timedelta(days=3),
+    ))
+    db.commit()
+
+    def fail(db, today=None):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(forecast, "roll_forward", fail)
+
+    assert notifications.NotificationScheduler().run_once() == 1
+    assert db.query(models.Notification).count() == 1
+
+
+def test_notification_limit_out_of_range_is_rejected(client):
+    for limit in (0, -1, 1001):
+        assert client.get(f"/api/notifications?limit={limit}").status_code == 422
+    assert client.get("/api/notifications?limit=1").status_code == 200
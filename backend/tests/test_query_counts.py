@@ -0,0 +1,85 @@
+"""
+Query-count checks for the list endpoints: each is called before and after the
+database grows; if the number of SQL statements grows with the rows returned,
+something is lazy loading per row (an N+1).
+"""
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+import models
+from database import engine, async_read_engine
+
+# Endpoint paths, each requested with a page size larger than the data
+LIST_ENDPOINTS = [
+    "/api/subscriptions?limit=100",
+    "/api/transactions?limit=100",
+    "/api/notifications?limit=100",
+    # recent_transactions, up to 10
+    "/api/analytics/dashboard",
+]
+SMALL_SEED = 3
+LARGE_SEED = 30
+
+
+class QueryCounter:
+    """Counts statements executed on an engine while active"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """Context manager yielding a QueryCounter for every statement run on the app's engines"""
+    counter = QueryCounter()
+    engines = (engine, async_read_engine.sync_engine)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", counter)
+
+
+def seed(db, start: int, stop: int):
+    # Distinct related rows per record, so lazy loads can't be served from the identity map
+    for i in range(start, stop):
+        category = models.Category(name=f"Test category {i}")
+        payment_method = models.PaymentMethod(name=f"Card *{i:04d}")
+        db.add_all([category, payment_method])
+        db.flush()
+        subscription = models.Subscription(
+            name=f"Service {i}", amount=10.0 + i, start_date=date.today(),
+            category_id=category.id, payment_method_id=payment_method.id
+        )
+        db.add(subscription)
+        db.flush()
+        db.add_all([
+            models.Transaction(
+                date=date.today() - timedelta(days=i), description=f"Service {i}", amount=-(10.0 + i),
+                merchant=f"Service {i}", payment_method_id=payment_method.id, subscription_id=subscription.id
+            ),
+            models.Notification(title="Upcoming payment", message=f"Service {i}", subscription_id=subscription.id),
+        ])
+    db.commit()
+
+
+@pytest.mark.parametrize("path", LIST_ENDPOINTS)
+def test_query_count_does_not_grow_with_rows(client, db, path):
+    counts = []
+    for start, stop in ((0, SMALL_SEED), (SMALL_SEED, LARGE_SEED)):
+        seed(db, start, stop)
+        with count_queries() as counter:
+            response = client.get(path)
+            assert response.status_code == 200, response.text
+        counts.append(counter.count)
+    assert counts[1] <= counts[0], f"N+1 in {path}: query count grew from {counts[0]} to {counts[1]}"
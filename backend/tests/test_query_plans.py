@@ -0,0 +1,61 @@
+"""
+Query-plan checks: every statement the hot paths issue must reach the large tables
+through an index. migrations.check_query_plans() covers import, detection, rollups,
+forecasting and notification generation; the endpoints are driven through the app.
+"""
+from contextlib import ExitStack
+
+import migrations
+import models
+from conftest import csv_upload
+from database import engine, async_read_engine
+
+STATEMENT = "date,description,amount,payment_method\n" + "".join(
+    f"2026-{month:02d}-03,Netflix,-10.99,Visa *1234\n" for month in range(1, 10)
+) + "2026-09-14,Tesco,-23.10,Visa *1234\n"
+
+# Filtered or paged reads; unfiltered lists like /api/subscriptions read every row anyway
+HOT_ENDPOINTS = [
+    "/api/transactions?limit=2",
+    "/api/transactions?merchant=Netflix",
+    "/api/transactions?payment_method_id={payment_method_id}",
+    "/api/transactions?subscription_id={subscription_id}",
+    "/api/notifications?limit=1",
+    "/api/notifications?unread_only=true",
+    "/api/notifications?since_id=0",
+    "/api/analytics/dashboard",
+    "/api/analytics/monthly",
+    "/api/analytics/forecast",
+]
+
+
+def test_hot_paths_use_indexes():
+    assert migrations.check_query_plans() == []
+
+
+def test_endpoint_queries_use_indexes(client, db):
+    assert client.post("/api/transactions/import", files=csv_upload(STATEMENT)).status_code == 200
+    ids = {
+        "payment_method_id": db.query(models.PaymentMethod.id).scalar(),
+        "subscription_id": db.query(models.Subscription.id).scalar(),
+    }
+
+    with ExitStack() as stack:
+        captured = [stack.enter_context(migrations.capture_statements(target))
+                    for target in (engine, async_read_engine.sync_engine)]
+        for path in HOT_ENDPOINTS:
+            path = path.format(**ids)
+            response = client.get(path)
+            assert response.status_code == 200, response.text
+            if "X-Next-Cursor" in response.headers:
+                assert client.get(path, params={"cursor": response.headers["X-Next-Cursor"]}).status_code == 200
+
+    assert all(captured)
+    failures = []
+    with engine.connect() as conn:
+        for sql, parameters in (statement for statements in captured for statement in statements):
+            if sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                plan, scans = migrations.full_scans(conn, sql, parameters)
+                if scans:
+                    failures.append((" ".join(sql.split()), plan))
+    assert failures == []
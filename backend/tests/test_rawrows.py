@@ -0,0 +1,36 @@
+import json
+
+import models
+import rawrows
+from conftest import csv_upload
+
+
+def test_rows_decode_on_their_own_after_encoding():
+    columns = ["date", "description", "amount", "note"]
+    rows = [[f"2026-01-{i % 28 + 1:02d}", f"CAFÉ NERO #{i}, London", -3.5 - i, None] for i in range(rawrows.DICTIONARY_ROWS + 50)]
+
+    dictionary, values = rawrows.encode_rows(rows)
+
+    assert len(dictionary) <= rawrows.DICTIONARY_BYTES
+    assert len(values) == len(rows)
+    for i in (0, 1, rawrows.DICTIONARY_ROWS + 49):
+        assert rawrows.decode_row(columns, dictionary, values[i]) == dict(zip(columns, rows[i]))
+    assert sum(map(len, values)) < len(json.dumps(rows)) / 2
+    assert rawrows.encode_rows([]) == (b"", [])
+
+
+def test_transaction_detail_returns_the_original_csv_row(client, db):
+    text = "date,description,amount,reference\n2026-02-01,SPOTIFY,-9.99,REF 1\n2026-02-02,TESCO,-12.40,REF 2\n"
+    assert client.post("/api/transactions/import", files=csv_upload(text)).status_code == 200
+    transaction = db.query(models.Transaction).filter_by(description="TESCO").one()
+    assert transaction.raw_data is None and transaction.raw_values is not None
+
+    detail = client.get(f"/api/transactions/{transaction.id}").json()
+    assert detail["raw_row"] == {"date": "2026-02-02", "description": "TESCO", "amount": -12.4, "reference": "REF 2"}
+
+    # Rows imported before raw batches keep their JSON
+    transaction.raw_values, transaction.raw_batch_id = None, None
+    transaction.raw_data = json.dumps({"Description": "TESCO"})
+    db.commit()
+    assert client.get(f"/api/transactions/{transaction.id}").json()["raw_row"] == {"Description": "TESCO"}
+    assert "raw_row" not in client.get("/api/transactions").json()[0]
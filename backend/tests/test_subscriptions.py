@@ -0,0 +1,19 @@
+import models
+from conftest import csv_upload
+
+
+def test_rename_moves_merchant_stats_link(client, db):
+    statement = "date,description,amount\n" + "".join(
+        f"2026-{month:02d}-03,Netflix,-10.99\n" for month in range(1, 7)
+    ) + "2026-02-14,Spotify,-9.99\n"
+    assert client.post("/api/transactions/import", files=csv_upload(statement)).json()["subscriptions_detected"] == 1
+    subscription = db.query(models.Subscription).one()
+
+    response = client.put(f"/api/subscriptions/{subscription.id}", json={"name": "Spotify"})
+    assert response.status_code == 200, response.text
+
+    links = dict(db.query(models.MerchantStats.merchant_key, models.MerchantStats.subscription_id).all())
+    db.expire_all()
+    new_key = db.get(models.Subscription, subscription.id).merchant_key
+    assert links[new_key] == subscription.id
+    assert [key for key, linked in links.items() if linked == subscription.id] == [new_key]
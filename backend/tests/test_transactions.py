@@ -0,0 +1,19 @@
+import pytest
+
+from conftest import csv_upload
+
+
+@pytest.mark.parametrize("limit", [0, -1, 1001])
+def test_transaction_limit_out_of_range_is_rejected(client, limit):
+    assert client.get(f"/api/transactions?limit={limit}").status_code == 422
+
+
+def test_transaction_pages_follow_cursor(client):
+    statement = "date,description,amount\n" + "".join(f"2026-01-{day:02d},Shop {day},-{day}.00\n" for day in range(1, 6))
+    assert client.post("/api/transactions/import", files=csv_upload(statement)).status_code == 200
+
+    first = client.get("/api/transactions?limit=3")
+    assert first.status_code == 200
+    assert len(first.json()) == 3
+    rest = client.get(f"/api/transactions?limit=3&cursor={first.headers['X-Next-Cursor']}")
+    assert [t["date"] for t in rest.json()] == ["2026-01-02", "2026-01-01"]
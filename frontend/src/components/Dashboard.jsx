@@ -3,7 +3,7 @@ import { Card, CardHeader, CardTitle, CardContent } from './Card';
 import { Button } from './Button';
 import { PieChart, Pie, Cell, ResponsiveContainer, Tooltip } from 'recharts';
 import { TrendingUp, TrendingDown, Plus, Bell, DollarSign, ChevronRight, Settings, Moon, Sun } from 'lucide-react';
-import { getDashboardStats, getMonthlySpend, getSubscriptions, getCategories, getPaymentMethods, getSpendingByPaymentMethod } from '../services/api';
+import { getDashboardStats, getMonthlySpend, getSubscriptions, getCategories, getPaymentMethods, getSpendingByPaymentMethod, subscribeToEvents } from '../services/api';
 import { format } from 'date-fns';
 import { useTheme } from '../hooks/useTheme';
 import CSVImport from './CSVImport';
@@ -36,10 +36,11 @@ export default function Dashboard() {
   const [categories, setCategories] = useState([]);
   const [paymentMethods, setPaymentMethods] = useState([]);
   const [paymentMethodSpending, setPaymentMethodSpending] = useState([]);
+  const [notificationsVersion, setNotificationsVersion] = useState(0);
 
-  const loadData = async () => {
+  const loadData = async (showSpinner = true) => {
     try {
-      setLoading(true);
+      if (showSpinner) setLoading(true);
       const [dashboardRes, monthlyRes, subsRes, catsRes, paymentRes, paymentSpendingRes] = await Promise.all([
         getDashboardStats(),
         getMonthlySpend(12),
@@ -65,6 +66,18 @@ export default function Dashboard() {
     loadData();
   }, []);
 
+  // Reload when the server reports a change instead of polling
+  useEffect(() => subscribeToEvents({
+    changed: ({ tables }) => {
+      loadData(false);
+      if (tables.includes('notifications')) setNotificationsVersion((version) => version + 1);
+    },
+    resync: () => {
+      loadData(false);
+      setNotificationsVersion((version) => version + 1);
+    },
+  }), []);
+
   const handleAdded = () => {
     setShowAddModal(false);
     loadData();
@@ -202,6 +215,11 @@ export default function Dashboard() {
                   {monthlyChange >= 0 ? '+' : ''}{monthlyChange.toFixed(0)}% vs last month
                 </span>
               </div>
+              {stats?.monthly_unconverted > 0 && (
+                <p className="text-xs text-orange-600 font-medium mt-1">
+                  Excludes {stats.monthly_unconverted} transaction{stats.monthly_unconverted === 1 ? '' : 's'} without exchange rates
+                </p>
+              )}
             </CardContent>
           </Card>
 
@@ -509,6 +527,7 @@ export default function Dashboard() {
 
       <NotificationPanel
         isOpen={showNotifications}
+        refreshKey={notificationsVersion}
         onClose={() => { setShowNotifications(false); loadData(); }}
       />
 
@@ -5,7 +5,7 @@ import { Bell, Check, AlertCircle, CheckCircle, Info, X } from 'lucide-react';
 import { getNotifications, markNotificationRead, markAllNotificationsRead } from '../services/api';
 import { format } from 'date-fns';
 
-export default function NotificationPanel({ isOpen, onClose }) {
+export default function NotificationPanel({ isOpen, onClose, refreshKey }) {
   const [notifications, setNotifications] = useState([]);
   const [loading, setLoading] = useState(false);
 
@@ -25,7 +25,7 @@ export default function NotificationPanel({ isOpen, onClose }) {
     if (isOpen) {
       loadNotifications();
     }
-  }, [isOpen]);
+  }, [isOpen, refreshKey]);
 
   const handleMarkRead = async (id) => {
     try {
@@ -30,7 +30,7 @@ export const updateSubscription = (id, data) => api.put(`/subscriptions/${id}`,
 export const deleteSubscription = (id) => api.delete(`/subscriptions/${id}`);
 
 // Transactions
-export const getTransactions = () => api.get('/transactions');
+export const getTransactions = (params = {}) => api.get('/transactions', { params });
 export const importCSV = (file) => {
   const formData = new FormData();
   formData.append('file', file);
@@ -55,4 +55,14 @@ export const getMonthlySpend = (months = 12) => api.get(`/analytics/monthly?mont
 export const getYearlySpend = () => api.get('/analytics/yearly');
 export const getSpendingByPaymentMethod = () => api.get('/analytics/by-payment-method');
 
+// Server-sent events: handlers maps an event name ('notification', 'changed', 'resync') to a
+// function of its parsed data. Returns a function that closes the stream.
+export const subscribeToEvents = (handlers) => {
+  const source = new EventSource(`${API_BASE_URL}/events`);
+  Object.entries(handlers).forEach(([name, handler]) => {
+    source.addEventListener(name, (event) => handler(JSON.parse(event.data)));
+  });
+  return () => source.close();
+};
+
 export default api;